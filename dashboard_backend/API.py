@@ -1,19 +1,38 @@
+import atexit
 import datetime
-import subprocess
-import re
+import hashlib
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 import psycopg2
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from flask.cli import load_dotenv
 from flasgger import Swagger
 
+from Analytics_Export import EXPORT_FORMATS, iter_record_batches, stream_export
+from Ingest_Events import IngestListener, LatestScanRefresher
+from Ingest_Report import ingest_report_file
+from Json_Provider import install_json_provider
+from Response_Encoding import compress_response, rows_response
+from Risk_Engine import RiskEngine, load_owasp_ids, refresh_scan_scores, weight_matrix
+from Scan_Executor import SUCCEEDED, ScanExecutor, docker_scan_command, run_docker_scan
+from Scan_Scheduler import ScanScheduler, next_run_time
+from Scan_Worker import QueueRunner
+from Trend_Downsampling import TREND_BUCKETS, lttb_indices
+from Weight_Profiles import WeightProfileCache, save_weight_profiles
+from Zap_Pool import DEFAULT_DAEMON_COMMAND, ZapDaemonPool
+
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for the API
+install_json_provider(app)
+app.after_request(compress_response)
 
 swagger_config = {
     "swagger": "2.0",
@@ -81,6 +100,186 @@ def connect_to_db(db_params):
         print(f"Error: {e}")
         return None, None
 
+risk_engine = RiskEngine()
+
+# Weight profiles per user_id and version, kept in sync between the workers with LISTEN/NOTIFY
+weight_profiles = WeightProfileCache(db_params_2)
+
+def profile_weight_rows(profiles):
+    return [(user_id, owasp_cat, weight) for user_id, (_, weights) in profiles.items() for owasp_cat, weight in weights]
+
+# Rescoring the scan history after a weight change runs in the background, one user at a time
+rescore_executor = ThreadPoolExecutor(max_workers=1)
+pending_rescores = set()
+pending_rescores_lock = threading.Lock()
+
+def rescore_user_history(user_id):
+    with pending_rescores_lock:
+        pending_rescores.discard(user_id)
+
+    connection_1, cursor_1 = connect_to_db(db_params_1)
+    connection_2, cursor_2 = connect_to_db(db_params_2)
+    try:
+        if cursor_1 is None or cursor_2 is None:
+            return
+        stored = refresh_scan_scores(connection_1, connection_2, user_ids=[user_id], engine=risk_engine)
+        print(f"Rescored {stored} scans for user {user_id}")
+    except Exception as e:
+        print(f"Failed to rescore the scans of user {user_id}: {e}")
+    finally:
+        for connection in (connection_1, connection_2):
+            if connection:
+                connection.close()
+
+def schedule_rescore(user_id):
+    # A rescore that is still waiting will already pick up the latest weights
+    with pending_rescores_lock:
+        if user_id in pending_rescores:
+            return
+        pending_rescores.add(user_id)
+    rescore_executor.submit(rescore_user_history, user_id)
+
+# Warm ZAP daemons driven through the ZAP API, disabled (one-shot containers only) with ZAP_POOL_SIZE=0
+zap_pool = None
+if int(os.getenv('ZAP_POOL_SIZE', '0')) > 0:
+    zap_pool = ZapDaemonPool(
+        size=int(os.getenv('ZAP_POOL_SIZE')),
+        output_directory=output_directory,
+        recycle_after=int(os.getenv('ZAP_POOL_RECYCLE_AFTER', '20')),
+        base_port=int(os.getenv('ZAP_POOL_BASE_PORT', '8090')),
+        command=os.getenv('ZAP_DAEMON_COMMAND', DEFAULT_DAEMON_COMMAND),
+    )
+
+def start_zap_pool():
+    """Starts the daemons once per process, on the first request or when the server starts."""
+    if zap_pool is not None and zap_pool.start():
+        atexit.register(zap_pool.shutdown)
+
+# Under gunicorn/uwsgi every worker starts its pool with its first request, the debug
+# reloader's parent process never serves one and so never starts daemons
+app.before_request(start_zap_pool)
+
+def ingest_scan_report(job):
+    """Completion hook: inserts the report of a finished scan right away instead of waiting for Insert_Real_Data.py."""
+    try:
+        scan_ids = ingest_report_file(os.path.join(output_directory, job.report_file))
+    except Exception as e:
+        print(f"Failed to ingest {job.report_file}, left to the directory watcher: {e}")
+        return {"ingest_error": str(e)}
+    if scan_ids is None:
+        return {"ingest_error": "No database connection"}
+    job.publish('ingested', scan_ids=scan_ids)
+    return {"scan_id": scan_ids[0] if scan_ids else None, "scan_ids": scan_ids}
+
+if os.getenv('SCAN_QUEUE', 'false').lower() == 'true':
+    # Scans run on the Scan_Worker.py processes, which also ingest the reports. The executor
+    # threads only wait for the queue, so SCAN_WORKERS can be higher than the number of workers.
+    scan_executor = ScanExecutor(max_workers=int(os.getenv('SCAN_WORKERS', '8')),
+                                 runner=QueueRunner(app.config['UPLOAD_FOLDER']))
+else:
+    scan_executor = ScanExecutor(max_workers=int(os.getenv('SCAN_WORKERS', '2')),
+                                 runner=zap_pool.run if zap_pool is not None else run_docker_scan,
+                                 on_success=ingest_scan_report if os.getenv('INGEST_ON_COMPLETION', 'true').lower() == 'true' else None)
+
+# Wall-clock limit per scan, the container is killed when it is reached
+scan_timeouts = {
+    'passive': int(os.getenv('SCAN_TIMEOUT_PASSIVE_SECONDS', '1800')),
+    'active': int(os.getenv('SCAN_TIMEOUT_ACTIVE_SECONDS', '600')),
+}
+
+# A URL scanned within this window is not scanned again unless the request forces it
+scan_freshness = datetime.timedelta(minutes=int(os.getenv('SCAN_FRESHNESS_MINUTES', '60')))
+
+def find_recent_passive_scan(target):
+    job = scan_executor.recent_success('passive', target, scan_freshness)
+    if job is not None:
+        return {**job.result, "job_id": job.job_id, "recent": True}
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return None
+    try:
+        cursor.execute("""
+            SELECT scan_id, scan_date FROM scans
+            WHERE scan_url = %s AND scan_active = FALSE AND scan_date >= %s
+            ORDER BY scan_date DESC
+            LIMIT 1;
+        """, (target, datetime.datetime.now() - scan_freshness))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return {"message": "URL recently scanned", "scan_id": row[0], "scan_date": row[1], "recent": True}
+    except Exception as e:
+        print(f"Error while looking up recent scans: {e}")
+        return None
+    finally:
+        cursor.close()
+        connection.close()
+
+def is_scan_url(url):
+    """http(s) URL with a host name or IP address, no whitespace or control characters."""
+    if any(character.isspace() or ord(character) < 32 for character in url):
+        return False
+    try:
+        parts = urlsplit(url)
+        parts.port
+    except ValueError:
+        return False
+    return (parts.scheme in ('http', 'https') and bool(parts.hostname)
+            and all(character.isalnum() or character in '.-_:' for character in parts.hostname))
+
+def target_hash(target):
+    # Keeps the report files of scans started in the same second apart
+    return hashlib.sha256(target.encode('utf-8')).hexdigest()[:8]
+
+def submit_passive_scan(url):
+    target = url.rstrip('/')
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_report_file = f'api-passive-scan-report_{timestamp}_{target_hash(target)}.json'
+    print({output_directory})
+
+    docker_command = docker_scan_command('passive', output_directory, url, json_report_file)
+    return scan_executor.submit('passive', target, docker_command, json_report_file,
+                                timeout=scan_timeouts['passive'], scan_input=url)
+
+def scheduled_passive_scan(url):
+    # A URL that was scanned within the freshness window is skipped until its next run
+    if find_recent_passive_scan(url.rstrip('/')) is not None:
+        return None
+    job, _ = submit_passive_scan(url)
+    return job
+
+scan_scheduler = ScanScheduler(db_params_1, scheduled_passive_scan,
+                               max_concurrent=int(os.getenv('SCHEDULE_MAX_CONCURRENT', '4')),
+                               max_per_host=int(os.getenv('SCHEDULE_MAX_PER_HOST', '1')),
+                               tick_seconds=int(os.getenv('SCHEDULE_TICK_SECONDS', '30')))
+
+def start_scan_scheduler():
+    """Like start_zap_pool: once per process, the process holding the scheduler lock starts the due scans."""
+    if os.getenv('SCAN_SCHEDULER', 'true').lower() == 'true':
+        scan_scheduler.start()
+
+app.before_request(start_scan_scheduler)
+
+# Started by the first client of GET /ingest-events
+ingest_listener = IngestListener(db_params_1)
+
+# Refreshes latest_scan_summary for /leaderboard in the background, debounced per burst of ingested reports
+latest_scan_refresher = LatestScanRefresher(db_params_1,
+                                            debounce=float(os.getenv('LEADERBOARD_REFRESH_DEBOUNCE_SECONDS', '5')),
+                                            check_seconds=float(os.getenv('LEADERBOARD_REFRESH_CHECK_SECONDS', '300')))
+
+app.before_request(latest_scan_refresher.start)
+
+def scan_job_response(job, coalesced, wait):
+    if not wait:
+        return jsonify({"message": "Scan started", "job_id": job.job_id, "status": job.status,
+                        "coalesced": coalesced}), 202
+
+    job.wait()
+    status_code = 200 if job.status == SUCCEEDED else 500
+    return jsonify({**job.result, "job_id": job.job_id, "coalesced": coalesced}), status_code
+
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'json', 'yaml', 'yml'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -91,6 +290,11 @@ def get_vulnerabilities():
        Retrieves a list of vulnerabilities.
        ---
        parameters:
+         - name: format
+           in: query
+           type: string
+           required: false
+           description: "columnar returns one list per field with repeated strings dictionary encoded (also with Accept: application/vnd.dashboard.columnar+json)."
          - name: scan_url
            in: query
            type: string
@@ -161,9 +365,9 @@ def get_vulnerabilities():
             SELECT DISTINCT scan_id, scan_date, scan_url, tool_name, vuln_name, vuln_number, prio_name, 
                             owasp_name, v.vuln_id, scan_active, vuln_description, vuln_new 
             FROM scans 
-            JOIN vulnerabilities v ON scan_id = vuln_scan 
+            JOIN vulnerabilities v ON scan_id = vuln_scan AND scan_date = v.vuln_scan_date 
             JOIN tools ON tool_id = scan_tool 
-            JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id 
+            JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date 
             JOIN owasp_categories o ON o.owasp_id = vo.owasp_id 
             JOIN priorities ON vuln_priority = prio_id
         """
@@ -178,27 +382,233 @@ def get_vulnerabilities():
             query += " ORDER BY scan_date DESC;"
             cursor.execute(query)
 
+        columns = [column.name for column in cursor.description]
+        return rows_response(cursor.fetchall(), columns)
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/vulnerabilities/search', methods=['GET'])
+def search_vulnerabilities():
+    """
+       Full-text search over the names and descriptions of the vulnerabilities with facet filters.
+       Returns one page of findings (best matches first) and, from the same query, the number of
+       findings per tool, priority, OWASP category, new/recurring and month for all matches.
+       Filters can be repeated, e.g. ?q=sql injection&priority=High&owasp=API8 - Security Misconfiguration.
+       ---
+       parameters:
+         - name: q
+           in: query
+           type: string
+           required: false
+           description: Search words, supports "quoted phrases", or and -excluded words.
+         - name: scan_url
+           in: query
+           type: string
+           required: false
+         - name: tool
+           in: query
+           type: string
+           required: false
+         - name: priority
+           in: query
+           type: string
+           required: false
+           description: The prio_name, e.g. High.
+         - name: owasp
+           in: query
+           type: string
+           required: false
+           description: The owasp_name, e.g. "API8 - Security Misconfiguration".
+         - name: new
+           in: query
+           type: boolean
+           required: false
+           description: true for new findings only, false for recurring ones.
+         - name: start_date
+           in: query
+           type: string
+           required: false
+           description: Inclusive start date (YYYY-MM-DD).
+         - name: end_date
+           in: query
+           type: string
+           required: false
+           description: Inclusive end date (YYYY-MM-DD).
+         - name: limit
+           in: query
+           type: integer
+           required: false
+           description: Findings per page (default 50, at most 500).
+         - name: offset
+           in: query
+           type: integer
+           required: false
+       responses:
+         200:
+           description: The matching findings and the facet counts.
+           schema:
+             type: object
+             properties:
+               total:
+                 type: integer
+                 example: 42
+               results:
+                 type: array
+                 items:
+                   type: object
+                   properties:
+                     vuln_id:
+                       type: integer
+                       example: 1
+                     scan_id:
+                       type: integer
+                       example: 1
+                     scan_date:
+                       type: string
+                       example: "Thu, 22 Aug 2024 08:39:42"
+                     scan_url:
+                       type: string
+                       example: "http://example.com"
+                     tool_name:
+                       type: string
+                       example: "ZAP"
+                     vuln_name:
+                       type: string
+                       example: "SQL Injection"
+                     prio_name:
+                       type: string
+                       example: "High"
+                     owasp_names:
+                       type: array
+                       items:
+                         type: string
+                       example: ["API8 - Security Misconfiguration"]
+                     rank:
+                       type: number
+                       example: 0.0991
+               facets:
+                 type: object
+                 example: {"tool": {"ZAP": 42}, "priority": {"High": 3, "Low": 39}, "owasp": {"API8 - Security Misconfiguration": 42}, "new": {"new": 5, "recurring": 37}, "month": {"2024-08": 42}}
+         400:
+           description: Invalid parameter
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "limit and offset must be integers"
+       """
+    try:
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', type=int)
+        if request.args.get('limit') and limit is None or request.args.get('offset') and offset is None:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    limit = min(max(limit or 50, 1), 500)
+    offset = max(offset or 0, 0)
+
+    search = request.args.get('q', '').strip()
+    conditions = []
+    params = [search]
+    if search:
+        conditions.append("v.vuln_search @@ query")
+    if request.args.get('scan_url'):
+        conditions.append("s.scan_url = %s")
+        params.append(request.args.get('scan_url'))
+    if request.args.getlist('tool'):
+        conditions.append("t.tool_name = ANY(%s)")
+        params.append(request.args.getlist('tool'))
+    if request.args.getlist('priority'):
+        conditions.append("p.prio_name = ANY(%s)")
+        params.append(request.args.getlist('priority'))
+    if request.args.getlist('owasp'):
+        conditions.append("""EXISTS (
+            SELECT 1 FROM vuln_owasp vo JOIN owasp_categories o ON o.owasp_id = vo.owasp_id
+            WHERE vo.vuln_id = v.vuln_id AND vo.vuln_scan_date = v.vuln_scan_date AND o.owasp_name = ANY(%s))""")
+        params.append(request.args.getlist('owasp'))
+    if request.args.get('new'):
+        conditions.append("v.vuln_new = %s")
+        params.append(request.args.get('new').lower() == 'true')
+    # The bounds are repeated on both partitioned tables so each of them is pruned to the requested months
+    if request.args.get('start_date'):
+        conditions.append("s.scan_date >= %s::date AND v.vuln_scan_date >= %s::date")
+        params.extend([request.args.get('start_date')] * 2)
+    if request.args.get('end_date'):
+        conditions.append("s.scan_date < %s::date + 1 AND v.vuln_scan_date < %s::date + 1")
+        params.extend([request.args.get('end_date')] * 2)
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        # matches is computed once and feeds both the page of results and the facet counts. Findings
+        # are counted once per facet value, a finding in two OWASP categories counts for both of them.
+        cursor.execute(f"""
+            WITH matches AS MATERIALIZED (
+                SELECT v.vuln_id, s.scan_id, s.scan_date, s.scan_url, t.tool_name, v.vuln_name, v.vuln_number,
+                       p.prio_name, s.scan_active, v.vuln_description, v.vuln_new,
+                       ts_rank(v.vuln_search, query) AS rank,
+                       ARRAY(SELECT o.owasp_name FROM vuln_owasp vo
+                             JOIN owasp_categories o ON o.owasp_id = vo.owasp_id
+                             WHERE vo.vuln_id = v.vuln_id AND vo.vuln_scan_date = v.vuln_scan_date
+                             ORDER BY o.owasp_id) AS owasp_names
+                FROM vulnerabilities v
+                JOIN scans s ON s.scan_id = v.vuln_scan AND s.scan_date = v.vuln_scan_date
+                JOIN tools t ON t.tool_id = s.scan_tool
+                JOIN priorities p ON p.prio_id = v.vuln_priority
+                CROSS JOIN websearch_to_tsquery('english', %s) query
+                WHERE {' AND '.join(conditions) or 'TRUE'}
+            ),
+            facets AS (
+                SELECT CASE WHEN GROUPING(tool_name) = 0 THEN 'tool'
+                            WHEN GROUPING(prio_name) = 0 THEN 'priority'
+                            WHEN GROUPING(owasp_name) = 0 THEN 'owasp'
+                            WHEN GROUPING(vuln_new) = 0 THEN 'new'
+                            WHEN GROUPING(month) = 0 THEN 'month'
+                            ELSE 'total' END AS facet,
+                       COALESCE(tool_name, prio_name, owasp_name,
+                                CASE vuln_new WHEN TRUE THEN 'new' WHEN FALSE THEN 'recurring' END, month) AS value,
+                       COUNT(DISTINCT vuln_id) AS findings
+                FROM (
+                    SELECT m.vuln_id, m.tool_name, m.prio_name, m.vuln_new,
+                           to_char(m.scan_date, 'YYYY-MM') AS month, owasp_name
+                    FROM matches m
+                    LEFT JOIN LATERAL unnest(m.owasp_names) owasp_name ON TRUE
+                ) facet_rows
+                GROUP BY GROUPING SETS ((tool_name), (prio_name), (owasp_name), (vuln_new), (month), ())
+            ),
+            page AS (
+                SELECT * FROM matches
+                ORDER BY rank DESC, scan_date DESC, vuln_id
+                LIMIT %s OFFSET %s
+            )
+            SELECT f.facets, page.*
+            FROM (SELECT json_agg(json_build_array(facet, value, findings)) AS facets FROM facets) f
+            LEFT JOIN page ON TRUE
+            ORDER BY page.rank DESC, page.scan_date DESC, page.vuln_id;
+        """, params + [limit, offset])
         rows = cursor.fetchall()
+        columns = [column.name for column in cursor.description][1:]
 
-        data = []
-        for row in rows:
-            found_vulnerabilities = {
-                "scan_id": row[0],
-                "scan_date": row[1],
-                "scan_url": row[2],
-                "tool_name": row[3],
-                "vuln_name": row[4],
-                "vuln_number": row[5],
-                "prio_name": row[6],
-                "owasp_name": row[7],
-                "vuln_id": row[8],
-                "scan_active": row[9],
-                "vuln_description": row[10],
-                "vuln_new": row[11]
-            }
-            data.append(found_vulnerabilities)
+        facets = {"tool": {}, "priority": {}, "owasp": {}, "new": {}, "month": {}}
+        total = 0
+        for facet, value, findings in rows[0][0] or []:
+            if facet == 'total':
+                total = findings
+            elif value is not None:
+                facets[facet][value] = findings
 
-        return jsonify(data)
+        results = [dict(zip(columns, row[1:])) for row in rows if row[1] is not None]
+        return jsonify({"total": total, "results": results, "facets": facets})
 
     except Exception as e:
         return jsonify({"error": f"Error executing query: {e}"})
@@ -215,6 +625,11 @@ def get_scans():
         Retrieves a list of scans.
         ---
         parameters:
+          - name: format
+            in: query
+            type: string
+            required: false
+            description: "columnar returns one list per field with repeated strings dictionary encoded (also with Accept: application/vnd.dashboard.columnar+json)."
           - name: scan_url
             in: query
             type: string
@@ -283,7 +698,7 @@ def get_scans():
         scan_date = request.args.get('scan_date')
 
         query = """
-        SELECT DISTINCT scan_id, scan_date, scan_url, tool_name, scan_active 
+        SELECT DISTINCT scan_id, scan_date, scan_url, tool_name, scan_active AS active_scan
         FROM scans 
         JOIN tools ON tool_id = scan_tool
         WHERE 1=1
@@ -292,7 +707,8 @@ def get_scans():
         if scan_url:
             query += " AND scan_url = %s"
         if scan_date:
-            query += " AND DATE(scan_date) = %s"
+            # Range instead of DATE(scan_date) so only the partition of that month is scanned
+            query += " AND scan_date >= %s::date AND scan_date < %s::date + 1"
 
         query += " ORDER BY scan_id DESC"
 
@@ -300,22 +716,280 @@ def get_scans():
         if scan_url:
             params.append(scan_url)
         if scan_date:
-            params.append(scan_date)
+            params.extend([scan_date, scan_date])
 
         cursor.execute(query, params)
-        rows = cursor.fetchall()
+        columns = [column.name for column in cursor.description]
+        return rows_response(cursor.fetchall(), columns)
 
-        data = []
-        for row in rows:
-            found_scans = {
-                "scan_id": row[0],
-                "scan_date": row[1],
-                "scan_url": row[2],
-                "tool_name": row[3],
-                "active_scan": row[4]
-            }
-            data.append(found_scans)
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
 
+@app.route('/scans/<int:scan_a>/diff/<int:scan_b>', methods=['GET'])
+def get_scan_diff(scan_a, scan_b):
+    """
+       Compares the findings of two scans (usually an older scan a and a newer scan b of the same URL).
+       Findings are matched by vuln_name: added are only in b, resolved only in a, persisting in both.
+       ---
+       parameters:
+         - name: scan_a
+           in: path
+           type: integer
+           required: true
+         - name: scan_b
+           in: path
+           type: integer
+           required: true
+       responses:
+         200:
+           description: The added, resolved and persisting findings and the count deltas per priority.
+           schema:
+             type: object
+             properties:
+               scan_a:
+                 type: object
+                 example: {"scan_id": 11, "scan_date": "Wed, 21 Aug 2024 08:12:05 GMT", "scan_url": "http://example.com"}
+               scan_b:
+                 type: object
+                 example: {"scan_id": 12, "scan_date": "Thu, 22 Aug 2024 08:39:42 GMT", "scan_url": "http://example.com"}
+               added:
+                 type: array
+                 items:
+                   type: object
+                 example: [{"vuln_name": "SQL Injection", "prio_name": "High", "vuln_number": 2}]
+               resolved:
+                 type: array
+                 items:
+                   type: object
+                 example: [{"vuln_name": "Cookie No HttpOnly Flag", "prio_name": "Low", "vuln_number": 1}]
+               persisting:
+                 type: array
+                 items:
+                   type: object
+                 example: [{"vuln_name": "X-Content-Type-Options Header Missing", "prio_name": "Low", "vuln_number_a": 4, "vuln_number_b": 6}]
+               counts:
+                 type: object
+                 example: {"added": 1, "resolved": 1, "persisting": 1, "findings_a": 2, "findings_b": 2, "delta": 0, "priorities": {"High": {"a": 0, "b": 1, "delta": 1}, "Low": {"a": 2, "b": 1, "delta": -1}}}
+         404:
+           description: One of the scans does not exist (or was compacted).
+       """
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        cursor.execute("SELECT scan_id, scan_date, scan_url FROM scans WHERE scan_id = ANY(%s);", ([scan_a, scan_b],))
+        scans = {row[0]: {"scan_id": row[0], "scan_date": row[1], "scan_url": row[2]} for row in cursor.fetchall()}
+        if scan_a not in scans or scan_b not in scans:
+            return jsonify({"error": "Scan not found"}), 404
+
+        # Both scans are read with their scan date, so only their partitions are touched
+        cursor.execute("""
+            WITH a AS (
+                SELECT vuln_name, MAX(vuln_priority) AS vuln_priority, SUM(vuln_number) AS vuln_number
+                FROM vulnerabilities
+                WHERE vuln_scan = %s AND vuln_scan_date = %s
+                GROUP BY vuln_name
+            ),
+            b AS (
+                SELECT vuln_name, MAX(vuln_priority) AS vuln_priority, SUM(vuln_number) AS vuln_number
+                FROM vulnerabilities
+                WHERE vuln_scan = %s AND vuln_scan_date = %s
+                GROUP BY vuln_name
+            ),
+            changes AS (
+                SELECT vuln_name, 'added' AS change FROM (SELECT vuln_name FROM b EXCEPT SELECT vuln_name FROM a) added
+                UNION ALL
+                SELECT vuln_name, 'resolved' FROM (SELECT vuln_name FROM a EXCEPT SELECT vuln_name FROM b) resolved
+                UNION ALL
+                SELECT vuln_name, 'persisting' FROM (SELECT vuln_name FROM a INTERSECT SELECT vuln_name FROM b) persisting
+            )
+            SELECT c.change, c.vuln_name, pa.prio_name, a.vuln_number, pb.prio_name, b.vuln_number
+            FROM changes c
+            LEFT JOIN a ON a.vuln_name = c.vuln_name
+            LEFT JOIN b ON b.vuln_name = c.vuln_name
+            LEFT JOIN priorities pa ON pa.prio_id = a.vuln_priority
+            LEFT JOIN priorities pb ON pb.prio_id = b.vuln_priority
+            ORDER BY c.change, COALESCE(b.vuln_priority, a.vuln_priority) DESC, c.vuln_name;
+        """, (scan_a, scans[scan_a]["scan_date"], scan_b, scans[scan_b]["scan_date"]))
+
+        diff = {"added": [], "resolved": [], "persisting": []}
+        priorities = {}
+        for change, vuln_name, prio_a, number_a, prio_b, number_b in cursor.fetchall():
+            if change == 'added':
+                diff["added"].append({"vuln_name": vuln_name, "prio_name": prio_b, "vuln_number": number_b})
+            elif change == 'resolved':
+                diff["resolved"].append({"vuln_name": vuln_name, "prio_name": prio_a, "vuln_number": number_a})
+            else:
+                diff["persisting"].append({"vuln_name": vuln_name, "prio_name": prio_b,
+                                           "vuln_number_a": number_a, "vuln_number_b": number_b})
+            if prio_a is not None:
+                priorities.setdefault(prio_a, {"a": 0, "b": 0})["a"] += 1
+            if prio_b is not None:
+                priorities.setdefault(prio_b, {"a": 0, "b": 0})["b"] += 1
+
+        findings_a = len(diff["resolved"]) + len(diff["persisting"])
+        findings_b = len(diff["added"]) + len(diff["persisting"])
+        counts = {
+            **{change: len(findings) for change, findings in diff.items()},
+            "findings_a": findings_a,
+            "findings_b": findings_b,
+            "delta": findings_b - findings_a,
+            "priorities": {prio_name: {**count, "delta": count["b"] - count["a"]} for prio_name, count in priorities.items()},
+        }
+        return jsonify({"scan_a": scans[scan_a], "scan_b": scans[scan_b], **diff, "counts": counts})
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/scans/diff', methods=['GET'])
+def get_consecutive_scan_diffs():
+    """
+       Compares every scan of a URL with the scan before it in one query, oldest pair first.
+       ---
+       parameters:
+         - name: scan_url
+           in: query
+           type: string
+           required: true
+         - name: start_date
+           in: query
+           type: string
+           required: false
+           description: "Only include scans on or after this date (format: YYYY-MM-DD)."
+         - name: end_date
+           in: query
+           type: string
+           required: false
+           description: "Only include scans on or before this date (format: YYYY-MM-DD)."
+       responses:
+         200:
+           description: One entry per consecutive scan pair.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 previous_scan_id:
+                   type: integer
+                   example: 11
+                 scan_id:
+                   type: integer
+                   example: 12
+                 scan_date:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:39:42 GMT"
+                 added:
+                   type: array
+                   items:
+                     type: string
+                   example: ["SQL Injection"]
+                 resolved:
+                   type: array
+                   items:
+                     type: string
+                   example: ["Cookie No HttpOnly Flag"]
+                 persisting:
+                   type: integer
+                   example: 5
+                 delta:
+                   type: integer
+                   example: 0
+         400:
+           description: Bad Request. The `scan_url` parameter is missing.
+       """
+    scan_url = request.args.get('scan_url')
+    if not scan_url:
+        return jsonify({"error": "Missing scan_url parameter"}), 400
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        scan_filter = ""
+        vuln_filter = ""
+        params = [scan_url]
+        # The bounds are repeated on both partitioned tables so each of them is pruned to the requested months
+        if start_date:
+            scan_filter += " AND scan_date >= %s::date"
+            params.append(start_date)
+        if end_date:
+            scan_filter += " AND scan_date < %s::date + 1"
+            params.append(end_date)
+        if start_date:
+            vuln_filter += " AND v.vuln_scan_date >= %s::date"
+            params.append(start_date)
+        if end_date:
+            vuln_filter += " AND v.vuln_scan_date < %s::date + 1"
+            params.append(end_date)
+
+        # Every finding is keyed by the scan pair it belongs to, so one EXCEPT / INTERSECT diffs all pairs at once
+        cursor.execute(f"""
+            WITH url_scans AS (
+                SELECT scan_id, scan_date, LAG(scan_id) OVER (ORDER BY scan_date, scan_id) AS previous_scan_id
+                FROM scans
+                WHERE scan_url = %s {scan_filter}
+            ),
+            findings AS (
+                SELECT DISTINCT s.scan_id, v.vuln_name
+                FROM url_scans s
+                JOIN vulnerabilities v ON v.vuln_scan = s.scan_id AND v.vuln_scan_date = s.scan_date
+                WHERE TRUE {vuln_filter}
+            ),
+            current_findings AS (
+                SELECT s.scan_id AS pair, f.vuln_name FROM url_scans s JOIN findings f ON f.scan_id = s.scan_id
+                WHERE s.previous_scan_id IS NOT NULL
+            ),
+            previous_findings AS (
+                SELECT s.scan_id AS pair, f.vuln_name FROM url_scans s JOIN findings f ON f.scan_id = s.previous_scan_id
+            ),
+            changes AS (
+                SELECT pair, vuln_name, 'added' AS change FROM (
+                    SELECT pair, vuln_name FROM current_findings EXCEPT SELECT pair, vuln_name FROM previous_findings) added
+                UNION ALL
+                SELECT pair, vuln_name, 'resolved' FROM (
+                    SELECT pair, vuln_name FROM previous_findings EXCEPT SELECT pair, vuln_name FROM current_findings) resolved
+                UNION ALL
+                SELECT pair, vuln_name, 'persisting' FROM (
+                    SELECT pair, vuln_name FROM current_findings INTERSECT SELECT pair, vuln_name FROM previous_findings) persisting
+            )
+            SELECT s.previous_scan_id, s.scan_id, s.scan_date,
+                   COALESCE(array_agg(c.vuln_name ORDER BY c.vuln_name) FILTER (WHERE c.change = 'added'), '{{}}'),
+                   COALESCE(array_agg(c.vuln_name ORDER BY c.vuln_name) FILTER (WHERE c.change = 'resolved'), '{{}}'),
+                   COUNT(c.vuln_name) FILTER (WHERE c.change = 'persisting')
+            FROM url_scans s
+            LEFT JOIN changes c ON c.pair = s.scan_id
+            WHERE s.previous_scan_id IS NOT NULL
+            GROUP BY s.previous_scan_id, s.scan_id, s.scan_date
+            ORDER BY s.scan_date, s.scan_id;
+        """, params)
+
+        data = []
+        for previous_scan_id, scan_id, scan_date, added, resolved, persisting in cursor.fetchall():
+            data.append({
+                "previous_scan_id": previous_scan_id,
+                "scan_id": scan_id,
+                "scan_date": scan_date,
+                "added": added,
+                "resolved": resolved,
+                "persisting": persisting,
+                "delta": len(added) - len(resolved)
+            })
         return jsonify(data)
 
     except Exception as e:
@@ -327,10 +1001,226 @@ def get_scans():
         if connection:
             connection.close()
 
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    """
+       Change feed of the scans and vulnerabilities ingested and the scans deleted after a cursor.
+       Scans and vulnerabilities are numbered from one ingest sequence when they are inserted and
+       the scans removed by the compaction or the retention when they are deleted, a dashboard keeps
+       the returned cursor and only fetches what changed since. Without since the feed starts at the
+       first stored scan.
+       ---
+       parameters:
+         - name: since
+           in: query
+           type: integer
+           required: false
+           description: The cursor returned by the previous call.
+         - name: limit
+           in: query
+           type: integer
+           required: false
+           description: Maximum number of scans per call (default 500), has_more tells if there are more.
+       responses:
+         200:
+           description: The scans and vulnerabilities after the cursor.
+           schema:
+             type: object
+             properties:
+               cursor:
+                 type: integer
+                 example: 1042
+               has_more:
+                 type: boolean
+                 example: false
+               scans:
+                 type: array
+                 description: The new scans in the format of /scans.
+                 items:
+                   type: object
+               vulnerabilities:
+                 type: array
+                 description: The new vulnerabilities in the format of /vulnerabilities.
+                 items:
+                   type: object
+               deleted_scans:
+                 type: array
+                 description: The scans removed together with their vulnerabilities.
+                 items:
+                   type: object
+                   properties:
+                     scan_id:
+                       type: integer
+                     scan_date:
+                       type: string
+                     scan_url:
+                       type: string
+                     reason:
+                       type: string
+                       example: "compacted"
+                       description: compacted, archived or dropped
+         400:
+           description: Invalid cursor or limit
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "since and limit must be integers"
+       """
+    try:
+        since = request.args.get('since', type=int)
+        limit = request.args.get('limit', type=int)
+        if request.args.get('since') and since is None or request.args.get('limit') and (limit is None or limit < 1):
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+    since = since or 0
+    limit = limit or 500
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        # One row more than the page tells if there are more scans. The ingest inserts a scan
+        # followed by its vulnerabilities, so the page ends right before the next scan.
+        cursor.execute("""
+            SELECT scan_ingest_seq, scan_id, scan_date, scan_url, tool_name, scan_active
+            FROM scans
+            JOIN tools ON tool_id = scan_tool
+            WHERE scan_ingest_seq > %s
+            ORDER BY scan_ingest_seq
+            LIMIT %s;
+        """, (since, limit + 1))
+        scan_rows = cursor.fetchall()
+        has_more = len(scan_rows) > limit
+        until = scan_rows.pop()[0] - 1 if has_more else None
+
+        # Both sequences are taken under the partition lock of the ingest, which is held until the
+        # commit, so nothing with a lower number can still show up after the cursor passed it.
+        cursor.execute("""
+            SELECT v.vuln_ingest_seq, scan_id, scan_date, scan_url, tool_name, vuln_name, vuln_number, prio_name,
+                   owasp_name, v.vuln_id, scan_active, vuln_description, vuln_new
+            FROM vulnerabilities v
+            JOIN scans ON scan_id = vuln_scan AND scan_date = v.vuln_scan_date
+            JOIN tools ON tool_id = scan_tool
+            JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date
+            JOIN owasp_categories o ON o.owasp_id = vo.owasp_id
+            JOIN priorities ON vuln_priority = prio_id
+            WHERE v.vuln_ingest_seq > %s AND (%s::bigint IS NULL OR v.vuln_ingest_seq <= %s)
+            ORDER BY v.vuln_ingest_seq, owasp_name;
+        """, (since, until, until))
+        vuln_rows = cursor.fetchall()
+
+        # The deletions take their number under the same lock
+        cursor.execute("""
+            SELECT delete_seq, scan_id, scan_date, scan_url, reason
+            FROM deleted_scans
+            WHERE delete_seq > %s AND (%s::bigint IS NULL OR delete_seq <= %s)
+            ORDER BY delete_seq;
+        """, (since, until, until))
+        deleted_rows = cursor.fetchall()
+
+        scans = [{
+            "scan_id": row[1],
+            "scan_date": row[2],
+            "scan_url": row[3],
+            "tool_name": row[4],
+            "active_scan": row[5]
+        } for row in scan_rows]
+        vulnerabilities = [{
+            "scan_id": row[1],
+            "scan_date": row[2],
+            "scan_url": row[3],
+            "tool_name": row[4],
+            "vuln_name": row[5],
+            "vuln_number": row[6],
+            "prio_name": row[7],
+            "owasp_name": row[8],
+            "vuln_id": row[9],
+            "scan_active": row[10],
+            "vuln_description": row[11],
+            "vuln_new": row[12]
+        } for row in vuln_rows]
+        deleted_scans = [{
+            "scan_id": row[1],
+            "scan_date": row[2],
+            "scan_url": row[3],
+            "reason": row[4]
+        } for row in deleted_rows]
+
+        if not has_more:
+            until = max([since] + [row[0] for row in scan_rows] + [row[0] for row in vuln_rows]
+                        + [row[0] for row in deleted_rows])
+        return jsonify({
+            "cursor": until,
+            "has_more": has_more,
+            "scans": scans,
+            "vulnerabilities": vulnerabilities,
+            "deleted_scans": deleted_scans
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/ingest-events', methods=['GET'])
+def stream_ingest_events():
+    """
+       Streams every ingested report as Server-Sent Events, whoever started the scan. One stream per
+       dashboard replaces polling /scans and /vulnerabilities. Events: ingested (the new scans with their
+       vulnerability counts and the /changes cursor after the report) and resync (notifications may have
+       been missed, fetch /changes with the last cursor). A reconnecting client gets the events after
+       Last-Event-ID.
+       ---
+       produces:
+         - text/event-stream
+       responses:
+         200:
+           description: "The event stream, e.g. event: ingested / data: {\"report_file\": \"scan-report_example.com_2024-08-22_08-39-42.json\", \"scan_date\": \"2024-08-22T08:39:42\", \"cursor\": 1042, \"scans\": [{\"scan_id\": 1335, \"scan_url\": \"http://example.com:80\", \"scan_active\": false, \"vulnerabilities\": 7, \"new_vulnerabilities\": 2, \"priorities\": {\"Low\": 5, \"Medium\": 2}}]}"
+       """
+    ingest_listener.start()
+    try:
+        event_id = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        event_id = -1
+    # Ids of an earlier API process mean nothing to this one
+    resync = event_id > ingest_listener.next_id()
+    if event_id <= 0 or resync:
+        event_id = ingest_listener.next_id()
+
+    def generate():
+        nonlocal event_id
+        if resync:
+            yield "event: resync\ndata: {}\n\n"
+        while True:
+            first_id, events = ingest_listener.events_since(event_id, timeout=15)
+            if not events:
+                # Comment line so proxies do not close an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            if first_id > event_id:
+                # The client was away longer than the kept events reach back
+                yield "event: resync\ndata: {}\n\n"
+            for event_id, (event_type, data) in enumerate(events, first_id):
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+            event_id += 1
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/run-passive-scan', methods=['POST'])
 def run_docker_passive():
     """
         Runs a passive API security scan on the provided URL using OWASP ZAP.
+        A scan of the same URL that is still running is shared instead of starting a second container,
+        and a URL that was scanned within the freshness window is not scanned again unless force is set.
         ---
         parameters:
           - name: url
@@ -343,17 +1233,40 @@ def run_docker_passive():
                   type: string
                   example: "http://example.com"
                   description: The URL to scan.
+                force:
+                  type: boolean
+                  example: false
+                  description: Scan even if the URL was scanned within the freshness window.
+          - name: wait
+            in: query
+            type: boolean
+            required: false
+            default: true
+            description: Wait for the scan to finish (true) or return the job right away (false).
         responses:
           200:
-            description: The URL was successfully scanned.
+            description: The URL was successfully scanned or was scanned recently.
             schema:
               type: object
               properties:
                 message:
                   type: string
                   example: "URL successfully scanned"
+                job_id:
+                  type: string
+                  example: "5f0c6a0e8b0e4c46a1c0d3f1f6f7e2a1"
+                coalesced:
+                  type: boolean
+                  example: false
+                  description: Indicates if the request joined a scan of the same URL that was already running.
+                scan_id:
+                  type: integer
+                  example: 12
+                  description: The scan inserted from the report, or the recent scan that was returned instead of scanning again.
+          202:
+            description: The scan was started (wait=false), its state is available under /scan-jobs/<job_id>.
           400:
-            description: Bad Request. The URL is missing from the request.
+            description: Bad Request. The URL is missing from the request or is not an http(s) URL with a host.
             schema:
               type: object
               properties:
@@ -377,41 +1290,19 @@ def run_docker_passive():
         return jsonify({"error": "URL is missing"}), 400
 
     url = data['url']
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    json_report_file = f'api-passive-scan-report_{timestamp}.json'
-    print({output_directory})
-
-    docker_command = (
-        f'docker run -v {output_directory}:/zap/wrk -t owasp/zap2docker-stable zap-baseline.py '
-        f'-g api-passive-scan.conf -t {url} -J {json_report_file}'
-    )
-
-    try:
-        print("Starting scan")
-        result = subprocess.run(docker_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        stdout_output = result.stdout.decode('utf-8')
-        stderr_output = result.stderr.decode('utf-8')
+    # The URL ends up as argument of the ZAP container and in the report file name
+    if not isinstance(url, str) or not is_scan_url(url):
+        return jsonify({"error": "url must be an http(s) URL with a host"}), 400
+    target = url.rstrip('/')
+    wait = request.args.get('wait', 'true').lower() != 'false'
 
-        print("STDOUT:", stdout_output)
-        print("STDERR:", stderr_output)
+    if not data.get('force', False):
+        recent = find_recent_passive_scan(target)
+        if recent is not None:
+            return jsonify(recent), 200
 
-        success_pattern = r'Total of \d+ URLs'
-        match = re.search(success_pattern, stdout_output)
-
-        if result.returncode == 0 or (match and int(re.search(r'\d+', match.group()).group()) > 0):
-            print("Scan completed successfully")
-            print({output_directory})
-            return jsonify({"message": "URL successfully scanned"}), 200
-        else:
-            print("Scan failed with errors")
-            return jsonify({"error": "Scan failed", "details": stderr_output}), 500
-    except subprocess.TimeoutExpired:
-        print("Scan timed out")
-        return jsonify({"error": "Scan timed out"}), 500
-    except Exception as e:
-        print("Exception during scan:", e)
-        return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
+    job, coalesced = submit_passive_scan(url)
+    return scan_job_response(job, coalesced, wait)
 
 @app.route('/run-active-scan', methods=['POST'])
 def run_docker_active():
@@ -426,6 +1317,17 @@ def run_docker_active():
            type: file
            required: true
            description: The OpenAPI file to use for the active scan. Must be a JSON file.
+         - name: force
+           in: formData
+           type: boolean
+           required: false
+           description: Scan even if the same file was scanned within the freshness window.
+         - name: wait
+           in: query
+           type: boolean
+           required: false
+           default: true
+           description: Wait for the scan to finish (true) or return the job right away (false).
        responses:
          200:
            description: The URL was successfully scanned.
@@ -462,48 +1364,364 @@ def run_docker_active():
         return jsonify({"error": "No selected file"}), 400
 
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
+        # Identical OpenAPI files are the same scan target, whatever their name
+        content = file.read()
+        target = hashlib.sha256(content).hexdigest()
+        wait = request.args.get('wait', 'true').lower() != 'false'
+
+        recent = scan_executor.recent_success('active', target, scan_freshness)
+        if recent is not None and request.form.get('force', 'false').lower() != 'true':
+            return jsonify({**recent.result, "job_id": recent.job_id, "recent": True}), 200
+
+        # Prefixed with the hash so uploads with the same name do not overwrite a file that is still being scanned
+        filename = f"{target[:12]}_{secure_filename(file.filename)}"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        with open(file_path, 'wb') as saved_file:
+            saved_file.write(content)
         print(f"File uploaded successfully: {file_path}")
 
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        json_report_file = f'api-active-scan-report_{timestamp}.json'
+        json_report_file = f'api-active-scan-report_{timestamp}_{target[:8]}.json'
 
-        docker_command = (
-            f'docker run -v {output_directory}:/zap/wrk -t owasp/zap2docker-stable zap-api-scan.py '
-            f'-t /zap/wrk/openapi/{filename} -f openapi -J {json_report_file}'
-        )
+        docker_command = docker_scan_command('active', output_directory, filename, json_report_file)
 
-        print("Docker command:", docker_command)
+        job, coalesced = scan_executor.submit('active', target, docker_command, json_report_file,
+                                              timeout=scan_timeouts['active'],
+                                              scan_input=f'/zap/wrk/openapi/{filename}')
+        return scan_job_response(job, coalesced, wait)
+    else:
+        return jsonify({"error": "File type not allowed"}), 400
 
-        try:
-            print("Starting active scan")
-            result = subprocess.run(docker_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=600)  # Adding a timeout
+@app.route('/scan-jobs', methods=['GET'])
+def get_scan_jobs():
+    """
+       Lists the scan jobs of the last 24 hours, newest first.
+       ---
+       responses:
+         200:
+           description: A list of scan jobs.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 job_id:
+                   type: string
+                   example: "5f0c6a0e8b0e4c46a1c0d3f1f6f7e2a1"
+                 kind:
+                   type: string
+                   example: "passive"
+                 target:
+                   type: string
+                   example: "http://example.com"
+                   description: The scanned URL or the SHA-256 of the OpenAPI file.
+                 status:
+                   type: string
+                   example: "running"
+                   description: "queued, running, succeeded, failed or cancelled"
+                 created_at:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:39:42"
+                 started_at:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:39:43"
+                 finished_at:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:41:02"
+                 report_file:
+                   type: string
+                   example: "api-passive-scan-report_20240822_083942.json"
+                 result:
+                   type: object
+                   description: The response of the scan endpoint once the job is finished.
+       """
+    return jsonify([job.to_dict() for job in scan_executor.list_jobs()])
 
-            stdout_output = result.stdout.decode('utf-8')
-            stderr_output = result.stderr.decode('utf-8')
+@app.route('/scan-jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """
+       Retrieves the state of one scan job.
+       ---
+       parameters:
+         - name: job_id
+           in: path
+           type: string
+           required: true
+       responses:
+         200:
+           description: The scan job, see /scan-jobs for the fields.
+         404:
+           description: No job with this ID.
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "Scan job not found"
+       """
+    job = scan_executor.get(job_id)
+    if job is None:
+        return jsonify({"error": "Scan job not found"}), 404
+    return jsonify(job.to_dict())
 
-            print("STDOUT:", stdout_output)
-            print("STDERR:", stderr_output)
+@app.route('/scan-jobs/<job_id>', methods=['DELETE'])
+def cancel_scan_job(job_id):
+    """
+       Cancels a queued or running scan job and kills its scanner container.
+       The job ends with the status cancelled.
+       ---
+       parameters:
+         - name: job_id
+           in: path
+           type: string
+           required: true
+       responses:
+         202:
+           description: The job is being cancelled, see /scan-jobs/<job_id> for its state.
+         404:
+           description: No job with this ID.
+         409:
+           description: The job is already finished.
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "Scan job already finished"
+       """
+    job = scan_executor.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Scan job not found"}), 404
+    if job.done.is_set():
+        return jsonify({"error": "Scan job already finished", "status": job.status}), 409
+    return jsonify({"message": "Scan job is being cancelled", "job_id": job.job_id, "status": job.status}), 202
+
+@app.route('/scan-jobs/<job_id>/events', methods=['GET'])
+def stream_scan_job_events(job_id):
+    """
+       Streams the progress of a scan job as Server-Sent Events until the job is finished.
+       Events: started, urls (URLs found), rule (a ZAP rule finished), progress (spider / active scan percent
+       of a warm ZAP daemon), summary and finished (the job status and result). Every event carries the id of
+       its position, a reconnecting client gets the events after Last-Event-ID.
+       ---
+       produces:
+         - text/event-stream
+       parameters:
+         - name: job_id
+           in: path
+           type: string
+           required: true
+       responses:
+         200:
+           description: "The event stream, e.g. event: rule / data: {\"outcome\": \"WARN-NEW\", \"rule\": \"X-Content-Type-Options Header Missing\", \"rule_id\": 10021, \"urls\": 34, \"rules_run\": 12, \"alerts\": 4}"
+         404:
+           description: No job with this ID.
+       """
+    job = scan_executor.get(job_id)
+    if job is None:
+        return jsonify({"error": "Scan job not found"}), 404
 
-            success_pattern = r'Total of \d+ URLs'
-            match = re.search(success_pattern, stdout_output)
+    try:
+        index = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        index = 0
+
+    def generate():
+        nonlocal index
+        while True:
+            events = job.events_since(index, timeout=15)
+            if not events:
+                if job.done.is_set():
+                    return
+                # Comment line so proxies do not close an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            for event_type, data in events:
+                yield f"id: {index}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+                index += 1
+            if event_type == 'finished':
+                return
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/scan-schedules', methods=['GET'])
+def get_scan_schedules():
+    """
+       Lists the recurring passive scans.
+       ---
+       responses:
+         200:
+           description: A list of scan schedules.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 schedule_id:
+                   type: integer
+                   example: 1
+                 scan_url:
+                   type: string
+                   example: "http://example.com"
+                 cron:
+                   type: string
+                   example: "30 2 * * *"
+                 jitter_seconds:
+                   type: integer
+                   example: 3600
+                 enabled:
+                   type: boolean
+                   example: true
+                 next_run_at:
+                   type: string
+                   example: "Fri, 23 Aug 2024 02:41:17"
+                 last_run_at:
+                   type: string
+                   example: "Thu, 22 Aug 2024 02:12:05"
+                 last_job_id:
+                   type: string
+                   example: "5f0c6a0e8b0e4c46a1c0d3f1f6f7e2a1"
+       """
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
 
-            if result.returncode == 0 or (match and int(re.search(r'\d+', match.group()).group()) > 0):
-                print("Scan completed successfully")
-                return jsonify({"message": "URL successfully scanned"}), 200
-            else:
-                print("Scan failed with errors")
-                return jsonify({"error": "Scan failed", "details": stderr_output}), 500
-        except subprocess.TimeoutExpired:
-            print("Scan timed out")
-            return jsonify({"error": "Scan timed out"}), 500
-        except Exception as e:
-            print("Exception during scan:", e)
-            return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
-    else:
-        return jsonify({"error": "File type not allowed"}), 400
+    try:
+        cursor.execute("""
+            SELECT schedule_id, scan_url, cron, jitter_seconds, enabled, next_run_at, last_run_at, last_job_id
+            FROM scan_schedules
+            ORDER BY scan_url;
+        """)
+        columns = [column.name for column in cursor.description]
+        return jsonify([dict(zip(columns, row)) for row in cursor.fetchall()])
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/scan-schedules', methods=['POST'])
+def save_scan_schedule():
+    """
+       Creates or updates the recurring passive scan of a URL.
+       ---
+       parameters:
+         - name: body
+           in: body
+           required: true
+           schema:
+             type: object
+             properties:
+               url:
+                 type: string
+                 example: "http://example.com"
+               cron:
+                 type: string
+                 example: "30 2 * * *"
+                 description: "minute hour day-of-month month day-of-week, with *, lists (1,15), ranges (1-5) and steps (*/6)"
+               jitter_seconds:
+                 type: integer
+                 example: 3600
+                 description: Every run starts up to this many seconds after the cron time, so schedules with the same time do not start together.
+               enabled:
+                 type: boolean
+                 example: true
+       responses:
+         200:
+           description: The saved schedule.
+         400:
+           description: The URL or the cron expression is missing or invalid.
+       """
+    data = request.json or {}
+    if 'url' not in data or 'cron' not in data:
+        return jsonify({"error": "URL or cron expression is missing"}), 400
+
+    url = data['url']
+    if not isinstance(url, str) or not is_scan_url(url):
+        return jsonify({"error": "url must be an http(s) URL with a host"}), 400
+    url = url.rstrip('/')
+    try:
+        jitter_seconds = int(data.get('jitter_seconds', 0))
+        if jitter_seconds < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"error": "jitter_seconds must be an integer of at least 0"}), 400
+    enabled = bool(data.get('enabled', True))
+    try:
+        next_run_at = next_run_time(data['cron'], jitter_seconds, datetime.datetime.now())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        cursor.execute("""
+            INSERT INTO scan_schedules (scan_url, cron, jitter_seconds, enabled, next_run_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (scan_url) DO UPDATE
+            SET cron = EXCLUDED.cron, jitter_seconds = EXCLUDED.jitter_seconds,
+                enabled = EXCLUDED.enabled, next_run_at = EXCLUDED.next_run_at
+            RETURNING schedule_id, scan_url, cron, jitter_seconds, enabled, next_run_at, last_run_at, last_job_id;
+        """, (url, data['cron'], jitter_seconds, enabled, next_run_at))
+        columns = [column.name for column in cursor.description]
+        schedule = dict(zip(columns, cursor.fetchone()))
+        connection.commit()
+        return jsonify(schedule)
+
+    except Exception as e:
+        connection.rollback()
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/scan-schedules/<int:schedule_id>', methods=['DELETE'])
+def delete_scan_schedule(schedule_id):
+    """
+       Deletes a recurring scan.
+       ---
+       parameters:
+         - name: schedule_id
+           in: path
+           type: integer
+           required: true
+       responses:
+         200:
+           description: The schedule was deleted.
+         404:
+           description: No schedule with this ID.
+       """
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        cursor.execute("DELETE FROM scan_schedules WHERE schedule_id = %s;", (schedule_id,))
+        deleted = cursor.rowcount
+        connection.commit()
+        if not deleted:
+            return jsonify({"error": "Scan schedule not found"}), 404
+        return jsonify({"message": "Scan schedule deleted"})
+
+    except Exception as e:
+        connection.rollback()
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
 
 @app.route('/vulnerability_trend', methods=['GET'])
 def get_vulnerability_trend():
@@ -516,6 +1734,28 @@ def get_vulnerability_trend():
            type: string
            required: true
            description: The URL of the scan for which to retrieve vulnerability trends.
+         - name: start_date
+           in: query
+           type: string
+           required: false
+           description: "Only include scans on or after this date (format: YYYY-MM-DD)."
+         - name: end_date
+           in: query
+           type: string
+           required: false
+           description: "Only include scans on or before this date (format: YYYY-MM-DD)."
+         - name: bucket
+           in: query
+           type: string
+           required: false
+           enum: [scan, day, week, month]
+           description: "scan (default) returns one point per scan date, day/week/month one point per period
+             with the average number of vulnerabilities per scan date in it. scan_date is the start of the period."
+         - name: max_points
+           in: query
+           type: integer
+           required: false
+           description: Reduces the trend to at most this many points (at least 3) that keep the shape of the total line.
        responses:
          200:
            description: A trend of vulnerabilities over time.
@@ -566,19 +1806,94 @@ def get_vulnerability_trend():
         if not scan_url:
             return jsonify({"error": "Missing scan_url parameter"}), 400
 
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        bucket = request.args.get('bucket', 'scan')
+        max_points = request.args.get('max_points', type=int)
+        if bucket not in TREND_BUCKETS:
+            return jsonify({"error": "bucket must be one of scan, day, week, month"}), 400
+        if request.args.get('max_points') and (max_points is None or max_points < 3):
+            return jsonify({"error": "max_points must be an integer of at least 3"}), 400
+
         print(f"Received scan_url: {scan_url}")  # Debugging information
 
         query = """
             SELECT scan_date, owasp_name, COUNT(v.vuln_id) as vuln_count, scan_active
             FROM scans s
-            JOIN vulnerabilities v ON s.scan_id = v.vuln_scan 
-            JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id 
+            JOIN vulnerabilities v ON s.scan_id = v.vuln_scan AND s.scan_date = v.vuln_scan_date 
+            JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date 
             JOIN owasp_categories o ON o.owasp_id = vo.owasp_id 
             WHERE s.scan_url = %s
+        """
+        params = [scan_url]
+
+        # The bounds are repeated on every partitioned table so each of them is pruned to the requested months
+        if start_date:
+            query += " AND s.scan_date >= %s::date AND v.vuln_scan_date >= %s::date AND vo.vuln_scan_date >= %s::date"
+            params.extend([start_date] * 3)
+        if end_date:
+            query += " AND s.scan_date < %s::date + 1 AND v.vuln_scan_date < %s::date + 1 AND vo.vuln_scan_date < %s::date + 1"
+            params.extend([end_date] * 3)
+
+        # Every scan adds a row without category, so scans without findings are kept as dates
+        query += """
             GROUP BY scan_date, owasp_name, scan_active
-            ORDER BY scan_date ASC;
+            UNION ALL
+            SELECT s.scan_date, NULL, 0, s.scan_active
+            FROM scans s
+            WHERE s.scan_url = %s
         """
-        cursor.execute(query, (scan_url,))
+        params.append(scan_url)
+
+        if start_date:
+            query += " AND s.scan_date >= %s::date"
+            params.append(start_date)
+        if end_date:
+            query += " AND s.scan_date < %s::date + 1"
+            params.append(end_date)
+
+        # Scans older than the compaction window only survive as per-day aggregates and counts
+        for compacted in ["""
+            SELECT a.scan_day::timestamp, owasp_name, a.vuln_count, a.scan_active
+            FROM scan_daily_aggregates a
+            JOIN owasp_categories o ON o.owasp_id = a.owasp_id
+            WHERE a.scan_url = %s
+        """, """
+            SELECT a.scan_day::timestamp, NULL, 0, a.scan_active
+            FROM scan_daily_counts a
+            WHERE a.scan_url = %s
+        """]:
+            query += " UNION ALL" + compacted
+            params.append(scan_url)
+
+            if start_date:
+                query += " AND a.scan_day >= %s::date"
+                params.append(start_date)
+            if end_date:
+                query += " AND a.scan_day <= %s::date"
+                params.append(end_date)
+
+        if bucket == 'scan':
+            query += " ORDER BY scan_date ASC;"
+        else:
+            # Average per scan date, so a week of daily scans is comparable with a single scan
+            query = f"""
+                WITH trend AS ({query}),
+                buckets AS (
+                    SELECT date_trunc(%s, scan_date) AS bucket, COUNT(DISTINCT scan_date::date) AS scan_dates
+                    FROM trend
+                    GROUP BY 1
+                )
+                SELECT b.bucket AS scan_date, t.owasp_name,
+                       ROUND(SUM(t.vuln_count)::numeric / b.scan_dates, 2)::float AS vuln_count,
+                       bool_or(t.scan_active) AS scan_active
+                FROM trend t
+                JOIN buckets b ON b.bucket = date_trunc(%s, t.scan_date)
+                GROUP BY b.bucket, b.scan_dates, t.owasp_name
+                ORDER BY scan_date ASC;
+            """
+            params.extend([bucket, bucket])
+        cursor.execute(query, params)
         rows = cursor.fetchall()
 
         data = {}
@@ -593,12 +1908,13 @@ def get_vulnerability_trend():
                     "vuln_counts": {},
                     "scan_active": scan_active
                 }
-            data[scan_date]["vuln_counts"][owasp_name] = vuln_count
+            if owasp_name is not None:
+                data[scan_date]["vuln_counts"][owasp_name] = vuln_count
 
         response_data = {
             "scan_date": [],
             "scan_active": [],
-            **{owasp_name: [] for _, owasp_name, _, _ in rows}
+            **{owasp_name: [] for _, owasp_name, _, _ in rows if owasp_name is not None}
         }
 
         for scan_date in sorted(data.keys()):
@@ -609,6 +1925,14 @@ def get_vulnerability_trend():
                 if owasp_name not in ["scan_date", "scan_active"]:
                     response_data[owasp_name].append(data[scan_date]["vuln_counts"].get(owasp_name, 0))
 
+        if max_points:
+            # The same points are kept for every category, picked along the total of all categories
+            dates = [datetime.date.fromisoformat(scan_date).toordinal() for scan_date in response_data["scan_date"]]
+            totals = [sum(counts) for counts in zip(*(values for key, values in response_data.items()
+                                                      if key not in ["scan_date", "scan_active"]))] or [0] * len(dates)
+            keep = lttb_indices(dates, totals, max_points)
+            response_data = {key: [values[index] for index in keep] for key, values in response_data.items()}
+
         return jsonify(response_data)
     except Exception as e:
         return jsonify({"error": f"Error executing query: {e}"})
@@ -618,19 +1942,586 @@ def get_vulnerability_trend():
         if connection:
             connection.close()
 
+# Sort columns of /leaderboard per metric
+LEADERBOARD_METRICS = {
+    'high': 'high_count',
+    'medium': 'medium_count',
+    'low': 'low_count',
+    'informational': 'informational_count',
+    'total': 'vuln_count',
+    'new': 'new_count',
+}
+
+@app.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """
+       The URLs with the most findings in their latest scan, read from the latest_scan_summary view
+       as it was last refreshed. Scans ingested since then are missing for a few seconds, the
+       X-Refreshed-At-Seq header is the ingest sequence (cursor of GET /changes) the view covers.
+       ---
+       parameters:
+         - name: metric
+           in: query
+           type: string
+           required: false
+           enum: [high, medium, low, informational, total, new]
+           description: The findings the URLs are ranked by (default high).
+         - name: limit
+           in: query
+           type: integer
+           required: false
+           description: Number of URLs (default 10).
+       responses:
+         200:
+           description: The top URLs with the finding counts of their latest scan.
+           headers:
+             X-Refreshed-At-Seq:
+               type: integer
+               description: The newest scan_ingest_seq included in the view.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 scan_url:
+                   type: string
+                   example: "http://example.com"
+                 scan_id:
+                   type: integer
+                   example: 12
+                 scan_date:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:39:42"
+                 scan_active:
+                   type: boolean
+                   example: false
+                 tool_name:
+                   type: string
+                   example: "ZAP"
+                 vuln_count:
+                   type: integer
+                   example: 14
+                 high_count:
+                   type: integer
+                   example: 3
+                 medium_count:
+                   type: integer
+                   example: 4
+                 low_count:
+                   type: integer
+                   example: 5
+                 informational_count:
+                   type: integer
+                   example: 2
+                 new_count:
+                   type: integer
+                   example: 1
+         400:
+           description: Unknown metric or invalid limit
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "Unknown metric"
+       """
+    metric = request.args.get('metric', 'high')
+    if metric not in LEADERBOARD_METRICS:
+        return jsonify({"error": "Unknown metric"}), 400
+    limit = request.args.get('limit', type=int)
+    if request.args.get('limit') and (limit is None or limit < 1):
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        cursor.execute(f"""
+            SELECT scan_url, scan_id, scan_date, scan_active, tool_name, vuln_count, high_count,
+                   medium_count, low_count, informational_count, new_count
+            FROM latest_scan_summary
+            ORDER BY {LEADERBOARD_METRICS[metric]} DESC, vuln_count DESC, scan_url
+            LIMIT %s;
+        """, (limit or 10,))
+        columns = [column.name for column in cursor.description]
+        rows = cursor.fetchall()
+        cursor.execute("SELECT MAX(refreshed_at_seq) FROM latest_scan_summary;")
+        response = rows_response(rows, columns)
+        response.headers['X-Refreshed-At-Seq'] = str(cursor.fetchone()[0] or 0)
+        return response
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/leaderboard/owasp-growth', methods=['GET'])
+def get_owasp_growth():
+    """
+       The OWASP categories ranked by how much their findings grew from the previous to the latest
+       scan of every URL. Only URLs with at least two scans are compared.
+       ---
+       responses:
+         200:
+           description: The OWASP categories, fastest growing first.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 owasp_name:
+                   type: string
+                   example: "API8 - Security Misconfiguration"
+                 latest_count:
+                   type: integer
+                   example: 57
+                 previous_count:
+                   type: integer
+                   example: 41
+                 growth:
+                   type: integer
+                   example: 16
+                 urls_compared:
+                   type: integer
+                   example: 120
+       """
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        # The previous scan of every URL is found with one index lookup on scans_url_date_idx per URL
+        cursor.execute("""
+            WITH pairs AS (
+                SELECT l.scan_id AS latest_id, l.scan_date AS latest_date,
+                       p.scan_id AS previous_id, p.scan_date AS previous_date
+                FROM latest_scan_summary l
+                CROSS JOIN LATERAL (
+                    SELECT s.scan_id, s.scan_date FROM scans s
+                    WHERE s.scan_url = l.scan_url AND s.scan_date < l.scan_date
+                    ORDER BY s.scan_date DESC
+                    LIMIT 1
+                ) p
+            ),
+            compared AS (
+                SELECT latest_id AS scan_id, latest_date AS scan_date, TRUE AS latest FROM pairs
+                UNION ALL
+                SELECT previous_id, previous_date, FALSE FROM pairs
+            ),
+            counts AS (
+                SELECT vo.owasp_id,
+                       COUNT(*) FILTER (WHERE c.latest) AS latest_count,
+                       COUNT(*) FILTER (WHERE NOT c.latest) AS previous_count
+                FROM compared c
+                JOIN vulnerabilities v ON v.vuln_scan = c.scan_id AND v.vuln_scan_date = c.scan_date
+                JOIN vuln_owasp vo ON vo.vuln_id = v.vuln_id AND vo.vuln_scan_date = v.vuln_scan_date
+                GROUP BY vo.owasp_id
+            )
+            SELECT o.owasp_name, COALESCE(latest_count, 0) AS latest_count,
+                   COALESCE(previous_count, 0) AS previous_count,
+                   COALESCE(latest_count, 0) - COALESCE(previous_count, 0) AS growth,
+                   (SELECT COUNT(*) FROM pairs) AS urls_compared
+            FROM owasp_categories o
+            LEFT JOIN counts ON counts.owasp_id = o.owasp_id
+            ORDER BY growth DESC, o.owasp_id;
+        """)
+        columns = [column.name for column in cursor.description]
+        return rows_response(cursor.fetchall(), columns)
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+@app.route('/export', methods=['GET'])
+def export_vulnerabilities():
+    """
+       Streams the joined scans, vulnerabilities and OWASP categories as Arrow IPC stream or Parquet file.
+       ---
+       parameters:
+         - name: format
+           in: query
+           type: string
+           enum: ["arrow", "parquet"]
+           required: false
+           default: arrow
+           description: Arrow IPC stream or Parquet file.
+         - name: scan_url
+           in: query
+           type: string
+           required: false
+           description: The URL of the scans to export.
+         - name: start_date
+           in: query
+           type: string
+           required: false
+           description: "Only export scans on or after this date (format: YYYY-MM-DD)."
+         - name: end_date
+           in: query
+           type: string
+           required: false
+           description: "Only export scans on or before this date (format: YYYY-MM-DD)."
+         - name: batch_size
+           in: query
+           type: integer
+           required: false
+           default: 50000
+           description: Rows per record batch (Arrow) or row group (Parquet).
+       produces:
+         - application/vnd.apache.arrow.stream
+         - application/vnd.apache.parquet
+       responses:
+         200:
+           description: "Typed columns: scan_id, scan_date, scan_url, tool_name, scan_active, vuln_id, vuln_name, vuln_number, prio_id, prio_name, vuln_new, vuln_description, owasp_id, owasp_name."
+         400:
+           description: Bad Request. The format is not supported.
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "Unsupported format"
+       """
+    export_format = request.args.get('format', 'arrow')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "Unsupported format"}), 400
+
+    try:
+        batch_size = int(request.args.get('batch_size', 50000))
+    except ValueError:
+        return jsonify({"error": "batch_size must be an integer"}), 400
+
+    filters = {
+        'scan_url': request.args.get('scan_url'),
+        'start_date': request.args.get('start_date'),
+        'end_date': request.args.get('end_date'),
+    }
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+    cursor.close()
+
+    def generate():
+        try:
+            yield from stream_export(iter_record_batches(connection, batch_size, **filters), export_format)
+        finally:
+            connection.close()
+
+    extension = 'arrows' if export_format == 'arrow' else 'parquet'
+    return Response(generate(), mimetype=EXPORT_FORMATS[export_format],
+                    headers={"Content-Disposition": f"attachment; filename=vulnerabilities.{extension}"})
+
+@app.route('/risk_ranking', methods=['GET'])
+def get_risk_ranking():
+    """
+       Ranks the scanned APIs by their Riskometer score for one or all users.
+       ---
+       parameters:
+         - name: format
+           in: query
+           type: string
+           required: false
+           description: "columnar returns one list per field with repeated strings dictionary encoded (also with Accept: application/vnd.dashboard.columnar+json)."
+         - name: user_id
+           in: query
+           type: integer
+           required: false
+           description: Only rank with the weights of this user. Without it every user with weights is ranked.
+         - name: latest
+           in: query
+           type: boolean
+           required: false
+           default: true
+           description: Rank the latest scan of every URL (true) or every single scan (false).
+         - name: limit
+           in: query
+           type: integer
+           required: false
+           description: Return only the top N entries per user.
+       responses:
+         200:
+           description: Scans ranked by risk score (0-100) per user, highest first.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 user_id:
+                   type: integer
+                   example: 1
+                 rank:
+                   type: integer
+                   example: 1
+                 scan_url:
+                   type: string
+                   example: "http://example.com"
+                 scan_id:
+                   type: integer
+                   example: 12
+                 scan_date:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:39:42"
+                 vuln_count:
+                   type: integer
+                   example: 7
+                   description: Number of distinct vulnerabilities in the scan.
+                 risk_score:
+                   type: number
+                   example: 42.5
+         400:
+           description: Bad Request. user_id or limit is not a number.
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "user_id and limit must be integers"
+       """
+    try:
+        user_id = request.args.get('user_id', type=int)
+        limit = request.args.get('limit', type=int)
+        if request.args.get('user_id') and user_id is None or request.args.get('limit') and limit is None:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "user_id and limit must be integers"}), 400
+    latest = request.args.get('latest', 'true').lower() != 'false'
+
+    connection_1, cursor_1 = connect_to_db(db_params_1)
+    if connection_1 is None or cursor_1 is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        risk_engine.ensure_loaded(cursor_1)
+        profiles = weight_profiles.get([user_id] if user_id is not None else None)
+        user_ids, weights = weight_matrix(profile_weight_rows(profiles), load_owasp_ids(cursor_1))
+        ranking = risk_engine.ranking(user_ids, weights, latest_only=latest, limit=limit)
+
+        data = []
+        for row in ranking.itertuples(index=False):
+            ranked_scan = {
+                "user_id": int(row.user_id),
+                "rank": int(row.rank),
+                "scan_url": row.scan_url,
+                "scan_id": int(row.scan_id),
+                "scan_date": row.scan_date.to_pydatetime(),
+                "vuln_count": int(row.vuln_count),
+                "risk_score": round(float(row.risk_score), 2),
+            }
+            data.append(ranked_scan)
+
+        return rows_response(data)
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        cursor_1.close()
+        connection_1.close()
+
+@app.route('/risk_timeline', methods=['GET'])
+def get_risk_timeline():
+    """
+       Retrieves the stored Riskometer scores of all scans of a URL for one user.
+       ---
+       parameters:
+         - name: format
+           in: query
+           type: string
+           required: false
+           description: "columnar returns one list per field with repeated strings dictionary encoded (also with Accept: application/vnd.dashboard.columnar+json)."
+         - name: scan_url
+           in: query
+           type: string
+           required: true
+           description: The URL of the scans.
+         - name: user_id
+           in: query
+           type: integer
+           required: false
+           default: 1
+           description: The user whose weights the scores are based on.
+         - name: bucket
+           in: query
+           type: string
+           required: false
+           enum: [scan, day, week, month]
+           description: "scan (default) returns every scan, day/week/month the average per period (scan_id is the
+             latest scan of the period, scan_date the start of the period)."
+         - name: max_points
+           in: query
+           type: integer
+           required: false
+           description: Reduces the timeline to at most this many points (at least 3) that keep the shape of the risk score line.
+       responses:
+         200:
+           description: Risk score (0-100) per scan, oldest first.
+           schema:
+             type: array
+             items:
+               type: object
+               properties:
+                 scan_id:
+                   type: integer
+                   example: 12
+                 scan_date:
+                   type: string
+                   example: "Thu, 22 Aug 2024 08:39:42"
+                 vuln_count:
+                   type: integer
+                   example: 7
+                 risk_score:
+                   type: number
+                   example: 42.5
+         400:
+           description: Bad Request. The `scan_url` parameter is missing.
+           schema:
+             type: object
+             properties:
+               error:
+                 type: string
+                 example: "Missing scan_url parameter"
+       """
+    scan_url = request.args.get('scan_url')
+    if not scan_url:
+        return jsonify({"error": "Missing scan_url parameter"}), 400
+    user_id = request.args.get('user_id', 1, type=int)
+    bucket = request.args.get('bucket', 'scan')
+    max_points = request.args.get('max_points', type=int)
+    if bucket not in TREND_BUCKETS:
+        return jsonify({"error": "bucket must be one of scan, day, week, month"}), 400
+    if request.args.get('max_points') and (max_points is None or max_points < 3):
+        return jsonify({"error": "max_points must be an integer of at least 3"}), 400
+
+    connection, cursor = connect_to_db(db_params_1)
+    if connection is None or cursor is None:
+        return jsonify({"error": "Unable to connect to the database"})
+
+    try:
+        if bucket == 'scan':
+            cursor.execute("""
+                SELECT scan_id, scan_date, vuln_count, risk_score
+                FROM scan_risk_scores
+                WHERE user_id = %s AND scan_url = %s
+                ORDER BY scan_date ASC;
+            """, (user_id, scan_url))
+        else:
+            cursor.execute("""
+                SELECT (array_agg(scan_id ORDER BY scan_date DESC))[1], date_trunc(%s, scan_date) AS period,
+                       ROUND(AVG(vuln_count))::integer, AVG(risk_score)
+                FROM scan_risk_scores
+                WHERE user_id = %s AND scan_url = %s
+                GROUP BY period
+                ORDER BY period ASC;
+            """, (bucket, user_id, scan_url))
+        rows = cursor.fetchall()
+        if max_points:
+            rows = [rows[index] for index in lttb_indices([row[1].timestamp() for row in rows],
+                                                         [row[3] for row in rows], max_points)]
+
+        data = []
+        for row in rows:
+            scored_scan = {
+                "scan_id": row[0],
+                "scan_date": row[1],
+                "vuln_count": row[2],
+                "risk_score": round(row[3], 2),
+            }
+            data.append(scored_scan)
+
+        return rows_response(data)
+
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
+
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+# Names of owasp_categories in api_dashboard by their lower-cased form, read again when a save
+# names an unknown one
+owasp_category_names = {}
+
+def canonical_owasp_categories(categories):
+    """
+    {submitted name: name in owasp_categories} for the categories matching one case-insensitively,
+    None without a database connection.
+    """
+    global owasp_category_names
+    if not {owasp_cat.lower() for owasp_cat in categories} <= owasp_category_names.keys():
+        connection, cursor = connect_to_db(db_params_1)
+        if cursor is None:
+            return None
+        try:
+            cursor.execute("SELECT owasp_name FROM owasp_categories;")
+            owasp_category_names = {owasp_name.lower(): owasp_name for owasp_name, in cursor.fetchall()}
+        finally:
+            cursor.close()
+            connection.close()
+    return {owasp_cat: owasp_category_names[owasp_cat.lower()] for owasp_cat in categories
+            if owasp_cat.lower() in owasp_category_names}
+
+def parse_customisations(data):
+    """
+    Validates the body of POST /customisation. Returns ([(user_id, owasp_cat, weight), ...],
+    {user_id: expected version}) or raises ValueError with the message for the client.
+    """
+    if not isinstance(data, list) or not data:
+        raise ValueError("Expected a non-empty list of customisations")
+    weights = []
+    expected_versions = {}
+    seen = set()
+    for customisation in data:
+        if not isinstance(customisation, dict):
+            raise ValueError("Every customisation must be an object")
+        try:
+            user_id = int(customisation['user_id'])
+            owasp_cat = customisation['owasp_cat']
+            weight = customisation['weight']
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Every customisation needs user_id, owasp_cat and weight")
+        if not isinstance(owasp_cat, str) or not 0 < len(owasp_cat) <= 100:
+            raise ValueError("owasp_cat must be a string of up to 100 characters")
+        if isinstance(weight, bool) or not isinstance(weight, int) or not 0 <= weight <= 100:
+            raise ValueError("weight must be an integer from 0 to 100")
+        if (user_id, owasp_cat.lower()) in seen:
+            raise ValueError(f"{owasp_cat} is given twice for user {user_id}")
+        seen.add((user_id, owasp_cat.lower()))
+
+        version = customisation.get('version')
+        if version is not None:
+            if isinstance(version, bool) or not isinstance(version, int) or version < 0:
+                raise ValueError("version must be a non-negative integer")
+            if expected_versions.setdefault(user_id, version) != version:
+                raise ValueError(f"The customisations of user {user_id} have different versions")
+        weights.append((user_id, owasp_cat, weight))
+    return weights, expected_versions
+
 @app.route('/customisation', methods=['GET'])
 def get_customisation():
     """
-       Retrieves customisation data based on user ID and/or OWASP category.
+       Retrieves the weight profile of one user, optionally only one OWASP category.
        ---
        parameters:
          - name: user_id
            in: query
            required: false
-           description: The ID of the user to filter the customisation data.
+           default: 1
+           description: The ID of the user whose weights are returned.
            schema:
-             type: string
-             example: "user_123"
+             type: integer
+             example: 1
          - name: owasp_cat
            in: query
            required: false
@@ -658,6 +2549,12 @@ def get_customisation():
                     type: number
                     description: The weight assigned to the OWASP category for the user.
                     example: 10
+                version:
+                    type: integer
+                    description: The version of the user's weight profile, sent back with POST /customisation.
+                    example: 3
+         304:
+           description: Not Modified. The profiles did not change since the ETag given in If-None-Match.
          400:
            description: Bad Request. There was an issue with the request parameters.
            content:
@@ -679,60 +2576,39 @@ def get_customisation():
                      type: string
                      example: "Error executing query: [detailed error message]"
        """
-    connection, cursor = connect_to_db(db_params_2)
-    if connection is None or cursor is None:
-        return jsonify({"error": "Unable to connect to the database"})
-
     try:
-        user_id = request.args.get('user_id')
-        owasp_cat = request.args.get('owasp_cat')
-
-        base_query = "SELECT * FROM riskometer_weights"
-        conditions = []
-        params = []
-
-        if user_id:
-            conditions.append("user_id = %s")
-            params.append(user_id)
+        user_id = request.args.get('user_id', type=int)
+        if request.args.get('user_id') and user_id is None:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "user_id must be an integer"}), 400
+    if user_id is None:
+        user_id = 1
+    owasp_cat = request.args.get('owasp_cat')
 
-        if owasp_cat:
-            conditions.append("owasp_cat = %s")
-            params.append(owasp_cat)
-
-        if conditions:
-            base_query += " WHERE " + " AND ".join(conditions)
-
-        order_by = "owasp_cat"
-        base_query += f" ORDER BY {order_by};"
-
-        cursor.execute(base_query, params)
-        rows = cursor.fetchall()
+    try:
+        profiles = weight_profiles.get([user_id])
+    except Exception as e:
+        return jsonify({"error": f"Error executing query: {e}"})
 
-        data = []
-        for row in rows:
+    data = []
+    for profile_user_id, (version, weights) in sorted(profiles.items()):
+        for category, weight in weights:
+            if owasp_cat and category != owasp_cat:
+                continue
             found_customisation = {
-                "user_id": row[0],
-                "owasp_cat": row[1],
-                "weight": row[2],
+                "user_id": profile_user_id,
+                "owasp_cat": category,
+                "weight": weight,
+                "version": version,
             }
             data.append(found_customisation)
 
-        def extract_number(owasp_cat):
-            match = re.search(r'\d+', owasp_cat)
-            return int(match.group()) if match else float('inf')
-
-        sorted_data = sorted(data, key=lambda x: extract_number(x['owasp_cat']))
-
-        return jsonify(sorted_data)
-
-    except Exception as e:
-        return jsonify({"error": f"Error executing query: {e}"})
-
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+    # The versions of the returned profiles, unchanged profiles are answered with 304 Not Modified
+    versions = ','.join(f"{profile_user_id}:{version}" for profile_user_id, (version, _) in sorted(profiles.items()))
+    response = jsonify(data)
+    response.set_etag(hashlib.sha1(f"{versions}|{owasp_cat or ''}".encode()).hexdigest())
+    return response.make_conditional(request)
 
 @app.route('/customisation', methods=['POST'])
 def update_customisation():
@@ -758,20 +2634,47 @@ def update_customisation():
                     description: The OWASP category to update.
                     example: "API1 - Broken Object Level Authorization"
                   weight:
-                    type: number
-                    description: The new weight to assign to the OWASP category for the user.
+                    type: integer
+                    description: The new weight (0-100) to assign to the OWASP category for the user.
                     example: 15
+                  version:
+                    type: integer
+                    required: false
+                    description: The profile version the weights were read at (from GET /customisation).
+                      The save is refused with 409 if the profile was changed since.
+                    example: 3
         responses:
           200:
-            description: Successfully updated customisation data.
+            description: Successfully saved all weights in one transaction, missing categories are added.
             schema:
-             type: array
-             items:
-               type: object
-               properties:
-                    status:
-                      type: string
-                      example: "success"
+              type: object
+              properties:
+                status:
+                  type: string
+                  example: "success"
+                versions:
+                  type: object
+                  description: The new profile version per user_id.
+                  example: {"1": 4}
+          409:
+            description: Conflict. A profile was changed by someone else, nothing was saved.
+            schema:
+              type: object
+              properties:
+                error:
+                  type: string
+                  example: "The weight profile was changed in the meantime, reload it and try again"
+                conflicts:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      user_id:
+                        type: integer
+                        example: 1
+                      version:
+                        type: integer
+                        example: 4
           400:
             description: Bad Request. The request data was invalid.
             content:
@@ -793,23 +2696,46 @@ def update_customisation():
                       type: string
                       example: "Error executing query: [detailed error message]"
         """
-    data = request.json
+    try:
+        weights, expected_versions = parse_customisations(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    submitted = {owasp_cat for _, owasp_cat, _ in weights}
+    canonical = canonical_owasp_categories(submitted)
+    if canonical is None:
+        return jsonify({"error": "Unable to connect to the database"})
+    unknown = submitted - canonical.keys()
+    if unknown:
+        return jsonify({"error": f"Unknown OWASP category: {', '.join(sorted(unknown))}"}), 400
+    # Stored with the spelling of owasp_categories, the primary key of riskometer_weights is case-sensitive
+    weights = [(user_id, canonical[owasp_cat], weight) for user_id, owasp_cat, weight in weights]
+
     connection, cursor = connect_to_db(db_params_2)
     if connection is None or cursor is None:
         return jsonify({"error": "Unable to connect to the database"})
 
     try:
-        for customisation in data:
-            query = """
-                UPDATE riskometer_weights
-                SET weight = %s
-                WHERE user_id = %s AND owasp_cat = %s;
-            """
-            cursor.execute(query, (customisation['weight'], customisation['user_id'], customisation['owasp_cat']))
+        results = save_weight_profiles(cursor, weights, expected_versions)
+        unknown = [user_id for user_id, known, _, _ in results if not known]
+        conflicts = [{"user_id": user_id, "version": current} for user_id, known, saved, current in results
+                     if known and saved is None]
+        if unknown or conflicts:
+            connection.rollback()
+            if unknown:
+                return jsonify({"error": f"Unknown user_id: {', '.join(map(str, unknown))}"}), 400
+            return jsonify({"error": "The weight profile was changed in the meantime, reload it and try again",
+                            "conflicts": conflicts}), 409
         connection.commit()
-        return jsonify({"status": "success"})
+
+        versions = {user_id: saved for user_id, _, saved, _ in results}
+        # This worker drops its copies right away, the others when the notification arrives
+        weight_profiles.invalidate(versions)
+        for user_id in versions:
+            schedule_rescore(user_id)
+        return jsonify({"status": "success", "versions": versions})
 
     except Exception as e:
+        connection.rollback()
         return jsonify({"error": f"Error executing query: {e}"})
 
     finally:
@@ -819,4 +2745,9 @@ def update_customisation():
             connection.close()
 
 if __name__ == '__main__':
+    # With the debug reloader only the serving child process starts the daemons and the scheduler right away
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_zap_pool()
+        start_scan_scheduler()
+        latest_scan_refresher.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,176 @@
+import argparse
+import os
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask.cli import load_dotenv
+
+load_dotenv()
+
+# Connection parameters
+db_params = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+# Strings that repeat on almost every row are dictionary encoded, so each value is stored once per batch
+repeated_string = pa.dictionary(pa.int32(), pa.string())
+
+EXPORT_SCHEMA = pa.schema([
+    ('scan_id', pa.int32()),
+    ('scan_date', pa.timestamp('us')),
+    ('scan_url', repeated_string),
+    ('tool_name', repeated_string),
+    ('scan_active', pa.bool_()),
+    ('vuln_id', pa.int32()),
+    ('vuln_name', repeated_string),
+    ('vuln_number', pa.int32()),
+    ('prio_id', pa.int8()),
+    ('prio_name', repeated_string),
+    ('vuln_new', pa.bool_()),
+    ('vuln_description', pa.string()),
+    ('owasp_id', pa.int8()),
+    ('owasp_name', repeated_string),
+])
+
+EXPORT_FORMATS = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+export_query = """
+    SELECT s.scan_id, s.scan_date, s.scan_url, t.tool_name, s.scan_active,
+           v.vuln_id, v.vuln_name, v.vuln_number, p.prio_id, p.prio_name, v.vuln_new, v.vuln_description,
+           o.owasp_id, o.owasp_name
+    FROM scans s
+    JOIN tools t ON t.tool_id = s.scan_tool
+    JOIN vulnerabilities v ON s.scan_id = v.vuln_scan AND s.scan_date = v.vuln_scan_date
+    JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date
+    JOIN owasp_categories o ON o.owasp_id = vo.owasp_id
+    JOIN priorities p ON p.prio_id = v.vuln_priority
+    WHERE 1=1
+"""
+
+
+def connect_to_db():
+    try:
+        connection = psycopg2.connect(**db_params)
+        print("Connected to the database!")
+        return connection
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def build_export_query(scan_url=None, start_date=None, end_date=None):
+    query = export_query
+    params = []
+    if scan_url:
+        query += " AND s.scan_url = %s"
+        params.append(scan_url)
+    # Bounds on every partitioned table so only the requested months are read
+    if start_date:
+        query += " AND s.scan_date >= %s::date AND v.vuln_scan_date >= %s::date AND vo.vuln_scan_date >= %s::date"
+        params.extend([start_date] * 3)
+    if end_date:
+        query += " AND s.scan_date < %s::date + 1 AND v.vuln_scan_date < %s::date + 1 AND vo.vuln_scan_date < %s::date + 1"
+        params.extend([end_date] * 3)
+    query += " ORDER BY s.scan_date, s.scan_id, v.vuln_id"
+    return query, params
+
+
+def iter_record_batches(connection, batch_size=50000, **filters):
+    """Yields the export join as Arrow record batches, reading it through a server side cursor."""
+    query, params = build_export_query(**filters)
+    cursor = connection.cursor(name='analytics_export')
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            arrays = []
+            for column, field in zip(columns, EXPORT_SCHEMA):
+                if pa.types.is_dictionary(field.type):
+                    arrays.append(pa.array(column, pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(column, field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+    finally:
+        cursor.close()
+
+
+class ChunkSink:
+    """Write-only file object that hands out everything written since the last drain()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export(batches, export_format):
+    """Encodes record batches as an Arrow IPC stream or a Parquet file and yields the bytes as they are produced."""
+    sink = ChunkSink()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(sink, EXPORT_SCHEMA, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, EXPORT_SCHEMA)
+
+    for batch in batches:
+        writer.write_batch(batch)
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exports the scan/vulnerability/OWASP join as Arrow IPC stream or Parquet.")
+    parser.add_argument('output', help="Target file, the format follows the extension (.arrow or .parquet).")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default=None)
+    parser.add_argument('--scan-url', default=None)
+    parser.add_argument('--start-date', default=None, help="Format: YYYY-MM-DD")
+    parser.add_argument('--end-date', default=None, help="Format: YYYY-MM-DD")
+    parser.add_argument('--batch-size', type=int, default=50000, help="Rows per record batch / row group.")
+    args = parser.parse_args()
+
+    export_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'arrow')
+
+    connection = connect_to_db()
+    if connection is None:
+        exit(1)
+
+    with open(args.output, 'wb') as file:
+        batches = iter_record_batches(connection, args.batch_size, scan_url=args.scan_url,
+                                      start_date=args.start_date, end_date=args.end_date)
+        for data in stream_export(batches, export_format):
+            file.write(data)
+    connection.close()
+    print(f"Exported {args.output} ({os.path.getsize(args.output)} bytes)")
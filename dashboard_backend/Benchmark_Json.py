@@ -0,0 +1,82 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from Json_Provider import OrjsonProvider
+
+COLUMNS = ['scan_id', 'scan_date', 'scan_url', 'tool_name', 'vuln_name', 'vuln_number', 'prio_name',
+           'owasp_name', 'vuln_id', 'scan_active', 'vuln_description', 'vuln_new']
+
+
+def synthetic_rows(count):
+    """Rows shaped like the result of the /vulnerabilities query."""
+    start = datetime(2024, 1, 1, 8, 30)
+    return [(i // 12, start + timedelta(hours=i // 12), f"http://api{i % 50}.example.com:80", 'ZAP',
+             f"Vulnerability {i % 40}", i % 7, ['Informational', 'Low', 'Medium', 'High'][i % 4],
+             f"API{i % 10 + 1} - OWASP category {i % 10 + 1}", i, i % 3 == 0,
+             f"<p>Description of vulnerability {i % 40}, repeated for every finding.</p>" * 3, i % 5 == 0)
+            for i in range(count)]
+
+
+def hand_built(rows):
+    """The dicts as the routes built them before, one key at a time."""
+    data = []
+    for row in rows:
+        data.append({
+            "scan_id": row[0],
+            "scan_date": row[1],
+            "scan_url": row[2],
+            "tool_name": row[3],
+            "vuln_name": row[4],
+            "vuln_number": row[5],
+            "prio_name": row[6],
+            "owasp_name": row[7],
+            "vuln_id": row[8],
+            "scan_active": row[9],
+            "vuln_description": row[10],
+            "vuln_new": row[11]
+        })
+    return data
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the orjson provider against Flask's default JSON provider.")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    orjson_provider = OrjsonProvider(app)
+    rows = synthetic_rows(args.rows)
+    print(f"{args.rows} rows")
+
+    with app.app_context():
+        results = {}
+        for debug in (False, True):
+            app.debug = debug
+            mode = 'indented' if debug else 'compact'
+            default_time, default_body = timed(lambda: default_provider.response(hand_built(rows)).get_data(), args.repeat)
+            orjson_time, orjson_body = timed(lambda: orjson_provider.response(hand_built(rows)).get_data(), args.repeat)
+            zip_time, zip_body = timed(
+                lambda: orjson_provider.response([dict(zip(COLUMNS, row)) for row in rows]).get_data(), args.repeat)
+            print(f"{mode:>8} default provider, hand-built dicts: {default_time * 1000:10.1f} ms ({len(default_body)} bytes)")
+            print(f"{mode:>8} orjson provider, hand-built dicts:  {orjson_time * 1000:10.1f} ms")
+            print(f"{mode:>8} orjson provider, dict(zip()) rows:  {zip_time * 1000:10.1f} ms")
+            results[mode] = default_body == orjson_body == zip_body
+
+    for mode, identical in results.items():
+        print(f"{mode} output byte-for-byte identical: {identical}")
@@ -0,0 +1,125 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from Manage_Partitions import connect_to_db, ensure_month_partitions
+
+BENCH_URL = "https://benchmark.example.com:443"
+
+trend_query = """
+    SELECT scan_date, owasp_name, COUNT(v.vuln_id) as vuln_count, scan_active
+    FROM scans s
+    JOIN vulnerabilities v ON s.scan_id = v.vuln_scan AND s.scan_date = v.vuln_scan_date
+    JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date
+    JOIN owasp_categories o ON o.owasp_id = vo.owasp_id
+    WHERE s.scan_url = %(url)s {bounds}
+    GROUP BY scan_date, owasp_name, scan_active
+    ORDER BY scan_date ASC
+"""
+
+trend_bounds = """
+      AND s.scan_date >= %(start)s AND v.vuln_scan_date >= %(start)s AND vo.vuln_scan_date >= %(start)s
+"""
+
+new_vulnerability_query = """
+    SELECT v.vuln_id
+    FROM vulnerabilities v
+    JOIN scans s ON v.vuln_scan = s.scan_id
+    WHERE s.scan_url = %(url)s AND s.scan_date < %(now)s AND s.scan_date >= %(start)s AND v.vuln_name = %(name)s
+      {bounds}
+    ORDER BY s.scan_date DESC
+    LIMIT 1
+"""
+
+new_vulnerability_bounds = "AND v.vuln_scan_date < %(now)s AND v.vuln_scan_date >= %(start)s"
+
+
+def generate_history(connection, days):
+    """Inserts one scan per day for BENCH_URL, each with five vulnerabilities mapped to OWASP categories."""
+    cursor = connection.cursor()
+    cursor.execute("INSERT INTO tools (tool_name) VALUES ('Benchmark Scanner') RETURNING tool_id;")
+    tool_id = cursor.fetchone()[0]
+
+    start = datetime.now() - timedelta(days=days)
+    for day in range(days):
+        scan_date = start + timedelta(days=day)
+        ensure_month_partitions(cursor, scan_date)
+        cursor.execute("""
+            INSERT INTO scans (scan_tool, scan_date, scan_url, scan_active) VALUES (%s, %s, %s, FALSE)
+            RETURNING scan_id;
+        """, (tool_id, scan_date, BENCH_URL))
+        scan_id = cursor.fetchone()[0]
+        vuln_ids = execute_values(cursor, """
+            INSERT INTO vulnerabilities (vuln_name, vuln_priority, vuln_description, vuln_number, vuln_scan, vuln_scan_date, vuln_new)
+            VALUES %s RETURNING vuln_id;
+        """, [(f"Benchmark Finding {n}", random.randint(0, 3), "Synthetic finding", 1, scan_id, scan_date, False)
+              for n in range(5)], fetch=True)
+        execute_values(cursor, "INSERT INTO vuln_owasp (vuln_id, owasp_id, vuln_scan_date) VALUES %s;",
+                       [(vuln_id, random.randint(1, 10), scan_date) for (vuln_id,) in vuln_ids])
+    connection.commit()
+    cursor.close()
+    print(f"Generated {days} daily scans for {BENCH_URL}")
+
+
+def remove_history(connection):
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM scans WHERE scan_url = %s;", (BENCH_URL,))
+    cursor.execute("DELETE FROM tools WHERE tool_name = 'Benchmark Scanner';")
+    connection.commit()
+    cursor.close()
+    print(f"Removed benchmark history for {BENCH_URL}")
+
+
+def scanned_partitions(plan, found=None):
+    if found is None:
+        found = set()
+    if 'Relation Name' in plan:
+        found.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        scanned_partitions(child, found)
+    return found
+
+
+def explain(cursor, label, query, params):
+    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query, params)
+    result = cursor.fetchone()[0][0]
+    partitions = sorted(p for p in scanned_partitions(result['Plan']) if '_y' in p)
+    print(f"{label:<45} {result['Execution Time']:>10.2f} ms  {len(partitions):>3} partitions")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Shows partition pruning on the trend and new vulnerability queries.")
+    parser.add_argument('--generate', type=int, metavar='DAYS',
+                        help="Insert a synthetic daily scan history of DAYS days before measuring.")
+    parser.add_argument('--cleanup', action='store_true', help="Remove the synthetic history afterwards.")
+    parser.add_argument('--url', default=BENCH_URL, help="scan_url the queries are run for.")
+    args = parser.parse_args()
+
+    connection = connect_to_db()
+    if connection is None:
+        exit(1)
+
+    if args.generate:
+        generate_history(connection, args.generate)
+
+    now = datetime.now()
+    params = {
+        'url': args.url,
+        'now': now,
+        'start': now - timedelta(days=30),
+        'name': "Benchmark Finding 0",
+    }
+
+    cursor = connection.cursor()
+    explain(cursor, "trend, full history", trend_query.format(bounds=""), params)
+    explain(cursor, "trend, last 30 days", trend_query.format(bounds=trend_bounds), params)
+    explain(cursor, "new vulnerability, scans bounded only", new_vulnerability_query.format(bounds=""), params)
+    explain(cursor, "new vulnerability, both tables bounded",
+            new_vulnerability_query.format(bounds=new_vulnerability_bounds), params)
+    cursor.close()
+
+    if args.cleanup:
+        remove_history(connection)
+    connection.close()
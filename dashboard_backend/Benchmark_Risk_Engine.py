@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from Risk_Engine import MAX_PRIORITY, MAX_WEIGHT, SCALING_STEP, RiskEngine
+
+
+def synthetic_matrix(scans, urls, seed=0):
+    """Random vulnerability matrix: 1-15 vulnerabilities per scan, each mapped to 1-2 OWASP categories."""
+    rng = np.random.default_rng(seed)
+    vulns_per_scan = rng.integers(1, 16, scans)
+    vuln_scan = np.repeat(np.arange(1, scans + 1), vulns_per_scan)
+    vuln_ids = np.arange(1, len(vuln_scan) + 1)
+    vuln_priority = rng.integers(0, 4, len(vuln_ids))
+
+    owasp_per_vuln = rng.integers(1, 3, len(vuln_ids))
+    rows = np.repeat(np.arange(len(vuln_ids)), owasp_per_vuln)
+    start = pd.Timestamp('2020-01-01')
+    return pd.DataFrame({
+        'scan_id': vuln_scan[rows],
+        'scan_url': (vuln_scan[rows] % urls).astype(str),
+        'scan_date': start + pd.to_timedelta(vuln_scan[rows], unit='h'),
+        'vuln_id': vuln_ids[rows],
+        'vuln_priority': vuln_priority[rows],
+        'owasp_id': rng.integers(0, 11, len(rows)),
+    })
+
+
+def riskometer_per_scan(frame, weights):
+    """Straight port of the Tachometer.jsx loop, one scan and one profile at a time."""
+    scores = {}
+    for scan_id, scan in frame.groupby('scan_id', sort=True):
+        highest = {}
+        priority = {}
+        for vuln_id, vuln_priority, owasp_id in zip(scan['vuln_id'], scan['vuln_priority'], scan['owasp_id']):
+            highest[vuln_id] = max(highest.get(vuln_id, 0), weights[owasp_id])
+            priority[vuln_id] = vuln_priority + 1
+        base = sum(priority[vuln_id] * weight for vuln_id, weight in highest.items())
+        count = len(highest)
+        scores[scan_id] = base * (1 + (count - 1) * SCALING_STEP) / (count * MAX_PRIORITY * MAX_WEIGHT) * 100
+    return scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times the vectorised Riskometer against the per-scan loop.")
+    parser.add_argument('--scans', type=int, default=100000)
+    parser.add_argument('--urls', type=int, default=2000)
+    parser.add_argument('--profiles', type=int, default=100, help="Number of user weight profiles.")
+    parser.add_argument('--loop-scans', type=int, default=5000,
+                        help="Scans scored with the per-scan loop for the comparison (extrapolated).")
+    args = parser.parse_args()
+
+    frame = synthetic_matrix(args.scans, args.urls)
+    weights = np.random.default_rng(1).integers(0, MAX_WEIGHT + 1, (args.profiles, 11)).astype(np.float64)
+    print(f"{args.scans} scans, {frame['vuln_id'].nunique()} vulnerabilities, {len(frame)} rows, {args.profiles} profiles")
+
+    engine = RiskEngine()
+    started = time.perf_counter()
+    engine.load(frame)
+    loaded = time.perf_counter()
+    scores = engine.score(weights)
+    scored = time.perf_counter()
+    ranking = engine.ranking(list(range(args.profiles)), weights, limit=100)
+    ranked = time.perf_counter()
+
+    print(f"load matrix:                 {(loaded - started) * 1000:10.1f} ms")
+    print(f"score all scans x profiles:  {(scored - loaded) * 1000:10.1f} ms")
+    print(f"top 100 URLs incl. scoring:  {(ranked - scored) * 1000:10.1f} ms ({len(ranking)} rows)")
+
+    subset = frame[frame['scan_id'] <= args.loop_scans]
+    started = time.perf_counter()
+    expected = riskometer_per_scan(subset, weights[0])
+    loop_time = time.perf_counter() - started
+    per_profile = loop_time * args.scans / args.loop_scans
+    print(f"per-scan loop, one profile:  {per_profile * 1000:10.1f} ms (extrapolated from {args.loop_scans} scans)")
+    print(f"per-scan loop, all profiles: {per_profile * args.profiles * 1000:10.1f} ms (extrapolated)")
+
+    vectorised = scores[0][:len(expected)]
+    assert np.allclose(vectorised, [expected[scan_id] for scan_id in sorted(expected)]), "scores differ"
+    print("Vectorised scores match the per-scan loop")
@@ -0,0 +1,173 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+from flask.cli import load_dotenv
+
+from Manage_Partitions import PARTITION_LOCK_KEY
+
+load_dotenv()
+
+# Connection parameters
+db_params = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+# The ingest compares new findings with the scans of the last 30 days, so these have to stay detailed
+MIN_KEEP_DAYS = 30
+
+# Consecutive batches that may run into locked scans before the job gives up
+MAX_LOCK_RETRIES = 5
+
+
+def connect_to_db():
+    try:
+        connection = psycopg2.connect(**db_params)
+        print("Connected to the database!")
+        return connection
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def compaction_cutoff(keep_days):
+    # Cut at midnight so a day is either fully detailed or fully aggregated
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=max(keep_days, MIN_KEEP_DAYS))
+
+
+def compact_batch(connection, cutoff, batch_size, skipped):
+    """
+    Rolls up to batch_size scans older than cutoff into scan_daily_aggregates and
+    scan_daily_counts and deletes them. Every batch is its own short transaction. Scans locked
+    by someone else are skipped and lock_timeout makes the job give way instead of queueing in
+    front of the API and the ingest, the scans of a batch that timed out are added to skipped
+    and left for the next run. Returns the number of compacted scans, -1 on a lock timeout.
+    """
+    cursor = connection.cursor()
+    scan_ids = []
+    try:
+        cursor.execute("SET LOCAL lock_timeout = '2s';")
+        cursor.execute("""
+            SELECT scan_id FROM scans
+            WHERE scan_date < %s AND NOT (scan_id = ANY(%s))
+            ORDER BY scan_date
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED;
+        """, (cutoff, list(skipped), batch_size))
+        scan_ids = [row[0] for row in cursor.fetchall()]
+        if not scan_ids:
+            connection.rollback()
+            return 0
+
+        cursor.execute("""
+            INSERT INTO scan_daily_aggregates (scan_url, scan_day, scan_active, owasp_id, vuln_count)
+            SELECT s.scan_url, s.scan_date::date, COALESCE(s.scan_active, FALSE), vo.owasp_id, COUNT(v.vuln_id)
+            FROM scans s
+            JOIN vulnerabilities v ON s.scan_id = v.vuln_scan AND s.scan_date = v.vuln_scan_date
+            JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date
+            WHERE s.scan_id = ANY(%s) AND s.scan_date < %s
+              AND v.vuln_scan_date < %s AND vo.vuln_scan_date < %s
+            GROUP BY s.scan_url, s.scan_date::date, COALESCE(s.scan_active, FALSE), vo.owasp_id
+            ON CONFLICT (scan_url, scan_day, scan_active, owasp_id)
+            DO UPDATE SET vuln_count = scan_daily_aggregates.vuln_count + EXCLUDED.vuln_count;
+        """, (scan_ids, cutoff, cutoff, cutoff))
+
+        # Scans without findings have no aggregate, the counts keep their days in the trend
+        cursor.execute("""
+            INSERT INTO scan_daily_counts (scan_url, scan_day, scan_active, scan_count)
+            SELECT scan_url, scan_date::date, COALESCE(scan_active, FALSE), COUNT(*)
+            FROM scans
+            WHERE scan_id = ANY(%s) AND scan_date < %s
+            GROUP BY scan_url, scan_date::date, COALESCE(scan_active, FALSE)
+            ON CONFLICT (scan_url, scan_day, scan_active)
+            DO UPDATE SET scan_count = scan_daily_counts.scan_count + EXCLUDED.scan_count;
+        """, (scan_ids, cutoff))
+
+        # The tombstones for GET /changes take their number under the partition lock like the ingest
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_KEY,))
+        cursor.execute("""
+            INSERT INTO deleted_scans (scan_id, scan_date, scan_url, reason)
+            SELECT scan_id, scan_date, scan_url, 'compacted' FROM scans
+            WHERE scan_id = ANY(%s) AND scan_date < %s;
+        """, (scan_ids, cutoff))
+
+        # vulnerabilities and vuln_owasp follow through ON DELETE CASCADE, the risk scores
+        # cannot be recomputed from the aggregates and are removed with their scans
+        cursor.execute("DELETE FROM scan_risk_scores WHERE scan_id = ANY(%s);", (scan_ids,))
+        cursor.execute("DELETE FROM scans WHERE scan_id = ANY(%s) AND scan_date < %s;", (scan_ids, cutoff))
+        connection.commit()
+        return len(scan_ids)
+    except psycopg2.errors.LockNotAvailable:
+        connection.rollback()
+        skipped.update(scan_ids)
+        print(f"Scans are locked by another transaction, skipping {len(scan_ids)} of them")
+        return -1
+    except Exception as e:
+        connection.rollback()
+        print(f"Error while compacting scans: {e}")
+        return None
+    finally:
+        cursor.close()
+
+
+def compact(connection, keep_days, batch_size, pause):
+    cutoff = compaction_cutoff(keep_days)
+    print(f"Compacting scans older than {cutoff:%Y-%m-%d}")
+    total = 0
+    skipped = set()
+    lock_failures = 0
+    while True:
+        compacted = compact_batch(connection, cutoff, batch_size, skipped)
+        if compacted is None or compacted == 0:
+            break
+        if compacted < 0:
+            lock_failures += 1
+            if lock_failures >= MAX_LOCK_RETRIES:
+                print(f"Giving up after {lock_failures} batches in a row ran into locks")
+                break
+            # Back off so a long transaction holding the locks can finish
+            time.sleep(pause * 2 ** lock_failures)
+            continue
+        lock_failures = 0
+        total += compacted
+        print(f"Compacted {compacted} scans ({total} in total)")
+        time.sleep(pause)
+    if skipped:
+        print(f"Skipped {len(skipped)} locked scans, they are compacted in the next run")
+    print(f"Compaction finished, {total} scans rolled up into daily aggregates")
+    if total:
+        # URLs whose scans were all compacted drop out of the leaderboard
+        cursor = connection.cursor()
+        cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY latest_scan_summary;")
+        connection.commit()
+        cursor.close()
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rolls scans older than the retention window up into daily aggregates.")
+    parser.add_argument('--keep-days', type=int, default=int(os.getenv('COMPACTION_KEEP_DAYS', '180')),
+                        help=f"Days of full scan detail to keep (at least {MIN_KEEP_DAYS}).")
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('COMPACTION_BATCH_SIZE', '200')),
+                        help="Scans rolled up and deleted per transaction.")
+    parser.add_argument('--pause', type=float, default=float(os.getenv('COMPACTION_PAUSE_SECONDS', '0.5')),
+                        help="Seconds to wait between two batches.")
+    parser.add_argument('--every', type=float, default=None, metavar='HOURS',
+                        help="Keep running and repeat the compaction every HOURS hours.")
+    args = parser.parse_args()
+
+    while True:
+        connection = connect_to_db()
+        if connection is not None:
+            compact(connection, args.keep_days, args.batch_size, args.pause)
+            connection.close()
+        if args.every is None:
+            break
+        time.sleep(args.every * 3600)
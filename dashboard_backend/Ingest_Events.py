@@ -0,0 +1,146 @@
+import json
+import select
+import threading
+import time
+
+import psycopg2
+
+from Ingest_Report import INGEST_CHANNEL, refresh_latest_scans
+
+RECONNECT_SECONDS = 5
+
+
+class IngestListener:
+    """
+    Listens on INGEST_CHANNEL with one database connection per API process and keeps the last
+    keep notifications for the clients of GET /ingest-events. Every notification gets an id that
+    counts up, a client passes the last one it got to receive only the newer ones. After the
+    connection was lost a resync event tells the clients to catch up with GET /changes.
+    """
+
+    def __init__(self, db_params, keep=1000):
+        self.db_params = db_params
+        self.keep = keep
+        self.events = []
+        self.first_id = 0
+        self.changed = threading.Condition()
+        self.started = False
+        self.missed = False
+        self.lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        with self.changed:
+            self.events.append((event_type, data))
+            if len(self.events) > self.keep:
+                drop = len(self.events) - self.keep
+                del self.events[:drop]
+                self.first_id += drop
+            self.changed.notify_all()
+
+    def next_id(self):
+        with self.changed:
+            return self.first_id + len(self.events)
+
+    def events_since(self, event_id, timeout=None):
+        """(id of the first event, events) from event_id on, waits up to timeout for new ones."""
+        with self.changed:
+            if self.first_id + len(self.events) <= event_id:
+                self.changed.wait(timeout)
+            start = max(event_id, self.first_id)
+            return start, self.events[start - self.first_id:]
+
+    def listen(self, connection):
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {INGEST_CHANNEL};")
+        cursor.close()
+        print(f"Listening for ingested reports on {INGEST_CHANNEL}")
+        if self.missed:
+            self.publish('resync', {})
+            self.missed = False
+        while True:
+            if select.select([connection], [], [], 60) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                try:
+                    self.publish('ingested', json.loads(notify.payload))
+                except ValueError:
+                    print(f"Ignoring invalid notification: {notify.payload}")
+
+    def run(self):
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(**self.db_params)
+                connection.autocommit = True
+                self.listen(connection)
+            except Exception as e:
+                # Reports ingested while disconnected are missed
+                print(f"Error in the ingest listener: {e}")
+                self.missed = True
+            finally:
+                if connection is not None:
+                    connection.close()
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        """Starts the listener thread on the first call."""
+        with self.lock:
+            if not self.started:
+                self.started = True
+                threading.Thread(target=self.run, name='ingest-listener', daemon=True).start()
+
+
+class LatestScanRefresher:
+    """
+    Keeps latest_scan_summary up to date from a thread of the API process instead of refreshing
+    it per report or per request. A notification on INGEST_CHANNEL schedules a refresh debounce
+    seconds later, so a burst of reports is folded into one. Every check_seconds, and after a
+    reconnect, the view is refreshed if scans were inserted any other way.
+    """
+
+    def __init__(self, db_params, debounce=5, check_seconds=300):
+        self.db_params = db_params
+        self.debounce = debounce
+        self.check_seconds = check_seconds
+        self.started = False
+        self.lock = threading.Lock()
+
+    def listen(self, connection):
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {INGEST_CHANNEL};")
+        connection.commit()
+        cursor.close()
+        # Reports ingested while no refresher was connected are caught up right away
+        due = time.monotonic()
+        while True:
+            if select.select([connection], [], [], max(due - time.monotonic(), 0)) != ([], [], []):
+                connection.poll()
+                if connection.notifies:
+                    del connection.notifies[:]
+                    due = min(due, time.monotonic() + self.debounce)
+            if time.monotonic() >= due:
+                if refresh_latest_scans(connection):
+                    print("Refreshed latest_scan_summary")
+                due = time.monotonic() + self.check_seconds
+
+    def run(self):
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(**self.db_params)
+                self.listen(connection)
+            except Exception as e:
+                print(f"Error in the latest scan refresher: {e}")
+            finally:
+                if connection is not None:
+                    connection.close()
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        """Starts the refresher thread on the first call."""
+        with self.lock:
+            if not self.started:
+                self.started = True
+                threading.Thread(target=self.run, name='latest-scan-refresher', daemon=True).start()
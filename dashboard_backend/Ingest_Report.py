@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+from flask.cli import load_dotenv
+
+from Manage_Partitions import ensure_month_partitions
+from Risk_Engine import refresh_scan_scores
+
+load_dotenv()
+
+# Connection parameters
+db_params = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+user_db_params = {
+    'database': os.getenv('DB2_NAME', 'user_database'),
+    'user': os.getenv('DB2_USER', 'postgres'),
+    'password': os.getenv('DB2_PASSWORD', 'postgres'),
+    'host': os.getenv('DB2_HOST', 'localhost'),
+    'port': os.getenv('DB2_PORT', '5432'),
+}
+
+# Channel of the NOTIFY sent with every ingested report, see Ingest_Events.py
+INGEST_CHANNEL = 'scan_ingested'
+
+# NOTIFY payloads have to stay below 8000 bytes
+MAX_NOTIFY_PAYLOAD = 7900
+
+# Serializes the refreshes of latest_scan_summary between the API processes
+SUMMARY_LOCK_KEY = 2024082203
+
+MAPPING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'owasp_mapping.xlsx')
+
+mapping_lock = threading.Lock()
+owasp_mapping = None
+
+
+def connect_to_db(params=db_params):
+    try:
+        connection = psycopg2.connect(**params)
+        print("Connected to the database!")
+        return connection
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def load_owasp_mapping():
+    """{lowercase vulnerability name: [owasp_id, ...]} from owasp_mapping.xlsx, read once per process."""
+    global owasp_mapping
+    with mapping_lock:
+        if owasp_mapping is None:
+            mapping = {}
+            for vulnerability, owasp_data in pd.read_excel(MAPPING_FILE)[['Vulnerability', 'OWASP']].itertuples(index=False):
+                if pd.isna(vulnerability) or vulnerability.lower() in mapping:
+                    continue
+                key = vulnerability.lower()
+                if pd.isna(owasp_data):
+                    mapping[key] = []
+                elif isinstance(owasp_data, str):
+                    mapping[key] = [int(id.strip()) for id in owasp_data.split(',')]
+                else:
+                    mapping[key] = [int(owasp_data)]
+            owasp_mapping = mapping
+        return owasp_mapping
+
+
+def site_scan_url(site_info):
+    base_url = site_info.get('@name')
+    port = site_info.get('@port')
+    if ':' in base_url:
+        return base_url
+    if base_url.endswith('/'):
+        return f"{base_url[:-1]}:{port}"
+    return f"{base_url}:{port}"
+
+
+def get_tool_id(cursor, tool_name):
+    cursor.execute("SELECT tool_id FROM tools WHERE tool_name = %s;", (tool_name,))
+    result = cursor.fetchone()
+    if result:
+        return result[0]
+    cursor.execute("INSERT INTO tools (tool_name) VALUES (%s) RETURNING tool_id;", (tool_name,))
+    return cursor.fetchone()[0]
+
+
+def insert_site(cursor, site_info, scan_tool, scan_date, scan_active, mapping):
+    """Inserts the scan of one site with all its vulnerabilities. Returns the scan_id or None if it was skipped."""
+    scan_url = site_scan_url(site_info)
+
+    # Workaround so no two scans on the same day and URL can be done
+    cursor.execute("SELECT MAX(scan_date) FROM scans WHERE scan_url = %s;", (scan_url,))
+    max_scan_date = cursor.fetchone()[0]
+    if max_scan_date is not None and scan_date.date() <= max_scan_date.date():
+        print(f"Scan date {scan_date} is older or done at the same day as the most recent scan date {max_scan_date}. Skipping insertion.")
+        return None
+
+    alerts = site_info.get('alerts', [])
+    for alert in alerts:
+        if alert['alert'].lower() not in mapping:
+            raise ValueError(f"No corresponding OWASP data found for vulnerability: {alert['alert']}")
+
+    ensure_month_partitions(cursor, scan_date)
+    cursor.execute("""
+        INSERT INTO scans (scan_tool, scan_date, scan_url, scan_active)
+        VALUES (%s, %s, %s, %s)
+        RETURNING scan_id;
+    """, (scan_tool, scan_date, scan_url, scan_active))
+    scan_id = cursor.fetchone()[0]
+    if not alerts:
+        return scan_id
+
+    # A vulnerability is new if the same URL did not have it in a scan of the last month
+    one_month_ago = scan_date - timedelta(days=30)
+    cursor.execute("""
+        SELECT DISTINCT v.vuln_name
+        FROM vulnerabilities v
+        JOIN scans s ON v.vuln_scan = s.scan_id AND v.vuln_scan_date = s.scan_date
+        WHERE s.scan_url = %s AND s.scan_date < %s AND s.scan_date >= %s
+          AND v.vuln_scan_date < %s AND v.vuln_scan_date >= %s AND v.vuln_name = ANY(%s);
+    """, (scan_url, scan_date, one_month_ago, scan_date, one_month_ago, [alert['alert'] for alert in alerts]))
+    known = {row[0] for row in cursor.fetchall()}
+
+    vuln_rows = [(alert['alert'], alert['riskcode'], alert['desc'], alert['count'], scan_id, scan_date, alert['alert'] not in known)
+                 for alert in alerts]
+    vuln_ids = execute_values(cursor, """
+        INSERT INTO vulnerabilities (vuln_name, vuln_priority, vuln_description, vuln_number, vuln_scan, vuln_scan_date, vuln_new)
+        VALUES %s
+        RETURNING vuln_id;
+    """, vuln_rows, fetch=True)
+
+    owasp_rows = [(vuln_id, owasp_id, scan_date)
+                  for (vuln_id,), alert in zip(vuln_ids, alerts)
+                  for owasp_id in mapping[alert['alert'].lower()]]
+    if owasp_rows:
+        execute_values(cursor, "INSERT INTO vuln_owasp (vuln_id, owasp_id, vuln_scan_date) VALUES %s;", owasp_rows)
+    return scan_id
+
+
+def notify_ingest(cursor, report_name, scan_ids, scan_date):
+    """
+    Sends the new scans with their vulnerability counts on INGEST_CHANNEL. Postgres delivers the
+    notification when the transaction commits, so listeners never see a report before its rows.
+    """
+    cursor.execute("""
+        SELECT s.scan_id, s.scan_url, s.scan_active, p.prio_name,
+               COUNT(v.vuln_id), COUNT(v.vuln_id) FILTER (WHERE v.vuln_new)
+        FROM scans s
+        LEFT JOIN vulnerabilities v ON v.vuln_scan = s.scan_id AND v.vuln_scan_date = s.scan_date
+        LEFT JOIN priorities p ON p.prio_id = v.vuln_priority
+        WHERE s.scan_id = ANY(%s) AND s.scan_date = %s
+        GROUP BY s.scan_id, s.scan_url, s.scan_active, p.prio_name
+        ORDER BY s.scan_id;
+    """, (scan_ids, scan_date))
+    scans = {}
+    for scan_id, scan_url, scan_active, prio_name, count, new_count in cursor.fetchall():
+        scan = scans.setdefault(scan_id, {"scan_id": scan_id, "scan_url": scan_url, "scan_active": scan_active,
+                                          "vulnerabilities": 0, "new_vulnerabilities": 0, "priorities": {}})
+        scan["vulnerabilities"] += count
+        scan["new_vulnerabilities"] += new_count
+        if prio_name is not None:
+            scan["priorities"][prio_name] = count
+
+    # The cursor lets a listener that missed notifications catch up with GET /changes
+    cursor.execute("SELECT currval('ingest_seq');")
+    summary = {"report_file": report_name, "scan_date": scan_date.isoformat(), "cursor": cursor.fetchone()[0],
+               "scans": list(scans.values())}
+    payload = json.dumps(summary)
+    if len(payload) > MAX_NOTIFY_PAYLOAD:
+        summary["scans"] = [{"scan_id": scan_id} for scan_id in scans]
+        payload = json.dumps(summary)
+    cursor.execute("SELECT pg_notify(%s, %s);", (INGEST_CHANNEL, payload))
+
+
+def ingest_report(connection, data, report_file):
+    """
+    Inserts a ZAP JSON report in one transaction, the vulnerabilities and their OWASP categories
+    of every site with one statement each. The report file name is recorded in ingested_reports,
+    so a report that reaches the database twice (completion hook and directory watcher) is only
+    inserted once. Reports with new scans are announced on INGEST_CHANNEL. Returns the scan_ids
+    of the report.
+    """
+    mapping = load_owasp_mapping()
+    report_name = os.path.basename(report_file)
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO ingested_reports (report_file) VALUES (%s)
+            ON CONFLICT (report_file) DO NOTHING
+            RETURNING report_file;
+        """, (report_name,))
+        if cursor.fetchone() is None:
+            connection.rollback()
+            cursor.execute("SELECT scan_ids FROM ingested_reports WHERE report_file = %s;", (report_name,))
+            print(f"Report {report_name} was already ingested")
+            return cursor.fetchone()[0]
+
+        scan_tool = get_tool_id(cursor, data.get('@programName'))
+        scan_date = datetime.strptime(data.get('@generated'), '%a, %d %b %Y %H:%M:%S')
+        scan_active = 'active' in report_name.lower()
+
+        scan_ids = []
+        for site_info in data.get('site', []):
+            scan_id = insert_site(cursor, site_info, scan_tool, scan_date, scan_active, mapping)
+            if scan_id is not None:
+                scan_ids.append(scan_id)
+
+        cursor.execute("UPDATE ingested_reports SET scan_ids = %s WHERE report_file = %s;", (scan_ids, report_name))
+        if scan_ids:
+            notify_ingest(cursor, report_name, scan_ids, scan_date)
+        connection.commit()
+        print(f"Data inserted for file: {report_file}")
+        return scan_ids
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def score_new_scans(connection, scan_ids):
+    # Only the new scans are scored, the stored scores of older scans stay valid
+    if not scan_ids:
+        return
+    user_connection = connect_to_db(user_db_params)
+    if user_connection is None:
+        return
+    try:
+        stored = refresh_scan_scores(connection, user_connection, scan_ids=scan_ids)
+        print(f"Stored {stored} risk scores for scans {scan_ids}")
+    except Exception as e:
+        print(f"Error while scoring the new scans: {e}")
+    finally:
+        user_connection.close()
+
+
+def refresh_latest_scans(connection):
+    """
+    Rebuilds latest_scan_summary, CONCURRENTLY so the leaderboard can be read meanwhile, unless
+    it already covers the newest scan. A process that waited for another one's refresh finds
+    the view up to date. Returns True if the view was rebuilt.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (SUMMARY_LOCK_KEY,))
+        cursor.execute("""
+            SELECT (SELECT MAX(scan_ingest_seq) FROM scans) IS DISTINCT FROM
+                   (SELECT MAX(refreshed_at_seq) FROM latest_scan_summary);
+        """)
+        stale = cursor.fetchone()[0]
+        if stale:
+            cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY latest_scan_summary;")
+        connection.commit()
+        return stale
+    except Exception as e:
+        connection.rollback()
+        print(f"Error while refreshing latest_scan_summary: {e}")
+        return False
+    finally:
+        cursor.close()
+
+
+def ingest_report_file(file_path):
+    """
+    Reads, inserts and scores one report file. Returns its scan_ids or None without a database
+    connection. latest_scan_summary is refreshed by the API, see Ingest_Events.LatestScanRefresher.
+    """
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+
+    connection = connect_to_db()
+    if connection is None:
+        return None
+    try:
+        scan_ids = ingest_report(connection, data, file_path)
+        score_new_scans(connection, scan_ids)
+        return scan_ids
+    finally:
+        connection.close()
@@ -1,6 +1,12 @@
+import re
+import sys
+from datetime import datetime
 from random import random
 import psycopg2
-from psycopg2 import OperationalError
+from psycopg2.extras import execute_values
+
+from Manage_Partitions import PARTITION_LOCK_KEY, ensure_month_partitions, month_bounds, partitioned_tables_query
+from Weight_Profiles import provision_weight_profiles
 
 # Connection parameters
 db_params_1 = {
@@ -29,14 +35,9 @@ def connect_to_db(db_params):
         print(f"Error: {e}")
         return None, None
 
-def execute_query(connection, query):
-    connection.autocommit = True
-    cursor = connection.cursor()
-    try:
-        cursor.execute(query)
-        print("Tables created successfully")
-    except OperationalError as e:
-        print(f"The error '{e}' occurred")
+# Arbitrary key for pg_advisory_xact_lock, containers starting at the same time bootstrap a
+# database one after another instead of racing on CREATE TABLE IF NOT EXISTS
+BOOTSTRAP_LOCK_KEY = 2024082202
 
 # Queries to create tables
 create_dashboard_table_query = """
@@ -58,29 +59,93 @@ CREATE TABLE IF NOT EXISTS priorities (
     prio_description TEXT
 );
 
-CREATE TABLE IF NOT EXISTS scans (
-    scan_id SERIAL PRIMARY KEY,
+""" + partitioned_tables_query + """
+
+CREATE TABLE IF NOT EXISTS scan_daily_aggregates (
+    scan_url TEXT NOT NULL,
+    scan_day DATE NOT NULL,
+    scan_active BOOLEAN NOT NULL,
+    owasp_id INTEGER references owasp_categories(owasp_id),
+    vuln_count INTEGER NOT NULL,
+    PRIMARY KEY (scan_url, scan_day, scan_active, owasp_id)
+);
+
+-- Compacted scans per URL and day, including the ones without findings
+CREATE TABLE IF NOT EXISTS scan_daily_counts (
+    scan_url TEXT NOT NULL,
+    scan_day DATE NOT NULL,
+    scan_active BOOLEAN NOT NULL,
+    scan_count INTEGER NOT NULL,
+    PRIMARY KEY (scan_url, scan_day, scan_active)
+);
+
+CREATE TABLE IF NOT EXISTS scan_risk_scores (
+    user_id INTEGER NOT NULL,
+    scan_id INTEGER NOT NULL,
+    scan_url TEXT NOT NULL,
+    scan_date TIMESTAMP NOT NULL,
+    vuln_count INTEGER NOT NULL,
+    risk_score DOUBLE PRECISION NOT NULL,
+    scored_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, scan_id)
+);
+
+CREATE INDEX IF NOT EXISTS scan_risk_scores_timeline_idx ON scan_risk_scores (user_id, scan_url, scan_date);
+-- The scores of a scan for all users, deleted together when scans are compacted or rescored
+CREATE INDEX IF NOT EXISTS scan_risk_scores_scan_idx ON scan_risk_scores (scan_id);
+
+-- Scans removed by the compaction or the retention, GET /changes reports them after their delete_seq
+CREATE TABLE IF NOT EXISTS deleted_scans (
+    delete_seq BIGINT PRIMARY KEY DEFAULT nextval('ingest_seq'),
+    scan_id INTEGER NOT NULL,
     scan_date TIMESTAMP NOT NULL,
     scan_url TEXT NOT NULL,
-    scan_active BOOLEAN DEFAULT FALSE,
-    scan_tool INTEGER references tools(tool_id) ON DELETE CASCADE
+    reason TEXT NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT now()
 );
 
-CREATE TABLE IF NOT EXISTS vulnerabilities (
-    vuln_id SERIAL PRIMARY KEY,
-    vuln_name TEXT NOT NULL,
-    vuln_scan INTEGER references scans(scan_id) ON DELETE CASCADE,      
-    vuln_priority INTEGER references priorities(prio_id),
-    vuln_number INTEGER,
-    vuln_description TEXT,
-    vuln_new BOOLEAN DEFAULT TRUE
+CREATE TABLE IF NOT EXISTS ingested_reports (
+    report_file TEXT PRIMARY KEY,
+    scan_ids INTEGER[] NOT NULL DEFAULT '{}',
+    ingested_at TIMESTAMP NOT NULL DEFAULT now()
 );
 
-CREATE TABLE IF NOT EXISTS vuln_owasp (
-    vuln_id INTEGER references vulnerabilities(vuln_id) ON DELETE CASCADE,
-    owasp_id INTEGER references owasp_categories(owasp_id),
-    PRIMARY KEY (vuln_id, owasp_id)
+CREATE TABLE IF NOT EXISTS scan_queue (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    scan_input TEXT NOT NULL,
+    scan_file BYTEA,
+    report_file TEXT NOT NULL,
+    timeout_seconds INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    worker_id TEXT,
+    lease_until TIMESTAMP,
+    available_at TIMESTAMP NOT NULL DEFAULT now(),
+    result JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS scan_queue_pending_idx ON scan_queue (created_at) WHERE status IN ('queued', 'running');
+
+CREATE TABLE IF NOT EXISTS scan_schedules (
+    schedule_id SERIAL PRIMARY KEY,
+    scan_url TEXT NOT NULL UNIQUE,
+    cron TEXT NOT NULL,
+    jitter_seconds INTEGER NOT NULL DEFAULT 0,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    next_run_at TIMESTAMP NOT NULL,
+    last_run_at TIMESTAMP,
+    last_job_id TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
 );
+
+CREATE INDEX IF NOT EXISTS scan_schedules_due_idx ON scan_schedules (next_run_at) WHERE enabled;
 """
 
 create_user_table_query = """
@@ -97,115 +162,133 @@ CREATE TABLE IF NOT EXISTS riskometer_weights (
     weight INTEGER NOT NULL,
     PRIMARY KEY (user_id, owasp_cat)
 );
-"""
-
-def ensure_owasp_categories_in_db(cursor, connection, owasp_categories):
-    if connection is None or cursor is None:
-        print("Database connection or cursor is invalid.")
-        return False
-
-    for owasp_id, owasp_name, owasp_description in owasp_categories:
-        try:
-            query = f"SELECT COUNT(*) FROM owasp_categories WHERE owasp_name = %s;"
-            cursor.execute(query, (owasp_name,))
-            result = cursor.fetchone()
-
-            count = result[0] if result else 0
-
-            if count == 0:
-                insert_query = "INSERT INTO owasp_categories (owasp_id, owasp_name, owasp_description) VALUES (%s, %s, %s);"
-                cursor.execute(insert_query, (owasp_id, owasp_name, owasp_description))
-                connection.commit()
-                print(f"Inserted OWASP category: {owasp_name}")
-            else:
-                print(f"OWASP category already exists: {owasp_name}")
-
-        except Exception as e:
-            print(f"Error: {e}")
-            return False
 
-    return True
-
-def ensure_priority_labels_are_in_db(cursor, connection, priorities):
-    if connection is None or cursor is None:
-        print("Database connection or cursor is invalid.")
-        return False
-
-    for prio_id, prio_name, prio_description in priorities:
-        try:
-            query = f"SELECT COUNT(*) FROM priorities WHERE prio_name = %s;"
-            cursor.execute(query, (prio_name,))
-            result = cursor.fetchone()
-
-            count = result[0] if result else 0
-
-            if count == 0:
-                insert_query = "INSERT INTO priorities (prio_id, prio_name, prio_description) VALUES (%s, %s, %s);"
-                cursor.execute(insert_query, (prio_id, prio_name, prio_description))
-                connection.commit()
-                print(f"Inserted priority: {prio_name}")
-            else:
-                print(f"Priority already exists: {prio_name}")
-
-        except Exception as e:
-            print(f"Error: {e}")
-            return False
+-- The weights every user starts with, see Weight_Profiles.provision_weight_profiles
+CREATE TABLE IF NOT EXISTS default_weights (
+    owasp_cat VARCHAR(100) PRIMARY KEY,
+    weight INTEGER NOT NULL
+);
 
-    return True
+-- Bumped with every change of a user's weights, the API caches the profiles per version
+CREATE TABLE IF NOT EXISTS weight_profile_versions (
+    user_id INTEGER PRIMARY KEY references users(user_id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+"""
 
-def ensure_owasp_categories_in_riskometer(cursor, connection, owasp_categories_for_riskometer):
+def ensure_scan_partitions_in_db(cursor):
+    # Current and next month, so scans around the turn of the month never miss a partition
+    now = datetime.now()
+    ensure_month_partitions(cursor, now)
+    ensure_month_partitions(cursor, month_bounds(now)[1])
+
+def ensure_owasp_categories_in_db(cursor, owasp_categories):
+    execute_values(cursor, """
+        INSERT INTO owasp_categories (owasp_id, owasp_name, owasp_description) VALUES %s
+        ON CONFLICT DO NOTHING;
+    """, owasp_categories)
+    print(f"Inserted {cursor.rowcount} OWASP categories")
+
+def ensure_priority_labels_are_in_db(cursor, priorities):
+    execute_values(cursor, """
+        INSERT INTO priorities (prio_id, prio_name, prio_description) VALUES %s
+        ON CONFLICT DO NOTHING;
+    """, priorities)
+    print(f"Inserted {cursor.rowcount} priorities")
+
+def ensure_standard_user_in_db(cursor, user):
+    # user_email is unique, a user that is already there is kept as it is
+    execute_values(cursor, """
+        INSERT INTO users (user_name, user_email, user_password) VALUES %s
+        ON CONFLICT DO NOTHING;
+    """, user)
+    print(f"Inserted {cursor.rowcount} standard users")
+
+def ensure_default_weights_in_riskometer(cursor, default_weights):
+    """
+    Stores default_weights and gives every user the default weight for the categories the user
+    has no weight for, including users created since the last start.
+    """
+    execute_values(cursor, """
+        INSERT INTO default_weights (owasp_cat, weight) VALUES %s
+        ON CONFLICT (owasp_cat) DO NOTHING;
+    """, default_weights)
+    provisioned = provision_weight_profiles(cursor)
+    print(f"Default weights provisioned for {len(provisioned)} users")
+
+def pending_statements(cursor, query):
+    """
+    The statements of query without the ADD COLUMN IF NOT EXISTS and CREATE INDEX IF NOT EXISTS
+    whose column or index exists. Both lock the table (ALTER TABLE even ACCESS EXCLUSIVE, which
+    blocks every reader of the partitioned tables) before they check, the bootstrap runs at every
+    start and must not lock anything once the schema is in place.
+    """
+    statements = [statement for statement in query.split(';') if statement.strip()]
+    column_pattern = re.compile(r'^\s*ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+)', re.MULTILINE)
+    index_pattern = re.compile(r'^\s*CREATE (?:UNIQUE )?INDEX IF NOT EXISTS (\w+)', re.MULTILINE)
+
+    cursor.execute("""
+        SELECT table_name || '.' || column_name FROM information_schema.columns
+        WHERE table_schema = current_schema()
+        UNION ALL
+        SELECT indexname FROM pg_indexes WHERE schemaname = current_schema();
+    """)
+    existing = {row[0] for row in cursor.fetchall()}
+
+    pending = []
+    for statement in statements:
+        column = column_pattern.search(statement)
+        index = index_pattern.search(statement)
+        if column and f"{column.group(1)}.{column.group(2)}" in existing:
+            continue
+        if index and index.group(1) in existing:
+            continue
+        pending.append(statement)
+    return ';'.join(pending) + ';'
+
+def bootstrap_database(db_params, seed):
+    """
+    Creates the tables and seeds the reference data of one database in a single transaction,
+    seed(cursor) adds the rows. Every insert skips rows that exist, so the bootstrap can run
+    at every start and from several containers at once.
+    """
+    connection, cursor = connect_to_db(db_params)
     if connection is None or cursor is None:
-        print("Database connection or cursor is invalid.")
         return False
 
-    for user_id, owasp_name, weight in owasp_categories_for_riskometer:
-        try:
-            query = f"SELECT COUNT(*) FROM riskometer_weights WHERE owasp_cat = %s;"
-            cursor.execute(query, (owasp_name,))
-            result = cursor.fetchone()
-
-            count = result[0] if result else 0
-
-            if count == 0:
-                insert_query = "INSERT INTO riskometer_weights (user_id, owasp_cat, weight) VALUES (%s, %s, %s);"
-                cursor.execute(insert_query, (user_id, owasp_name, weight))
-                connection.commit()
-                print(f"Inserted OWASP category: {owasp_name}")
-            else:
-                print(f"OWASP category already exists: {owasp_name}")
-
-        except Exception as e:
-            print(f"Error: {e}")
-            return False
-
-    return True
-
-def ensure_standard_user_in_db(cursor, connection, user):
-    if connection is None or cursor is None:
-        print("Database connection or cursor is invalid.")
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (BOOTSTRAP_LOCK_KEY,))
+        seed(cursor)
+        connection.commit()
+        print(f"Database {db_params['database']} is ready")
+        return True
+    except Exception as e:
+        connection.rollback()
+        print(f"Error: {e}")
         return False
-    for user_name, user_email, user_password in user:
-        try:
-            # Check if the user already exists
-            query = f"SELECT COUNT(*) FROM users WHERE user_name = %s;"
-            cursor.execute(query, (user_name,))
-            result = cursor.fetchone()
-
-            count = result[0] if result else 0
-
-            if count == 0:
-                insert_query = "INSERT INTO users (user_name, user_email, user_password) VALUES (%s, %s, %s);"
-                cursor.execute(insert_query, (user_name, user_email, user_password))
-                connection.commit()
-                print(f"Inserted standard user: {user_name}")
-            else:
-                print(f"Standard user already in database: {user_name}")
-
-        except Exception as e:
-            print(f"Error: {e}")
-            return False
-
-    return True
+    finally:
+        cursor.close()
+        connection.close()
+
+def seed_dashboard_database(cursor):
+    # Taken before the tables, like an ingest does, so the partition lock and the table locks
+    # of the DDL are always acquired in the same order
+    cursor.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_KEY,))
+    # The DDL would fail halfway on the first index of a table that is not partitioned
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('scans');")
+    row = cursor.fetchone()
+    if row is not None and row[0] != 'p':
+        raise RuntimeError("scans is not partitioned, run python Manage_Partitions.py --migrate first")
+    cursor.execute(pending_statements(cursor, create_dashboard_table_query))
+    ensure_scan_partitions_in_db(cursor)
+    ensure_owasp_categories_in_db(cursor, owasp_categories)
+    ensure_priority_labels_are_in_db(cursor, priorities)
+
+def seed_user_database(cursor):
+    cursor.execute(pending_statements(cursor, create_user_table_query))
+    ensure_standard_user_in_db(cursor, user)
+    ensure_default_weights_in_riskometer(cursor, default_riskometer_weights)
 
 # Sample data
 owasp_categories = [
@@ -229,38 +312,24 @@ priorities = [
     (3, "High", "High priority")
 ]
 
-owasp_categories_for_riskometer = [
-    (1, "API1 - Broken Object Level Authorization", 10),
-    (1, "API2 - Broken Authentication", 10),
-    (1, "API3 - Broken Object Property Level Authorization", 10),
-    (1, "API4 - Unrestricted Resource Consumption", 10),
-    (1, "API5 - Broken Function Level Authorization", 10),
-    (1, "API6 - Unrestricted Access to Sensitive Business Flows", 10),
-    (1, "API7 - Server Side Request Forgery", 10),
-    (1, "API8 - Security Misconfiguration", 10),
-    (1, "API9 - Improper Inventory Management", 10),
-    (1, "API10 - Unsafe Consumption of APIs", 10)
+default_riskometer_weights = [
+    ("API1 - Broken Object Level Authorization", 10),
+    ("API2 - Broken Authentication", 10),
+    ("API3 - Broken Object Property Level Authorization", 10),
+    ("API4 - Unrestricted Resource Consumption", 10),
+    ("API5 - Broken Function Level Authorization", 10),
+    ("API6 - Unrestricted Access to Sensitive Business Flows", 10),
+    ("API7 - Server Side Request Forgery", 10),
+    ("API8 - Security Misconfiguration", 10),
+    ("API9 - Improper Inventory Management", 10),
+    ("API10 - Unsafe Consumption of APIs", 10)
 ]
 
 user = [
     ("Melanie Mustermann", "example@email.com", "test")
 ]
 
-# Database connection and table creation
-connection_1, cursor_1 = connect_to_db(db_params_1)
-execute_query(connection_1, create_dashboard_table_query)
-ensure_owasp_categories_in_db(cursor_1, connection_1, owasp_categories)
-ensure_priority_labels_are_in_db(cursor_1, connection_1, priorities)
-
-if connection_1:
-    cursor_1.close()
-    connection_1.close()
-
-connection_2, cursor_2 = connect_to_db(db_params_2)
-execute_query(connection_2, create_user_table_query)
-ensure_standard_user_in_db(cursor_2, connection_2, user)
-ensure_owasp_categories_in_riskometer(cursor_2, connection_2, owasp_categories_for_riskometer)
-
-if connection_2:
-    cursor_2.close()
-    connection_2.close()
+if __name__ == '__main__':
+    ready = bootstrap_database(db_params_1, seed_dashboard_database)
+    ready = bootstrap_database(db_params_2, seed_user_database) and ready
+    sys.exit(0 if ready else 1)
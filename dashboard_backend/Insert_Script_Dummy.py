@@ -2,6 +2,9 @@ import random
 import psycopg2
 from datetime import datetime, timedelta
 
+from Manage_Partitions import ensure_month_partitions
+from Risk_Engine import refresh_scan_scores
+
 # Connection parameters
 db_params = {
     'database': 'api_dashboard',
@@ -11,9 +14,17 @@ db_params = {
     'port': '5432',
 }
 
-def connect_to_db():
+user_db_params = {
+    'database': 'user_database',
+    'user': 'postgres',
+    'password': 'postgres',
+    'host': 'localhost',
+    'port': '5432',
+}
+
+def connect_to_db(params=db_params):
     try:
-        connection = psycopg2.connect(**db_params)
+        connection = psycopg2.connect(**params)
         print("Connected to the database!")
         cursor = connection.cursor()
         return connection, cursor
@@ -22,16 +33,16 @@ def connect_to_db():
 
 def get_recent_scan_id(cursor):
     try:
-        query = "SELECT scan_id FROM scans ORDER BY scan_date DESC LIMIT 1;"
+        query = "SELECT scan_id, scan_date FROM scans ORDER BY scan_date DESC LIMIT 1;"
         cursor.execute(query)
         result = cursor.fetchone()
         if result:
-            return result[0]
+            return result
         else:
-            return None
+            return None, None
     except Exception as e:
         print(f"An error occurred while retrieving the recent scan ID: {e}")
-        return None
+        return None, None
 
 def chooseDummyToolName():
     random_number = random.randint(1, 3)
@@ -86,6 +97,7 @@ def insert_scan(cursor, connection, scans):
         is_tool_already_in_db(cursor, connection, scan_tool)
         tool_id = get_tool_id(cursor, scan_tool)
         try:
+            ensure_month_partitions(cursor, datetime.strptime(scan_date, "%Y-%m-%d %H:%M:%S"))
             insert_query = "INSERT INTO scans (scan_date, scan_tool, scan_url) VALUES (%s, %s, %s);"
             cursor.execute(insert_query, (scan_date, tool_id, scan_url))
             connection.commit()
@@ -100,16 +112,16 @@ def insert_vulnerabilities(cursor, connection, vulnerabilities):
         print("Database connection or cursor is invalid.")
         return True
 
-    vuln_scan = get_recent_scan_id(cursor)
+    vuln_scan, vuln_scan_date = get_recent_scan_id(cursor)
     inserted_vuln_ids = []
     vuln_new = True
     for vuln_name, vuln_priority, vuln_number, vuln_owasp, vuln_description in vulnerabilities:
         try:
-            insert_query = "INSERT INTO vulnerabilities (vuln_name, vuln_scan, vuln_priority, vuln_number, vuln_description, vuln_new) VALUES (%s, %s, %s, %s, %s, %s) RETURNING vuln_id;"
-            cursor.execute(insert_query, (vuln_name, vuln_scan, vuln_priority, vuln_number, vuln_description, vuln_new))
+            insert_query = "INSERT INTO vulnerabilities (vuln_name, vuln_scan, vuln_scan_date, vuln_priority, vuln_number, vuln_description, vuln_new) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING vuln_id;"
+            cursor.execute(insert_query, (vuln_name, vuln_scan, vuln_scan_date, vuln_priority, vuln_number, vuln_description, vuln_new))
             connection.commit()
             inserted_vuln_id = cursor.fetchone()[0]
-            inserted_vuln_ids.append((inserted_vuln_id, vuln_owasp))
+            inserted_vuln_ids.append((inserted_vuln_id, vuln_scan_date, vuln_owasp))
             print(f"Inserted vulnerability: {vuln_name}")
         except Exception as e:
             print(f"Error: {e}")
@@ -122,11 +134,11 @@ def insert_owasp_vuln_connection(cursor, connection, inserted_vuln_ids):
         return False
 
 
-    for vuln_id, owasp_ids in inserted_vuln_ids:
+    for vuln_id, vuln_scan_date, owasp_ids in inserted_vuln_ids:
         try:
             for owasp_id in owasp_ids:
-                insert_owasp_vuln = "INSERT INTO vuln_owasp (vuln_id, owasp_id) VALUES (%s, %s);"
-                cursor.execute(insert_owasp_vuln, (vuln_id, owasp_id))
+                insert_owasp_vuln = "INSERT INTO vuln_owasp (vuln_id, owasp_id, vuln_scan_date) VALUES (%s, %s, %s);"
+                cursor.execute(insert_owasp_vuln, (vuln_id, owasp_id, vuln_scan_date))
             connection.commit()
         except Exception as e:
             print(f"An error occurred: {e}")
@@ -163,6 +175,12 @@ def insert_everything():
     inserted_vuln_ids = insert_vulnerabilities(cursor, connection, vulnerabilities)
     insert_owasp_vuln_connection(cursor, connection, inserted_vuln_ids)
     cursor.close()
+
+    user_connection, user_cursor = connect_to_db(user_db_params)
+    user_cursor.close()
+    vuln_scan, _ = get_recent_scan_id(connection.cursor())
+    refresh_scan_scores(connection, user_connection, scan_ids=[vuln_scan])
+    user_connection.close()
     connection.close()
 
 insert_everything()
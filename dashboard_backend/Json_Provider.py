@@ -0,0 +1,108 @@
+import dataclasses
+import datetime
+import decimal
+import json
+import os
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+# orjson is optional, without it the app keeps Flask's default provider
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# rfc1123 keeps the dates as Flask writes them ("Thu, 22 Aug 2024 08:39:42 GMT"), iso lets orjson
+# write them natively ("2024-08-22T08:39:42"), which is faster but changes the format for the clients
+JSON_DATETIME_FORMAT = os.getenv('JSON_DATETIME_FORMAT', 'rfc1123')
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def rfc1123_date(value):
+    # Same string as werkzeug's http_date, which goes through the much slower email.utils
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            return http_date(value)
+        return (f"{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} {value.year:04d} "
+                f"{value.hour:02d}:{value.minute:02d}:{value.second:02d} GMT")
+    if isinstance(value, datetime.date):
+        return f"{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} {value.year:04d} 00:00:00 GMT"
+    return http_date(value)
+
+
+def orjson_default(value):
+    """Types orjson does not serialize itself, converted like Flask's default provider does."""
+    if hasattr(value, 'timetuple'):
+        return rfc1123_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def sorted_str_keys(value):
+    """
+    value with the dicts sorted by their keys and the keys converted to str, as json.dumps(sort_keys=True)
+    does: {10: 'b', 2: 'a'} becomes {"2": 'a', "10": 'b'}, while orjson would sort "10" before "2".
+    """
+    if isinstance(value, dict):
+        return {key if isinstance(key, str) else json.dumps(key): sorted_str_keys(item)
+                for key, item in sorted(value.items(), key=lambda entry: entry[0])}
+    if isinstance(value, (list, tuple)):
+        return [sorted_str_keys(item) for item in value]
+    return value
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes with orjson. The output matches the default provider (sorted keys,
+    the same separators and indentation in debug mode, dates as RFC 1123 strings) except that
+    non-ASCII characters are written as UTF-8 instead of \\u escapes and NaN becomes null.
+    Calls with json.dumps arguments (e.g. flask.json.dumps(obj, indent=4)) use the default provider.
+    Objects with dicts keyed by something else than str (e.g. user_ids) are rare and take a slower
+    path through sorted_str_keys, so the keys are ordered like the default provider orders them.
+    """
+
+    def options(self, indent=False):
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if JSON_DATETIME_FORMAT != 'iso':
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def encode(self, obj, option):
+        try:
+            return orjson.dumps(obj, default=orjson_default, option=option)
+        except orjson.JSONEncodeError:
+            # Raised for the first key that is not a str, the keys are already sorted on the retry
+            return orjson.dumps(sorted_str_keys(obj), default=orjson_default, option=option & ~orjson.OPT_SORT_KEYS)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj, self.options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self.encode(obj, self.options(indent) | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def install_json_provider(app):
+    """Uses orjson for app if it is installed, JSON_PROVIDER=default keeps Flask's provider."""
+    if orjson is not None and os.getenv('JSON_PROVIDER', 'orjson') == 'orjson':
+        app.json = OrjsonProvider(app)
@@ -0,0 +1,315 @@
+import argparse
+import os
+from datetime import datetime
+
+import psycopg2
+from flask.cli import load_dotenv
+
+load_dotenv()
+
+# Connection parameters
+db_params = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+# Tables partitioned by month of the scan date, parent first. Partitions are
+# detached in reverse order so no foreign key points into a detached month.
+PARTITIONED_TABLES = ['scans', 'vulnerabilities', 'vuln_owasp']
+
+ARCHIVE_SCHEMA = 'archive'
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent ingests do not race on
+# creating the same partition.
+PARTITION_LOCK_KEY = 2024082201
+
+
+def connect_to_db():
+    try:
+        connection = psycopg2.connect(**db_params)
+        print("Connected to the database!")
+        return connection
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def month_bounds(scan_date):
+    start = datetime(scan_date.year, scan_date.month, 1)
+    if start.month == 12:
+        end = datetime(start.year + 1, 1, 1)
+    else:
+        end = datetime(start.year, start.month + 1, 1)
+    return start, end
+
+
+def partition_name(table, month_start):
+    return f"{table}_y{month_start.year}m{month_start.month:02d}"
+
+
+def ensure_month_partitions(cursor, scan_date):
+    """Creates the monthly partitions of all partitioned tables for scan_date if they are missing."""
+    start, end = month_bounds(scan_date)
+    cursor.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_KEY,))
+    for table in PARTITIONED_TABLES:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(table, start)}
+            PARTITION OF {table}
+            FOR VALUES FROM (%s) TO (%s);
+        """, (start, end))
+
+
+def list_partitions(cursor, table):
+    """Returns (partition_name, upper_bound) for every partition attached to table, oldest first."""
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE p.relname = %s AND n.nspname = current_schema()
+        ORDER BY c.relname;
+    """, (table,))
+    partitions = []
+    for relname, bound in cursor.fetchall():
+        # bound looks like: FOR VALUES FROM ('2024-08-01 00:00:00') TO ('2024-09-01 00:00:00')
+        upper = bound.split(" TO ('", 1)[1].split("'", 1)[0]
+        partitions.append((relname, datetime.strptime(upper, '%Y-%m-%d %H:%M:%S')))
+    return partitions
+
+
+def drop_partitioned_foreign_keys(cursor, relname):
+    """
+    Drops the foreign keys a detached partition keeps to the partitioned tables. The rows they
+    point to are archived with it, and a kept key blocks or outlives detaching the referenced
+    month. ATTACH PARTITION creates them again when the month is restored.
+    """
+    cursor.execute("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f' AND confrelid::regclass::text = ANY(%s);
+    """, (relname, PARTITIONED_TABLES))
+    for (conname,) in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {relname} DROP CONSTRAINT {conname};")
+
+
+def apply_retention(connection, retention_months, drop=False):
+    """
+    Detaches every monthly partition that ends before the retention window.
+    Detached partitions are moved into the archive schema (or dropped) so they no longer
+    show up in any dashboard query but can still be restored with ATTACH PARTITION.
+    Their scans are recorded in deleted_scans.
+    """
+    now = datetime.now()
+    months = now.year * 12 + (now.month - 1) - retention_months + 1
+    cutoff = datetime(months // 12, months % 12 + 1, 1)
+
+    cursor = connection.cursor()
+    try:
+        if not drop:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+
+        # The scans leave the dashboard, GET /changes reports them. The partitions end at the
+        # start of a month, so the scans before the cutoff are the ones of the detached partitions.
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_KEY,))
+        cursor.execute("""
+            INSERT INTO deleted_scans (scan_id, scan_date, scan_url, reason)
+            SELECT scan_id, scan_date, scan_url, %s FROM scans WHERE scan_date < %s;
+        """, ('dropped' if drop else 'archived', cutoff))
+
+        detached = []
+        for table in reversed(PARTITIONED_TABLES):
+            for relname, upper in list_partitions(cursor, table):
+                if upper > cutoff:
+                    continue
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {relname};")
+                if drop:
+                    cursor.execute(f"DROP TABLE {relname};")
+                else:
+                    drop_partitioned_foreign_keys(cursor, relname)
+                    cursor.execute(f"ALTER TABLE {relname} SET SCHEMA {ARCHIVE_SCHEMA};")
+                detached.append(relname)
+
+        cursor.execute("DELETE FROM scan_risk_scores WHERE scan_date < %s;", (cutoff,))
+        connection.commit()
+        for relname in detached:
+            print(f"{'Dropped' if drop else 'Archived'} partition: {relname}")
+        print(f"Retention applied, kept partitions newer than {cutoff:%Y-%m-%d}")
+        return detached
+    except Exception as e:
+        connection.rollback()
+        print(f"Error while applying retention: {e}")
+        return []
+    finally:
+        cursor.close()
+
+
+def migrate_to_partitioned(connection):
+    """
+    Converts an existing api_dashboard database with plain scans/vulnerabilities/vuln_owasp
+    tables into the partitioned layout. The old tables are renamed, the partitioned tables
+    and one partition per month found in the data are created and the rows are copied over.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'scans' AND relnamespace = current_schema()::regnamespace;")
+        result = cursor.fetchone()
+        if result is None or result[0] == 'p':
+            print("Nothing to migrate, scans is already partitioned or does not exist.")
+            return False
+
+        # The view is created again on the partitioned tables, it would keep the legacy tables alive
+        cursor.execute("DROP MATERIALIZED VIEW IF EXISTS latest_scan_summary;")
+        for table in PARTITIONED_TABLES:
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy;")
+            cursor.execute("""
+                SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass;
+            """, (f"{table}_legacy",))
+            for (conname,) in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {conname} TO {conname}_legacy;")
+
+        cursor.execute(partitioned_tables_query)
+
+        cursor.execute("SELECT DISTINCT date_trunc('month', scan_date) FROM scans_legacy;")
+        for (month,) in cursor.fetchall():
+            ensure_month_partitions(cursor, month)
+
+        cursor.execute("""
+            INSERT INTO scans (scan_id, scan_date, scan_url, scan_active, scan_tool)
+            SELECT scan_id, scan_date, scan_url, scan_active, scan_tool FROM scans_legacy;
+
+            INSERT INTO vulnerabilities (vuln_id, vuln_name, vuln_scan, vuln_scan_date, vuln_priority,
+                                         vuln_number, vuln_description, vuln_new)
+            SELECT v.vuln_id, v.vuln_name, v.vuln_scan, s.scan_date, v.vuln_priority,
+                   v.vuln_number, v.vuln_description, v.vuln_new
+            FROM vulnerabilities_legacy v
+            JOIN scans_legacy s ON s.scan_id = v.vuln_scan;
+
+            INSERT INTO vuln_owasp (vuln_id, owasp_id, vuln_scan_date)
+            SELECT vo.vuln_id, vo.owasp_id, s.scan_date
+            FROM vuln_owasp_legacy vo
+            JOIN vulnerabilities_legacy v ON v.vuln_id = vo.vuln_id
+            JOIN scans_legacy s ON s.scan_id = v.vuln_scan;
+
+            SELECT setval(pg_get_serial_sequence('scans', 'scan_id'), COALESCE(MAX(scan_id), 0) + 1, false) FROM scans;
+            SELECT setval(pg_get_serial_sequence('vulnerabilities', 'vuln_id'), COALESCE(MAX(vuln_id), 0) + 1, false) FROM vulnerabilities;
+            REFRESH MATERIALIZED VIEW latest_scan_summary;
+
+            DROP TABLE vuln_owasp_legacy;
+            DROP TABLE vulnerabilities_legacy;
+            DROP TABLE scans_legacy;
+        """)
+        connection.commit()
+        print("Migrated scans, vulnerabilities and vuln_owasp to monthly partitions")
+        return True
+    except Exception as e:
+        connection.rollback()
+        print(f"Error while migrating to partitions: {e}")
+        return False
+    finally:
+        cursor.close()
+
+
+# The partitioned tables with their indexes and the view on them, part of the schema created by
+# Initialize_Database.py and Create_Tables.py. The ALTER TABLEs add the columns of later versions
+# to databases created before.
+partitioned_tables_query = """
+CREATE SEQUENCE IF NOT EXISTS ingest_seq;
+
+CREATE TABLE IF NOT EXISTS scans (
+    scan_id SERIAL,
+    scan_date TIMESTAMP NOT NULL,
+    scan_url TEXT NOT NULL,
+    scan_active BOOLEAN DEFAULT FALSE,
+    scan_tool INTEGER references tools(tool_id) ON DELETE CASCADE,
+    scan_ingest_seq BIGINT NOT NULL DEFAULT nextval('ingest_seq'),
+    PRIMARY KEY (scan_id, scan_date)
+) PARTITION BY RANGE (scan_date);
+
+CREATE TABLE IF NOT EXISTS vulnerabilities (
+    vuln_id SERIAL,
+    vuln_name TEXT NOT NULL,
+    vuln_scan INTEGER NOT NULL,
+    vuln_scan_date TIMESTAMP NOT NULL,
+    vuln_priority INTEGER references priorities(prio_id),
+    vuln_number INTEGER,
+    vuln_description TEXT,
+    vuln_new BOOLEAN DEFAULT TRUE,
+    vuln_ingest_seq BIGINT NOT NULL DEFAULT nextval('ingest_seq'),
+    vuln_search TSVECTOR GENERATED ALWAYS AS (
+        to_tsvector('english', vuln_name || ' ' || COALESCE(vuln_description, ''))) STORED,
+    PRIMARY KEY (vuln_id, vuln_scan_date),
+    FOREIGN KEY (vuln_scan, vuln_scan_date) references scans(scan_id, scan_date) ON DELETE CASCADE
+) PARTITION BY RANGE (vuln_scan_date);
+
+CREATE TABLE IF NOT EXISTS vuln_owasp (
+    vuln_id INTEGER NOT NULL,
+    owasp_id INTEGER references owasp_categories(owasp_id),
+    vuln_scan_date TIMESTAMP NOT NULL,
+    PRIMARY KEY (vuln_id, owasp_id, vuln_scan_date),
+    FOREIGN KEY (vuln_id, vuln_scan_date) references vulnerabilities(vuln_id, vuln_scan_date) ON DELETE CASCADE
+) PARTITION BY RANGE (vuln_scan_date);
+
+CREATE INDEX IF NOT EXISTS scans_url_date_idx ON scans (scan_url, scan_date);
+CREATE INDEX IF NOT EXISTS vulnerabilities_scan_idx ON vulnerabilities (vuln_scan);
+CREATE INDEX IF NOT EXISTS vulnerabilities_name_idx ON vulnerabilities (vuln_name, vuln_scan_date);
+
+ALTER TABLE scans ADD COLUMN IF NOT EXISTS scan_ingest_seq BIGINT NOT NULL DEFAULT nextval('ingest_seq');
+ALTER TABLE vulnerabilities ADD COLUMN IF NOT EXISTS vuln_ingest_seq BIGINT NOT NULL DEFAULT nextval('ingest_seq');
+CREATE INDEX IF NOT EXISTS scans_ingest_seq_idx ON scans (scan_ingest_seq);
+CREATE INDEX IF NOT EXISTS vulnerabilities_ingest_seq_idx ON vulnerabilities (vuln_ingest_seq);
+ALTER TABLE vulnerabilities ADD COLUMN IF NOT EXISTS vuln_search TSVECTOR GENERATED ALWAYS AS (
+    to_tsvector('english', vuln_name || ' ' || COALESCE(vuln_description, ''))) STORED;
+CREATE INDEX IF NOT EXISTS vulnerabilities_search_idx ON vulnerabilities USING GIN (vuln_search);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS latest_scan_summary AS
+SELECT s.scan_url, s.scan_id, s.scan_date, s.scan_active, t.tool_name,
+       COUNT(v.vuln_id) AS vuln_count,
+       COUNT(v.vuln_id) FILTER (WHERE v.vuln_priority = 3) AS high_count,
+       COUNT(v.vuln_id) FILTER (WHERE v.vuln_priority = 2) AS medium_count,
+       COUNT(v.vuln_id) FILTER (WHERE v.vuln_priority = 1) AS low_count,
+       COUNT(v.vuln_id) FILTER (WHERE v.vuln_priority = 0) AS informational_count,
+       COUNT(v.vuln_id) FILTER (WHERE v.vuln_new) AS new_count,
+       (SELECT MAX(scan_ingest_seq) FROM scans) AS refreshed_at_seq
+FROM (
+    SELECT DISTINCT ON (scan_url) scan_id, scan_date, scan_url, scan_active, scan_tool
+    FROM scans
+    ORDER BY scan_url, scan_date DESC, scan_id DESC
+) s
+LEFT JOIN tools t ON t.tool_id = s.scan_tool
+LEFT JOIN vulnerabilities v ON v.vuln_scan = s.scan_id AND v.vuln_scan_date = s.scan_date
+GROUP BY s.scan_url, s.scan_id, s.scan_date, s.scan_active, t.tool_name;
+
+CREATE UNIQUE INDEX IF NOT EXISTS latest_scan_summary_url_idx ON latest_scan_summary (scan_url);
+CREATE INDEX IF NOT EXISTS latest_scan_summary_high_idx ON latest_scan_summary (high_count DESC, vuln_count DESC);
+"""
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintains the monthly partitions of the api_dashboard database.")
+    parser.add_argument('--retention-months', type=int, default=int(os.getenv('RETENTION_MONTHS', '24')),
+                        help="Number of months (including the current one) that stay attached.")
+    parser.add_argument('--drop', action='store_true',
+                        help="Drop expired partitions instead of moving them into the archive schema.")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Convert an existing unpartitioned database before applying the retention.")
+    args = parser.parse_args()
+
+    connection = connect_to_db()
+    if connection is None:
+        exit(1)
+
+    if args.migrate:
+        migrate_to_partitioned(connection)
+
+    cursor = connection.cursor()
+    now = datetime.now()
+    ensure_month_partitions(cursor, now)
+    ensure_month_partitions(cursor, month_bounds(now)[1])
+    connection.commit()
+    cursor.close()
+
+    apply_retention(connection, args.retention_months, drop=args.drop)
+    connection.close()
@@ -0,0 +1,91 @@
+import gzip
+import os
+
+from flask import jsonify, request
+
+# brotli and zstandard are optional, without them the responses are only gzip compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this are sent uncompressed, compressing them costs more than it saves
+COMPRESSION_THRESHOLD = int(os.getenv('COMPRESSION_THRESHOLD', '1024'))
+
+COLUMNAR_MIMETYPE = 'application/vnd.dashboard.columnar+json'
+
+COMPRESSORS = {'gzip': lambda data: gzip.compress(data, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=5)
+if zstandard is not None:
+    COMPRESSORS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+# Preferred encoding first, used when the client accepts several with the same quality
+ENCODING_PREFERENCE = [encoding for encoding in ('zstd', 'br', 'gzip') if encoding in COMPRESSORS]
+
+
+def compress_response(response):
+    """after_request hook: compresses the body with the best encoding the client accepts."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype == 'text/event-stream'):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(ENCODING_PREFERENCE)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_THRESHOLD:
+        return response
+    response.set_data(COMPRESSORS[encoding](data))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def to_columnar(rows, columns=None):
+    """
+    Turns a list of dicts with the same keys (or tuples with the given columns) into one list
+    per column. String columns with repeated values are dictionary encoded: the column holds
+    indexes into dictionaries[column].
+    """
+    if columns is None:
+        columns = list(rows[0].keys()) if rows else []
+        rows = [tuple(row.values()) for row in rows]
+    data = {}
+    dictionaries = {}
+    for column, values in zip(columns, zip(*rows) if rows else [()] * len(columns)):
+        values = list(values)
+        if values and all(isinstance(value, str) for value in values):
+            distinct = list(dict.fromkeys(values))
+            if len(distinct) * 2 <= len(values):
+                index = {value: position for position, value in enumerate(distinct)}
+                values = [index[value] for value in values]
+                dictionaries[column] = distinct
+        data[column] = values
+    return {"rows": len(rows), "columns": list(columns), "data": data, "dictionaries": dictionaries}
+
+
+def wants_columnar():
+    if request.args.get('format') == 'columnar':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE]) == COLUMNAR_MIMETYPE
+
+
+def rows_response(rows, columns=None):
+    """
+    jsonify(rows), or the columnar form if the client asked for it with ?format=columnar or the
+    Accept header. With columns, rows are the tuples of a query result: the columnar form is built
+    from them directly and the objects of the row form with dict(zip()) right before serializing.
+    """
+    if not wants_columnar():
+        if columns is not None:
+            rows = [dict(zip(columns, row)) for row in rows]
+        return jsonify(rows)
+    response = jsonify(to_columnar(rows, columns))
+    response.mimetype = COLUMNAR_MIMETYPE
+    response.vary.add('Accept')
+    return response
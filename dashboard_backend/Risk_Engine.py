@@ -0,0 +1,258 @@
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+from flask.cli import load_dotenv
+
+load_dotenv()
+
+# Connection parameters
+db_params_1 = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+db_params_2 = {
+    'database': os.getenv('DB2_NAME', 'user_database'),
+    'user': os.getenv('DB2_USER', 'postgres'),
+    'password': os.getenv('DB2_PASSWORD', 'postgres'),
+    'host': os.getenv('DB2_HOST', 'localhost'),
+    'port': os.getenv('DB2_PORT', '5432'),
+}
+
+# Same constants as the Riskometer in the frontend (Tachometer.jsx / RiskTimeLine.jsx)
+MAX_PRIORITY = 4
+MAX_WEIGHT = 100
+SCALING_STEP = 0.5
+
+# Users are scored in blocks so the rows x users weight matrix stays small for many profiles
+USER_BLOCK = 64
+
+# Scans without findings get one row with vuln_id, vuln_priority and owasp_id NULL
+matrix_query = """
+    SELECT s.scan_id, s.scan_url, s.scan_date, v.vuln_id, v.vuln_priority, vo.owasp_id
+    FROM scans s
+    LEFT JOIN (
+        vulnerabilities v
+        JOIN vuln_owasp vo ON v.vuln_id = vo.vuln_id AND v.vuln_scan_date = vo.vuln_scan_date
+    ) ON s.scan_id = v.vuln_scan AND s.scan_date = v.vuln_scan_date
+"""
+
+
+def load_vulnerability_matrix(cursor, scan_ids=None):
+    """Loads one row per (scan, vulnerability, OWASP category), sorted by scan_id and vuln_id."""
+    if scan_ids is None:
+        cursor.execute(matrix_query + " ORDER BY s.scan_id, v.vuln_id")
+    else:
+        cursor.execute(matrix_query + " WHERE s.scan_id = ANY(%s) ORDER BY s.scan_id, v.vuln_id", (list(scan_ids),))
+    frame = pd.DataFrame(cursor.fetchall(),
+                         columns=['scan_id', 'scan_url', 'scan_date', 'vuln_id', 'vuln_priority', 'owasp_id'])
+    return frame
+
+
+def load_owasp_ids(cursor):
+    cursor.execute("SELECT owasp_id, owasp_name FROM owasp_categories;")
+    return {owasp_name.lower(): owasp_id for owasp_id, owasp_name in cursor.fetchall()}
+
+
+def load_weight_profiles(cursor, owasp_ids, user_ids=None):
+    """Returns (user_ids, weights) where weights[u, owasp_id] is the weight of user u for that category."""
+    query = "SELECT user_id, owasp_cat, weight FROM riskometer_weights"
+    if user_ids:
+        query += " WHERE user_id = ANY(%s)"
+        cursor.execute(query, (list(user_ids),))
+    else:
+        cursor.execute(query)
+    return weight_matrix(cursor.fetchall(), owasp_ids)
+
+
+def weight_matrix(rows, owasp_ids):
+    """(user_ids, weights) of load_weight_profiles from (user_id, owasp_cat, weight) rows."""
+    users = sorted({user_id for user_id, _, _ in rows})
+    user_index = {user_id: i for i, user_id in enumerate(users)}
+    weights = np.zeros((len(users), max(owasp_ids.values(), default=0) + 1), dtype=np.float64)
+    for user_id, owasp_cat, weight in rows:
+        owasp_id = owasp_ids.get(owasp_cat.lower())
+        if owasp_id is not None:
+            weights[user_index[user_id], owasp_id] = weight
+    return users, weights
+
+
+class RiskEngine:
+    """
+    Keeps the vulnerability matrix of all scans in memory and scores every scan for any
+    number of weight profiles at once. Follows the Riskometer of the frontend: every
+    vulnerability counts once with the highest weight of its OWASP categories, the sum of
+    priority x weight is scaled by 1 + (n - 1) * 0.5 and normalised against
+    n x max priority x max weight. Scans without findings score 0.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        # (scans, vuln_priority, vuln_starts, scan_starts, owasp), replaced as a whole on reload
+        self.matrix = None
+
+    def load(self, frame):
+        if frame.empty:
+            empty = np.empty(0, dtype=np.int64)
+            self.matrix = (pd.DataFrame(columns=['scan_id', 'scan_url', 'scan_date', 'vuln_count']),
+                           np.empty(0), empty, empty, empty)
+            return
+
+        frame = frame.sort_values(['scan_id', 'vuln_id'], kind='stable')
+        first_rows = frame.drop_duplicates('scan_id')
+        found = frame[frame['vuln_id'].notna()]
+        scan_ids = found['scan_id'].to_numpy()
+        vuln_ids = found['vuln_id'].to_numpy()
+
+        # Row offsets where a new vulnerability / a new scan starts, used with ufunc.reduceat
+        vuln_change = np.r_[True, (vuln_ids[1:] != vuln_ids[:-1]) | (scan_ids[1:] != scan_ids[:-1])][:len(found)]
+        vuln_starts = np.flatnonzero(vuln_change)
+        vuln_scan_ids = scan_ids[vuln_starts]
+        scan_starts = np.flatnonzero(np.r_[True, vuln_scan_ids[1:] != vuln_scan_ids[:-1]][:len(vuln_starts)])
+
+        # Priority ids 0-3 (Informational - High) become the Riskometer priorities 1-4, no priority counts 0
+        vuln_priority = found['vuln_priority'].fillna(-1).to_numpy()[vuln_starts].astype(np.float64) + 1
+        owasp = found['owasp_id'].to_numpy().astype(np.int64)
+
+        # scan_starts covers the scans with findings, in the same scan_id order as scans
+        vuln_counts = pd.Series(np.diff(np.r_[scan_starts, len(vuln_starts)]), index=vuln_scan_ids[scan_starts])
+        scans = pd.DataFrame({
+            'scan_id': first_rows['scan_id'].to_numpy(),
+            'scan_url': first_rows['scan_url'].to_numpy(),
+            'scan_date': first_rows['scan_date'].to_numpy(),
+            'vuln_count': vuln_counts.reindex(first_rows['scan_id'].to_numpy(), fill_value=0).to_numpy(),
+        })
+        self.matrix = (scans, vuln_priority, vuln_starts, scan_starts, owasp)
+
+    def ensure_loaded(self, cursor):
+        """(Re)loads the matrix when scans were added or removed since the last load."""
+        cursor.execute("SELECT COUNT(*), MAX(scan_id) FROM scans;")
+        fingerprint = cursor.fetchone()
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self.load(load_vulnerability_matrix(cursor))
+                self.fingerprint = fingerprint
+
+    def score(self, weights, matrix=None):
+        """Returns an array of shape (profiles, scans) with the normalised risk score (0-100) per scan."""
+        scans, vuln_priority, vuln_starts, scan_starts, owasp = matrix or self.matrix
+        vuln_count = scans['vuln_count'].to_numpy().astype(np.float64)
+        scores = np.zeros((len(weights), len(vuln_count)))
+        found = vuln_count > 0
+        if not found.any():
+            return scores
+        vuln_count = vuln_count[found]
+        max_score = vuln_count * MAX_PRIORITY * MAX_WEIGHT
+        scaling = 1 + (vuln_count - 1) * SCALING_STEP
+
+        for start in range(0, len(weights), USER_BLOCK):
+            block = weights[start:start + USER_BLOCK]
+            row_weights = block[:, owasp]
+            vuln_weights = np.maximum.reduceat(row_weights, vuln_starts, axis=1)
+            base = np.add.reduceat(vuln_weights * vuln_priority, scan_starts, axis=1)
+            scores[start:start + USER_BLOCK, found] = base * scaling / max_score * 100
+        return scores
+
+    def ranking(self, user_ids, weights, latest_only=True, limit=None):
+        """Top scans per user ranked by risk score, either the latest scan of every URL or every scan."""
+        matrix = self.matrix
+        if matrix is None or len(matrix[0]) == 0 or len(user_ids) == 0:
+            return pd.DataFrame(columns=['user_id', 'rank', 'scan_id', 'scan_url', 'scan_date', 'vuln_count', 'risk_score'])
+
+        scans = matrix[0]
+        scores = self.score(weights, matrix)
+        if latest_only:
+            latest = scans.sort_values('scan_date', kind='stable').drop_duplicates('scan_url', keep='last').index.to_numpy()
+            scans = scans.iloc[latest]
+            scores = scores[:, latest]
+
+        # Column order of every profile from the highest to the lowest score
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :limit]
+        result = scans.iloc[order.ravel()].reset_index(drop=True)
+        result.insert(0, 'user_id', np.repeat(user_ids, order.shape[1]))
+        result.insert(1, 'rank', np.tile(np.arange(1, order.shape[1] + 1), len(user_ids)))
+        result['risk_score'] = np.take_along_axis(scores, order, axis=1).ravel()
+        return result
+
+
+def scan_score_rows(engine, user_ids, weights):
+    """
+    Flattens the scores of every loaded scan and profile into rows for scan_risk_scores. Scans
+    without findings get a row with score 0, so the timeline shows them instead of a gap.
+    """
+    scans = engine.matrix[0]
+    scores = engine.score(weights)
+    scan_ids = scans['scan_id'].tolist()
+    scan_urls = scans['scan_url'].tolist()
+    scan_dates = pd.to_datetime(scans['scan_date']).dt.to_pydatetime().tolist()
+    vuln_counts = scans['vuln_count'].tolist()
+
+    rows = []
+    for user_id, user_scores in zip(user_ids, scores):
+        rows += zip([user_id] * len(scan_ids), scan_ids, scan_urls, scan_dates, vuln_counts, user_scores.tolist())
+    return rows
+
+
+def store_scan_scores(cursor, rows):
+    execute_values(cursor, """
+        INSERT INTO scan_risk_scores (user_id, scan_id, scan_url, scan_date, vuln_count, risk_score)
+        VALUES %s
+        ON CONFLICT (user_id, scan_id) DO UPDATE
+        SET vuln_count = EXCLUDED.vuln_count, risk_score = EXCLUDED.risk_score, scored_at = now();
+    """, rows, page_size=1000)
+
+
+def refresh_scan_scores(connection_1, connection_2, scan_ids=None, user_ids=None, engine=None):
+    """
+    Recomputes scan_risk_scores in api_dashboard with the weights from user_database.
+    scan_ids limits the work to newly ingested scans, user_ids to the profiles whose weights
+    changed. A loaded engine (the API's) is reused instead of reading the matrix again.
+    Returns the number of stored scores.
+    """
+    cursor_1 = connection_1.cursor()
+    cursor_2 = connection_2.cursor()
+    try:
+        users, weights = load_weight_profiles(cursor_2, load_owasp_ids(cursor_1), user_ids)
+        connection_2.rollback()
+        if not users:
+            return 0
+
+        if engine is None:
+            engine = RiskEngine()
+            engine.load(load_vulnerability_matrix(cursor_1, scan_ids))
+        else:
+            engine.ensure_loaded(cursor_1)
+
+        rows = scan_score_rows(engine, users, weights)
+        store_scan_scores(cursor_1, rows)
+        connection_1.commit()
+        return len(rows)
+    except Exception:
+        connection_1.rollback()
+        raise
+    finally:
+        cursor_1.close()
+        cursor_2.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Recomputes the stored risk scores of all scans.")
+    parser.add_argument('--user-id', type=int, action='append', help="Only rescore this user (can be repeated).")
+    args = parser.parse_args()
+
+    connection_1 = psycopg2.connect(**db_params_1)
+    connection_2 = psycopg2.connect(**db_params_2)
+
+    stored = refresh_scan_scores(connection_1, connection_2, user_ids=args.user_id)
+    print(f"Stored {stored} risk scores")
+    connection_1.close()
+    connection_2.close()
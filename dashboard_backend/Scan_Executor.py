@@ -0,0 +1,308 @@
+import datetime
+import os
+import queue
+import re
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class ScanJob:
+    """One passive or active ZAP scan. Requests for the same target share a job while it is not finished."""
+
+    def __init__(self, kind, target, docker_command, report_file, timeout=None, scan_input=None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.target = target
+        self.docker_command = docker_command
+        self.report_file = report_file
+        self.timeout = timeout
+        # What a ZAP daemon scans: the URL (passive) or the OpenAPI file path inside /zap/wrk (active)
+        self.scan_input = scan_input
+        self.status = QUEUED
+        self.created_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+        # (event type, data) in the order they happened, streamed by /scan-jobs/<id>/events
+        self.events = []
+        self.changed = threading.Condition()
+
+    @property
+    def key(self):
+        return self.kind, self.target
+
+    @property
+    def container_name(self):
+        # docker_scan_command names the container after the report file
+        return os.path.splitext(self.report_file)[0]
+
+    def publish(self, event_type, **data):
+        with self.changed:
+            self.events.append((event_type, data))
+            self.changed.notify_all()
+
+    def finish(self, status, result):
+        with self.changed:
+            self.status = status
+            self.result = result
+            self.finished_at = datetime.datetime.now()
+            self.events.append(('finished', {"status": status, "result": result}))
+            self.done.set()
+            self.changed.notify_all()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def events_since(self, index, timeout=None):
+        """Events from index on, waits up to timeout for new ones while the job is not finished."""
+        with self.changed:
+            if len(self.events) <= index and not self.done.is_set():
+                self.changed.wait(timeout)
+            return self.events[index:]
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "target": self.target,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "report_file": self.report_file,
+            "result": self.result,
+        }
+
+
+def container_limits():
+    # CPU and memory caps for every scanner container, so a runaway scan cannot starve the other scans on the host
+    return ['--cpus', os.getenv('SCAN_CONTAINER_CPUS', '2'), '--memory', os.getenv('SCAN_CONTAINER_MEMORY', '2g')]
+
+
+def docker_scan_command(kind, output_directory, scan_target, report_file):
+    """
+    Arguments of the one-shot ZAP container for a passive scan of a URL or an active scan of an OpenAPI
+    file in output/openapi. They are run without a shell, so neither cmd.exe nor sh interprets the
+    target or the output path.
+    """
+    command = ['docker', 'run', '--rm', '--name', os.path.splitext(report_file)[0], *container_limits(),
+               '-v', f'{output_directory}:/zap/wrk', '-t', 'owasp/zap2docker-stable']
+    if kind == 'passive':
+        return command + ['zap-baseline.py', '-g', 'api-passive-scan.conf', '-t', scan_target, '-J', report_file]
+    return command + ['zap-api-scan.py', '-t', f'/zap/wrk/openapi/{scan_target}', '-f', 'openapi', '-J', report_file]
+
+
+def kill_container(name):
+    try:
+        subprocess.run(['docker', 'kill', name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print(f"Could not kill container {name}: {e}")
+
+
+def stop_container(job, process):
+    """Kills the job's container and the docker client, killing only the client would leave the container running."""
+    kill_container(job.container_name)
+    process.kill()
+    process.wait()
+
+
+def scan_succeeded(returncode, stdout_output):
+    success_pattern = r'Total of \d+ URLs'
+    match = re.search(success_pattern, stdout_output)
+    return returncode == 0 or (match and int(re.search(r'\d+', match.group()).group()) > 0)
+
+
+class ScanProgress:
+    """Turns the console output of zap-baseline.py / zap-api-scan.py into progress events of a job."""
+
+    url_pattern = re.compile(r'Total of (\d+) URLs')
+    rule_pattern = re.compile(r'^(PASS|IGNORE|INFO|WARN-NEW|WARN-INPROG|FAIL-NEW|FAIL-INPROG): (.*) \[(\d+)\](?: x (\d+))?')
+    summary_pattern = re.compile(r'FAIL-NEW: (\d+)\s+FAIL-INPROG: (\d+)\s+WARN-NEW: (\d+)\s+WARN-INPROG: (\d+)'
+                                 r'\s+INFO: (\d+)\s+IGNORE: (\d+)\s+PASS: (\d+)')
+
+    def __init__(self, job):
+        self.job = job
+        self.urls = 0
+        self.rules_run = 0
+        self.alerts = 0
+
+    def totals(self):
+        return {"urls": self.urls, "rules_run": self.rules_run, "alerts": self.alerts}
+
+    def feed(self, line):
+        match = self.url_pattern.search(line)
+        if match:
+            self.urls = int(match.group(1))
+            self.job.publish('urls', **self.totals())
+            return
+
+        match = self.rule_pattern.match(line)
+        if match:
+            outcome, rule, rule_id, count = match.groups()
+            self.rules_run += 1
+            if outcome not in ('PASS', 'IGNORE'):
+                self.alerts += int(count or 1)
+            self.job.publish('rule', outcome=outcome, rule=rule, rule_id=int(rule_id), **self.totals())
+            return
+
+        match = self.summary_pattern.search(line)
+        if match:
+            names = ['fail_new', 'fail_inprog', 'warn_new', 'warn_inprog', 'info', 'ignore', 'pass']
+            self.job.publish('summary', **dict(zip(names, map(int, match.groups()))), **self.totals())
+
+
+def read_lines(stream, name, lines):
+    for line in iter(stream.readline, b''):
+        lines.put((name, line.decode('utf-8', errors='replace').rstrip('\r\n')))
+    stream.close()
+    lines.put((name, None))
+
+
+def run_docker_scan(job):
+    """Runs the job's ZAP container to completion, publishing progress while it runs, and returns (status, result)."""
+    print("Docker command:", subprocess.list2cmdline(job.docker_command))
+    process = subprocess.Popen(job.docker_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Pipes cannot be polled with select on Windows, so one thread per pipe feeds a queue
+    # that is read with a timeout, which also enforces the job timeout.
+    lines = queue.Queue()
+    for stream, name in ((process.stdout, 'stdout'), (process.stderr, 'stderr')):
+        threading.Thread(target=read_lines, args=(stream, name, lines), daemon=True).start()
+
+    deadline = None if job.timeout is None else datetime.datetime.now() + datetime.timedelta(seconds=job.timeout)
+    progress = ScanProgress(job)
+    output = {'stdout': [], 'stderr': []}
+    open_streams = 2
+    while open_streams:
+        if job.cancelled.is_set():
+            stop_container(job, process)
+            print("Scan cancelled")
+            return CANCELLED, {"error": "Scan cancelled"}
+        if deadline is not None and datetime.datetime.now() > deadline:
+            stop_container(job, process)
+            print("Scan timed out")
+            return FAILED, {"error": "Scan timed out", "timeout_seconds": job.timeout}
+        try:
+            name, line = lines.get(timeout=1)
+        except queue.Empty:
+            continue
+        if line is None:
+            open_streams -= 1
+            continue
+        print(f"{name.upper()}: {line}")
+        output[name].append(line)
+        if name == 'stdout':
+            progress.feed(line)
+    returncode = process.wait()
+
+    stdout_output = '\n'.join(output['stdout'])
+    stderr_output = '\n'.join(output['stderr'])
+
+    if scan_succeeded(returncode, stdout_output):
+        print("Scan completed successfully")
+        return SUCCEEDED, {"message": "URL successfully scanned"}
+    print("Scan failed with errors")
+    return FAILED, {"error": "Scan failed", "details": stderr_output}
+
+
+class ScanExecutor:
+    """
+    Runs scans on a fixed number of worker threads and keeps the jobs in memory.
+    A request for a target that already has a queued or running job gets that job
+    instead of a second container (request coalescing). on_success(job) is called on
+    the worker thread after a successful scan, a dict it returns is added to the result.
+    """
+
+    def __init__(self, max_workers=2, keep_finished=datetime.timedelta(hours=24), runner=run_docker_scan,
+                 on_success=None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan')
+        self.runner = runner
+        self.on_success = on_success
+        self.keep_finished = keep_finished
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.active = {}
+
+    def submit(self, kind, target, docker_command, report_file, timeout=None, scan_input=None):
+        """Returns (job, coalesced). coalesced is True if an unfinished job for the same target was reused."""
+        with self.lock:
+            self.forget_old_jobs()
+            running = self.active.get((kind, target))
+            if running is not None:
+                return running, True
+
+            job = ScanJob(kind, target, docker_command, report_file, timeout, scan_input)
+            self.jobs[job.job_id] = job
+            self.active[job.key] = job
+        self.pool.submit(self.run, job)
+        return job, False
+
+    def run(self, job):
+        if job.cancelled.is_set():
+            job.finish(CANCELLED, {"error": "Scan cancelled"})
+            return
+        job.status = RUNNING
+        job.started_at = datetime.datetime.now()
+        job.publish('started', kind=job.kind, target=job.target)
+        try:
+            status, result = self.runner(job)
+        except Exception as e:
+            print("Exception during scan:", e)
+            status, result = FAILED, {"error": "An unexpected error occurred", "details": str(e)}
+        if status == SUCCEEDED and self.on_success is not None:
+            try:
+                result = {**result, **(self.on_success(job) or {})}
+            except Exception as e:
+                print("Exception in the completion hook:", e)
+        with self.lock:
+            if self.active.get(job.key) is job:
+                del self.active[job.key]
+        job.finish(status, result)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job, the runner stops its container. Returns the job or None."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return job
+            job.cancelled.set()
+            # A new request for the same target starts a new scan instead of joining the cancelled one
+            if self.active.get(job.key) is job:
+                del self.active[job.key]
+        job.publish('cancelling')
+        return job
+
+    def list_jobs(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def recent_success(self, kind, target, window):
+        """The newest job for target that succeeded within window, if any."""
+        since = datetime.datetime.now() - window
+        with self.lock:
+            finished = [job for job in self.jobs.values()
+                        if job.key == (kind, target) and job.status == SUCCEEDED and job.finished_at >= since]
+        return max(finished, key=lambda job: job.finished_at, default=None)
+
+    def forget_old_jobs(self):
+        limit = datetime.datetime.now() - self.keep_finished
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.status in FINISHED_STATES and job.finished_at < limit]:
+            del self.jobs[job_id]
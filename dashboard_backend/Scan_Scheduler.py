@@ -0,0 +1,190 @@
+import random
+import threading
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timedelta
+
+import psycopg2
+
+# Only the process holding this session lock schedules, the caps count the scans of that process
+SCHEDULER_LOCK_KEY = 2024082204
+
+# Field ranges of the 5-field cron expressions: minute hour day-of-month month day-of-week
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        range_part, _, step = part.partition('/')
+        if range_part == '*':
+            start, end = low, high
+        elif '-' in range_part:
+            start, end = map(int, range_part.split('-', 1))
+        else:
+            start = end = int(range_part)
+            if step:
+                end = high
+        step = int(step) if step else 1
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expression):
+    """
+    Parses a cron expression ("minute hour day-of-month month day-of-week") like "30 2 * * *".
+    Supports *, lists, ranges and steps. Raises ValueError for invalid expressions.
+    """
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f"A cron expression needs 5 fields: {expression}")
+    try:
+        minutes, hours, days, months, weekdays = (parse_cron_field(field, low, high)
+                                                  for field, (low, high) in zip(fields, CRON_FIELDS))
+    except ValueError:
+        raise ValueError(f"Invalid cron expression: {expression}")
+    # 0 and 7 are both Sunday, cron counts the weekdays from Sunday, Python from Monday
+    weekdays = {(day - 1) % 7 for day in weekdays}
+    # Like cron: if day of month and day of week are both restricted, either of them matches
+    day_or = fields[2] != '*' and fields[4] != '*'
+    return minutes, hours, days, months, weekdays, day_or
+
+
+def next_cron_time(expression, after):
+    """The first time after `after` (to the minute) that matches the cron expression."""
+    minutes, hours, days, months, weekdays, day_or = parse_cron(expression)
+    time = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = time + timedelta(days=5 * 366)
+    while time < limit:
+        if time.month not in months:
+            time = (time.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        day_matches = (time.day in days, time.weekday() in weekdays)
+        if not (any(day_matches) if day_or else all(day_matches)):
+            time = time.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if time.hour not in hours:
+            time = time.replace(minute=0) + timedelta(hours=1)
+            continue
+        if time.minute not in minutes:
+            time += timedelta(minutes=1)
+            continue
+        return time
+    raise ValueError(f"Cron expression never matches: {expression}")
+
+
+def next_run_time(expression, jitter_seconds, after):
+    # The jitter spreads schedules with the same cron expression over the jitter window
+    return next_cron_time(expression, after) + timedelta(seconds=random.uniform(0, jitter_seconds or 0))
+
+
+class ScanScheduler:
+    """
+    Starts the scans of the due entries of scan_schedules. At most max_concurrent scheduled scans
+    run at the same time and at most max_per_host against the same host, due schedules over a cap
+    wait for the next tick. The running scans are only known to the process that started them, so
+    of several API processes only the one holding the SCHEDULER_LOCK_KEY advisory lock schedules,
+    the others take over when its connection goes away.
+    submit(url) starts the scan and returns the job, or None if the URL does not need a scan.
+    """
+
+    def __init__(self, db_params, submit, max_concurrent=4, max_per_host=1, tick_seconds=30):
+        self.db_params = db_params
+        self.submit = submit
+        self.max_concurrent = max_concurrent
+        self.max_per_host = max_per_host
+        self.tick_seconds = tick_seconds
+        self.running = []
+        self.stopping = threading.Event()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def is_leader(self, connection):
+        """Takes the scheduler lock on the first call, it stays with the connection until it is closed."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT pg_try_advisory_lock(%s);", (SCHEDULER_LOCK_KEY,))
+            locked = cursor.fetchone()[0]
+            connection.commit()
+            return locked
+        finally:
+            cursor.close()
+
+    def tick(self, connection):
+        if not self.is_leader(connection):
+            return 0
+        self.running = [(host, job) for host, job in self.running if not job.done.is_set()]
+        free = self.max_concurrent - len(self.running)
+        if free <= 0:
+            return 0
+        per_host = Counter(host for host, _ in self.running)
+
+        now = datetime.now()
+        cursor = connection.cursor()
+        started = 0
+        try:
+            cursor.execute("""
+                SELECT schedule_id, scan_url, cron, jitter_seconds FROM scan_schedules
+                WHERE enabled AND next_run_at <= %s
+                ORDER BY next_run_at
+                LIMIT 500;
+            """, (now,))
+            due = cursor.fetchall()
+            connection.commit()
+            for schedule_id, scan_url, cron, jitter_seconds in due:
+                if started >= free:
+                    break
+                host = urllib.parse.urlsplit(scan_url).netloc
+                if per_host[host] >= self.max_per_host:
+                    continue
+
+                try:
+                    job = self.submit(scan_url)
+                except Exception as e:
+                    # The schedule stays due and is tried again with the next tick
+                    print(f"Could not start the scheduled scan of {scan_url}: {e}")
+                    continue
+                if job is not None:
+                    self.running.append((host, job))
+                    per_host[host] += 1
+                    started += 1
+                # Committed per schedule, an error later in the loop does not start this scan again
+                cursor.execute("""
+                    UPDATE scan_schedules SET next_run_at = %s, last_run_at = %s, last_job_id = %s
+                    WHERE schedule_id = %s;
+                """, (next_run_time(cron, jitter_seconds, now), now, job.job_id if job else None, schedule_id))
+                connection.commit()
+            return started
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def run(self):
+        connection = None
+        while not self.stopping.wait(self.tick_seconds):
+            try:
+                if connection is None or connection.closed:
+                    connection = psycopg2.connect(**self.db_params)
+                started = self.tick(connection)
+                if started:
+                    print(f"Scheduler started {started} scans")
+            except Exception as e:
+                print(f"Error in the scan scheduler: {e}")
+                if connection is not None:
+                    connection.close()
+                connection = None
+
+    def start(self):
+        """Starts the scheduler thread on the first call."""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        threading.Thread(target=self.run, name='scan-scheduler', daemon=True).start()
+
+    def stop(self):
+        self.stopping.set()
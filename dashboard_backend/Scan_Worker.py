@@ -0,0 +1,365 @@
+import argparse
+import os
+import socket
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import Json
+from flask.cli import load_dotenv
+
+from Ingest_Report import ingest_report_file
+from Scan_Executor import FAILED, FINISHED_STATES, SUCCEEDED, ScanJob, docker_scan_command, run_docker_scan
+from Zap_Pool import DEFAULT_DAEMON_COMMAND, ZapDaemonPool
+
+load_dotenv()
+
+# Connection parameters
+db_params = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+# A worker extends the lease of its running scans every HEARTBEAT_SECONDS, which is also how
+# fast it notices cancelled scans. A scan whose lease ran out (worker crashed or lost the
+# database) is picked up by another worker.
+LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 10
+
+# Failed scans are queued again after RETRY_DELAY_SECONDS x attempts
+RETRY_DELAY_SECONDS = 30
+
+
+def connect_to_db():
+    try:
+        connection = psycopg2.connect(**db_params)
+        print("Connected to the database!")
+        return connection
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def enqueue_scan(connection, job, scan_file=None, max_attempts=3):
+    """Puts a scan job of the API into scan_queue. scan_file is the OpenAPI file of an active scan."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO scan_queue (job_id, kind, target, scan_input, scan_file, report_file, timeout_seconds, max_attempts)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+        """, (job.job_id, job.kind, job.target, job.scan_input, scan_file, job.report_file, job.timeout, max_attempts))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def claim_scan(connection, worker_id, lease_seconds=LEASE_SECONDS):
+    """
+    Takes the oldest queued scan (or one whose lease expired) for worker_id. SKIP LOCKED lets
+    any number of workers claim at the same time without waiting for each other.
+    Returns the row as dict or None if nothing is waiting.
+    """
+    cursor = connection.cursor()
+    try:
+        # Scans that lost their worker too often or were cancelled while their worker was gone are given up
+        cursor.execute("""
+            UPDATE scan_queue
+            SET status = 'cancelled', finished_at = now(), result = '{"error": "Scan cancelled"}'::jsonb
+            WHERE status = 'running' AND lease_until < now() AND cancel_requested;
+        """)
+        cursor.execute("""
+            UPDATE scan_queue
+            SET status = 'failed', finished_at = now(),
+                result = jsonb_build_object('error', 'Scan failed', 'details', 'Scan worker lost ' || worker_id)
+            WHERE status = 'running' AND lease_until < now() AND attempts >= max_attempts;
+        """)
+        cursor.execute("""
+            UPDATE scan_queue
+            SET status = 'running', worker_id = %s, attempts = attempts + 1,
+                lease_until = now() + make_interval(secs => %s), started_at = now()
+            WHERE job_id = (
+                SELECT job_id FROM scan_queue
+                WHERE (status = 'queued' AND available_at <= now())
+                   OR (status = 'running' AND lease_until < now() AND attempts < max_attempts)
+                ORDER BY created_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING job_id, kind, target, scan_input, scan_file, report_file, timeout_seconds, attempts, max_attempts;
+        """, (worker_id, lease_seconds))
+        row = cursor.fetchone()
+        connection.commit()
+        if row is None:
+            return None
+        columns = [column.name for column in cursor.description]
+        return dict(zip(columns, row))
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def extend_leases(connection, worker_id, job_ids, lease_seconds=LEASE_SECONDS):
+    """
+    Extends the leases of the scans in job_ids the worker is still running and returns the job_ids of
+    those that were cancelled. A scan whose slot is gone (its thread died) keeps the old lease and
+    runs out, so another worker picks it up.
+    """
+    if not job_ids:
+        return []
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            UPDATE scan_queue SET lease_until = now() + make_interval(secs => %s)
+            WHERE worker_id = %s AND status = 'running' AND job_id = ANY(%s)
+            RETURNING job_id, cancel_requested;
+        """, (lease_seconds, worker_id, list(job_ids)))
+        cancelled = [job_id for job_id, cancel_requested in cursor.fetchall() if cancel_requested]
+        connection.commit()
+        return cancelled
+    finally:
+        cursor.close()
+
+
+def request_cancel(connection, job_id):
+    """A queued scan is cancelled right away, a running one by its worker at the next heartbeat."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            UPDATE scan_queue
+            SET cancel_requested = TRUE,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END,
+                result = CASE WHEN status = 'queued' THEN '{"error": "Scan cancelled"}'::jsonb ELSE result END
+            WHERE job_id = %s AND status IN ('queued', 'running');
+        """, (job_id,))
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def complete_scan(connection, claim, worker_id, status, result):
+    """
+    Stores the outcome of a claimed scan. A failed (not timed out) scan is queued again with a growing delay
+    until max_attempts is reached. Returns False if the lease was lost to another worker.
+    """
+    # A scan that ran into its timeout would most likely hang again
+    retry = (status == FAILED and result.get('error') != "Scan timed out"
+             and claim['attempts'] < claim['max_attempts'])
+    cursor = connection.cursor()
+    try:
+        if retry:
+            cursor.execute("""
+                UPDATE scan_queue
+                SET status = 'queued', worker_id = NULL, lease_until = NULL, result = %s,
+                    available_at = now() + make_interval(secs => %s)
+                WHERE job_id = %s AND worker_id = %s AND status = 'running';
+            """, (Json(result), RETRY_DELAY_SECONDS * claim['attempts'], claim['job_id'], worker_id))
+        else:
+            cursor.execute("""
+                UPDATE scan_queue
+                SET status = %s, result = %s, lease_until = NULL, finished_at = now()
+                WHERE job_id = %s AND worker_id = %s AND status = 'running';
+            """, (status, Json(result), claim['job_id'], worker_id))
+        updated = cursor.rowcount == 1
+        connection.commit()
+        return updated
+    finally:
+        cursor.close()
+
+
+class QueueRunner:
+    """
+    Runner for the API's ScanExecutor that hands the scan to the workers through scan_queue
+    and waits for its result, so coalescing, wait=false and /scan-jobs keep working.
+    """
+
+    def __init__(self, input_directory, poll_seconds=2, max_attempts=3):
+        self.input_directory = input_directory
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+
+    def __call__(self, job):
+        connection = connect_to_db()
+        if connection is None:
+            return FAILED, {"error": "An unexpected error occurred", "details": "No database connection"}
+        try:
+            scan_file = None
+            if job.kind == 'active':
+                with open(os.path.join(self.input_directory, os.path.basename(job.scan_input)), 'rb') as file:
+                    scan_file = psycopg2.Binary(file.read())
+            enqueue_scan(connection, job, scan_file, self.max_attempts)
+            job.publish('queued')
+
+            cursor = connection.cursor()
+            worker_id = None
+            cancel_sent = False
+            while True:
+                if job.cancelled.is_set() and not cancel_sent:
+                    request_cancel(connection, job.job_id)
+                    cancel_sent = True
+                cursor.execute("SELECT status, worker_id, attempts, result FROM scan_queue WHERE job_id = %s;", (job.job_id,))
+                status, current_worker, attempts, result = cursor.fetchone()
+                connection.rollback()
+                if status in FINISHED_STATES:
+                    return status, result
+                if current_worker is not None and current_worker != worker_id:
+                    job.publish('claimed', worker_id=current_worker, attempt=attempts)
+                    worker_id = current_worker
+                time.sleep(self.poll_seconds)
+        finally:
+            connection.close()
+
+
+class ScanWorker:
+    """Claims scans from scan_queue with up to concurrency scans at a time, runs them and ingests the reports."""
+
+    def __init__(self, worker_id, output_directory, concurrency=1, poll_seconds=5, zap_pool=None):
+        self.worker_id = worker_id
+        self.output_directory = output_directory
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.zap_pool = zap_pool
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.running = {}
+
+    def scan_job(self, claim):
+        """Turns a claimed row into a ScanJob that runs on this host."""
+        if claim['kind'] == 'active':
+            # The OpenAPI file was uploaded to the API host, the worker keeps its own copy
+            filename = os.path.basename(claim['scan_input'])
+            os.makedirs(os.path.join(self.output_directory, 'openapi'), exist_ok=True)
+            with open(os.path.join(self.output_directory, 'openapi', filename), 'wb') as file:
+                file.write(bytes(claim['scan_file']))
+            scan_target, scan_input = filename, f'/zap/wrk/openapi/{filename}'
+        else:
+            scan_target = scan_input = claim['scan_input']
+
+        job = ScanJob(claim['kind'], claim['target'],
+                      docker_scan_command(claim['kind'], self.output_directory, scan_target, claim['report_file']),
+                      claim['report_file'], claim['timeout_seconds'], scan_input)
+        job.job_id = claim['job_id']
+        return job
+
+    def run_claim(self, claim):
+        print(f"Worker {self.worker_id} scanning {claim['target']} (job {claim['job_id']}, attempt {claim['attempts']})")
+        try:
+            # Inside the try, a claim whose OpenAPI file cannot be written is completed as failed
+            job = self.scan_job(claim)
+            with self.lock:
+                self.running[job.job_id] = job
+            status, result = self.zap_pool.run(job) if self.zap_pool is not None else run_docker_scan(job)
+        except Exception as e:
+            status, result = FAILED, {"error": "An unexpected error occurred", "details": str(e)}
+        finally:
+            with self.lock:
+                self.running.pop(claim['job_id'], None)
+
+        if status == SUCCEEDED:
+            try:
+                scan_ids = ingest_report_file(os.path.join(self.output_directory, job.report_file))
+                result = {**result, "scan_id": scan_ids[0] if scan_ids else None, "scan_ids": scan_ids}
+            except Exception as e:
+                result = {**result, "ingest_error": str(e)}
+        return status, result
+
+    def work(self, slot):
+        """One of the concurrency slots: claims, runs and completes scans until the worker stops."""
+        connection = None
+        while not self.stopping.is_set():
+            try:
+                if connection is None or connection.closed:
+                    connection = connect_to_db()
+                    if connection is None:
+                        self.stopping.wait(self.poll_seconds)
+                        continue
+
+                claim = claim_scan(connection, self.worker_id)
+                if claim is None:
+                    self.stopping.wait(self.poll_seconds)
+                    continue
+
+                status, result = self.run_claim(claim)
+                if complete_scan(connection, claim, self.worker_id, status, result):
+                    print(f"Worker {self.worker_id} finished job {claim['job_id']}: {status}")
+                else:
+                    print(f"Worker {self.worker_id} lost the lease of job {claim['job_id']}, result discarded")
+            except psycopg2.Error as e:
+                print(f"Database error in worker slot {slot}: {e}")
+                if connection is not None:
+                    connection.close()
+                connection = None
+                self.stopping.wait(self.poll_seconds)
+        if connection is not None:
+            connection.close()
+
+    def heartbeat(self):
+        connection = None
+        while not self.stopping.wait(HEARTBEAT_SECONDS):
+            try:
+                if connection is None or connection.closed:
+                    connection = connect_to_db()
+                if connection is None:
+                    continue
+                with self.lock:
+                    job_ids = list(self.running)
+                for job_id in extend_leases(connection, self.worker_id, job_ids):
+                    with self.lock:
+                        job = self.running.get(job_id)
+                    if job is not None and not job.cancelled.is_set():
+                        print(f"Cancelling job {job_id}")
+                        job.cancelled.set()
+            except psycopg2.Error as e:
+                print(f"Could not extend the leases of worker {self.worker_id}: {e}")
+                connection = None
+
+    def run(self):
+        print(f"Scan worker {self.worker_id} started with {self.concurrency} slots")
+        threading.Thread(target=self.heartbeat, daemon=True).start()
+        slots = [threading.Thread(target=self.work, args=(slot,), name=f"scan-worker-{slot}")
+                 for slot in range(self.concurrency)]
+        for thread in slots:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in slots):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("Stopping, running scans are finished first")
+            self.stopping.set()
+            for thread in slots:
+                thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the scans queued by the API (SCAN_QUEUE=true) on this host.")
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('SCAN_WORKER_CONCURRENCY', '1')),
+                        help="Scans this worker runs at the same time.")
+    parser.add_argument('--poll-seconds', type=float, default=5,
+                        help="Seconds to wait before asking for work again when the queue is empty.")
+    parser.add_argument('--output', default=os.getenv('OUTPUT'), help="Directory for reports and OpenAPI files.")
+    args = parser.parse_args()
+
+    if args.output is None or not os.path.isdir(args.output):
+        print(f"Error: The directory {args.output} does not exist or is not set.")
+        exit(1)
+
+    pool = None
+    if int(os.getenv('ZAP_POOL_SIZE', '0')) > 0:
+        pool = ZapDaemonPool(
+            size=int(os.getenv('ZAP_POOL_SIZE')),
+            output_directory=args.output,
+            recycle_after=int(os.getenv('ZAP_POOL_RECYCLE_AFTER', '20')),
+            base_port=int(os.getenv('ZAP_POOL_BASE_PORT', '8090')),
+            command=os.getenv('ZAP_DAEMON_COMMAND', DEFAULT_DAEMON_COMMAND),
+        )
+        pool.start()
+
+    ScanWorker(args.worker_id, args.output, args.concurrency, args.poll_seconds, pool).run()
+    if pool is not None:
+        pool.shutdown()
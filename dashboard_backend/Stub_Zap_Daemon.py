@@ -0,0 +1,147 @@
+import argparse
+import json
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Answers the part of the ZAP API that Zap_Pool.py uses, so the daemon pool can be tried
+# without Docker, e.g.:
+# set ZAP_POOL_SIZE=2
+# set ZAP_DAEMON_COMMAND=python Stub_Zap_Daemon.py --port {port} --api-key {api_key}
+
+
+class StubZap:
+    def __init__(self, api_key, scan_seconds):
+        self.api_key = api_key
+        self.scan_seconds = scan_seconds
+        self.lock = threading.Lock()
+        self.new_session()
+
+    def new_session(self):
+        with self.lock:
+            self.sites = []
+            self.scans = {}
+
+    def start_scan(self, url):
+        with self.lock:
+            scan_id = str(len(self.scans))
+            self.scans[scan_id] = time.monotonic()
+            parsed = urllib.parse.urlsplit(url)
+            site = f"{parsed.scheme}://{parsed.netloc}"
+            if site not in self.sites:
+                self.sites.append(site)
+        return scan_id
+
+    def status(self, scan_id):
+        started = self.scans.get(scan_id)
+        if started is None:
+            return None
+        elapsed = time.monotonic() - started
+        return str(min(100, int(elapsed / self.scan_seconds * 100))) if self.scan_seconds else '100'
+
+    def report(self):
+        sites = []
+        for site in self.sites:
+            parsed = urllib.parse.urlsplit(site)
+            sites.append({
+                "@name": site,
+                "@host": parsed.hostname,
+                "@port": str(parsed.port or (443 if parsed.scheme == 'https' else 80)),
+                "@ssl": str(parsed.scheme == 'https').lower(),
+                "alerts": [{
+                    "pluginid": "10021",
+                    "alertRef": "10021",
+                    "alert": "X-Content-Type-Options Header Missing",
+                    "name": "X-Content-Type-Options Header Missing",
+                    "riskcode": "1",
+                    "confidence": "2",
+                    "riskdesc": "Low (Medium)",
+                    "desc": "<p>The Anti-MIME-Sniffing header X-Content-Type-Options was not set to 'nosniff'.</p>",
+                    "instances": [{"uri": site, "method": "GET", "param": "x-content-type-options"}],
+                    "count": "1",
+                    "solution": "<p>Set the X-Content-Type-Options header to 'nosniff'.</p>",
+                    "cweid": "693",
+                    "wascid": "15",
+                    "sourceid": "1",
+                }],
+            })
+        return {
+            "@programName": "ZAP",
+            "@version": "stub",
+            "@generated": datetime.now().strftime('%a, %d %b %Y %H:%M:%S'),
+            "site": sites,
+        }
+
+
+class StubZapHandler(BaseHTTPRequestHandler):
+    zap = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if params.get('apikey') != self.zap.api_key:
+            return self.send_json({"code": "bad_api_key", "message": "Missing or invalid API key"}, 403)
+
+        zap = self.zap
+        path = url.path.rstrip('/')
+        if path == '/JSON/core/view/version':
+            self.send_json({"version": "stub"})
+        elif path == '/JSON/core/action/newSession':
+            zap.new_session()
+            self.send_json({"Result": "OK"})
+        elif path == '/JSON/core/action/accessUrl':
+            self.send_json({"Result": "OK"})
+        elif path in ('/JSON/spider/action/scan', '/JSON/ascan/action/scan'):
+            self.send_json({"scan": zap.start_scan(params.get('url', ''))})
+        elif path in ('/JSON/spider/view/status', '/JSON/ascan/view/status'):
+            status = zap.status(params.get('scanId'))
+            if status is None:
+                return self.send_json({"code": "does_not_exist", "message": "Does Not Exist"}, 400)
+            self.send_json({"status": status})
+        elif path == '/JSON/spider/view/results':
+            status = zap.status(params.get('scanId'))
+            urls = [f"{site}/path{i}" for site in zap.sites for i in range(int(status or 0) // 10)]
+            self.send_json({"results": urls})
+        elif path == '/JSON/core/view/numberOfAlerts':
+            self.send_json({"numberOfAlerts": str(len(zap.sites))})
+        elif path == '/JSON/openapi/action/importFile':
+            zap.start_scan('http://openapi.example.com')
+            self.send_json({"importFile": []})
+        elif path == '/JSON/core/view/sites':
+            self.send_json({"sites": zap.sites})
+        elif path == '/JSON/pscan/view/recordsToScan':
+            self.send_json({"recordsToScan": "0"})
+        elif path == '/OTHER/core/other/jsonreport':
+            self.send_json(zap.report())
+        elif path == '/JSON/core/action/shutdown':
+            self.send_json({"Result": "OK"})
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            self.send_json({"code": "bad_view", "message": "No Implementor"}, 400)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Minimal stand-in for a ZAP daemon to test the scanner pool.")
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--api-key', required=True)
+    parser.add_argument('--scan-seconds', type=float, default=2,
+                        help="Seconds a spider or active scan takes to reach 100 percent.")
+    args = parser.parse_args()
+
+    StubZapHandler.zap = StubZap(args.api_key, args.scan_seconds)
+    server = ThreadingHTTPServer(('localhost', args.port), StubZapHandler)
+    print(f"Stub ZAP daemon listening on port {args.port}")
+    server.serve_forever()
@@ -0,0 +1,339 @@
+import argparse
+import gzip
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import sql
+from flask.cli import load_dotenv
+
+from Manage_Partitions import ensure_month_partitions
+
+load_dotenv()
+
+# Connection parameters
+db_params_1 = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+db_params_2 = {
+    'database': os.getenv('DB2_NAME', 'user_database'),
+    'user': os.getenv('DB2_USER', 'postgres'),
+    'password': os.getenv('DB2_PASSWORD', 'postgres'),
+    'host': os.getenv('DB2_HOST', 'localhost'),
+    'port': os.getenv('DB2_PORT', '5432'),
+}
+
+# Tables per database as (table, chunk key, serial column). Tables in the same group do not
+# reference each other and are transferred in parallel, the groups are imported one after another.
+TRANSFER_PLAN = {
+    'api_dashboard': [
+        [('tools', None, 'tool_id'), ('owasp_categories', None, None), ('priorities', None, None),
+         ('scan_schedules', None, 'schedule_id'), ('deleted_scans', None, None)],
+        [('scans', 'scan_id', 'scan_id'), ('scan_daily_aggregates', None, None),
+         ('scan_daily_counts', None, None), ('scan_risk_scores', 'scan_id', None)],
+        [('vulnerabilities', 'vuln_id', 'vuln_id')],
+        [('vuln_owasp', 'vuln_id', None)],
+    ],
+    'user_database': [
+        [('users', None, 'user_id'), ('default_weights', None, None)],
+        [('riskometer_weights', None, None), ('weight_profile_versions', None, None)],
+    ],
+}
+
+DATABASES = {
+    'api_dashboard': db_params_1,
+    'user_database': db_params_2,
+}
+
+MANIFEST = 'manifest.json'
+
+
+def connect_to_db(db_params):
+    try:
+        connection = psycopg2.connect(**db_params)
+        return connection
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+
+def table_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position;
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def chunk_ranges(cursor, table, key, chunk_rows):
+    """Splits table into key ranges of roughly chunk_rows rows, or a single chunk if it has no chunk key."""
+    if key is None:
+        return [(None, None)]
+    cursor.execute(sql.SQL("SELECT MIN({key}), MAX({key}) FROM {table};").format(
+        key=sql.Identifier(key), table=sql.Identifier(table)))
+    low, high = cursor.fetchone()
+    if low is None:
+        return [(None, None)]
+    return [(start, min(start + chunk_rows, high + 1)) for start in range(low, high + 1, chunk_rows)]
+
+
+def chunk_file(directory, database, table, number):
+    return os.path.join(directory, database, table, f"{table}.{number:05d}.csv.gz")
+
+
+def export_chunk(db_params, snapshot, table, key, columns, bounds, path, compresslevel):
+    if os.path.exists(path):
+        return path, False
+
+    connection = connect_to_db(db_params)
+    if connection is None:
+        raise RuntimeError(f"Unable to connect to the database for {table}")
+    try:
+        cursor = connection.cursor()
+        # All chunks of one export run read from the coordinator's snapshot
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        cursor.execute("SET TRANSACTION SNAPSHOT %s;", (snapshot,))
+
+        select = sql.SQL("SELECT {columns} FROM {table}").format(
+            columns=sql.SQL(', ').join(map(sql.Identifier, columns)), table=sql.Identifier(table))
+        if bounds != (None, None):
+            select += sql.SQL(" WHERE {key} >= {low} AND {key} < {high}").format(
+                key=sql.Identifier(key), low=sql.Literal(bounds[0]), high=sql.Literal(bounds[1]))
+        copy = sql.SQL("COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true)").format(select=select)
+
+        # Written to a .part file first so an interrupted export never leaves a truncated chunk behind
+        with gzip.open(path + '.part', 'wb', compresslevel=compresslevel) as file:
+            cursor.copy_expert(copy.as_string(connection), file)
+        os.replace(path + '.part', path)
+        connection.rollback()
+        return path, True
+    finally:
+        connection.close()
+
+
+def write_manifest(manifest_path, manifest):
+    with open(manifest_path + '.part', 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_path + '.part', manifest_path)
+
+
+def chunk_file_name(chunk):
+    # Manifests of older exports list the file names only
+    return chunk if isinstance(chunk, str) else chunk['file']
+
+
+def export_database(database, directory, jobs, chunk_rows, compresslevel):
+    """
+    Exports database into chunks. The chunk bounds are written to the manifest before the first
+    chunk, a resumed export reuses them so every row still lands in exactly one chunk. Chunks of
+    one run read from the same snapshot, chunks exported by a resumed run come from a newer one:
+    the manifest records the snapshot of every chunk and is only marked consistent if all chunks
+    share one (otherwise e.g. a finding can reference a scan that was deleted in between).
+    """
+    db_params = DATABASES[database]
+    coordinator = connect_to_db(db_params)
+    if coordinator is None:
+        return None
+
+    manifest_path = os.path.join(directory, database, MANIFEST)
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+    try:
+        coordinator.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = coordinator.cursor()
+        cursor.execute("SELECT pg_export_snapshot();")
+        snapshot = cursor.fetchone()[0]
+
+        if manifest is None:
+            manifest = {'export_id': uuid.uuid4().hex, 'tables': {}}
+            for group in TRANSFER_PLAN[database]:
+                for table, key, serial in group:
+                    columns = table_columns(cursor, table)
+                    if not columns:
+                        print(f"Skipping {database}.{table}, the table does not exist")
+                        continue
+                    ranges = chunk_ranges(cursor, table, key, chunk_rows)
+                    manifest['tables'][table] = {
+                        'columns': columns,
+                        'serial': serial,
+                        'chunks': [{'file': os.path.basename(chunk_file(directory, database, table, number)),
+                                    'bounds': list(bounds), 'snapshot': None}
+                                   for number, bounds in enumerate(ranges)],
+                    }
+                    if table == 'scans':
+                        cursor.execute("SELECT DISTINCT date_trunc('month', scan_date) FROM scans ORDER BY 1;")
+                        manifest['tables'][table]['months'] = [row[0].strftime('%Y-%m-%d') for row in cursor.fetchall()]
+            # Chunk files without a manifest belong to an unknown run and may have other bounds
+            for table, entry in manifest['tables'].items():
+                for chunk in entry['chunks']:
+                    path = os.path.join(directory, database, table, chunk['file'])
+                    if os.path.exists(path):
+                        os.remove(path)
+            os.makedirs(os.path.join(directory, database), exist_ok=True)
+            write_manifest(manifest_path, manifest)
+        elif any(isinstance(chunk, str) for entry in manifest['tables'].values() for chunk in entry['chunks']):
+            print(f"{manifest_path} has no chunk bounds, remove the export directory and export again")
+            return None
+        else:
+            print(f"Resuming the export of {database} with the chunk bounds of {manifest_path}")
+
+        tasks = []
+        for group in TRANSFER_PLAN[database]:
+            for table, key, _ in group:
+                if table not in manifest['tables']:
+                    continue
+                os.makedirs(os.path.join(directory, database, table), exist_ok=True)
+                columns = manifest['tables'][table]['columns']
+                for chunk in manifest['tables'][table]['chunks']:
+                    path = os.path.join(directory, database, table, chunk['file'])
+                    tasks.append((chunk, table, key, columns, tuple(chunk['bounds']), path))
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(export_chunk, db_params, snapshot, table, key, columns, bounds, path, compresslevel): chunk
+                       for chunk, table, key, columns, bounds, path in tasks}
+            for future in as_completed(futures):
+                path, written = future.result()
+                if written:
+                    futures[future]['snapshot'] = snapshot
+                    write_manifest(manifest_path, manifest)
+                print(f"{'Exported' if written else 'Already exported'}: {path}")
+
+        snapshots = {chunk['snapshot'] for entry in manifest['tables'].values() for chunk in entry['chunks']}
+        manifest['consistent'] = len(snapshots) == 1 and None not in snapshots
+        write_manifest(manifest_path, manifest)
+        if not manifest['consistent']:
+            print(f"The chunks of {database} come from {len(snapshots)} snapshots (resumed export), "
+                  f"they are consistent per chunk only")
+        print(f"Export of {database} finished, {len(tasks)} chunks in {os.path.join(directory, database)}")
+        return manifest
+    finally:
+        coordinator.rollback()
+        coordinator.close()
+
+
+def import_chunk(db_params, export_id, table, columns, path):
+    connection = connect_to_db(db_params)
+    if connection is None:
+        raise RuntimeError(f"Unable to connect to the database for {table}")
+    chunk_name = f"{export_id}/{os.path.basename(path)}"
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 FROM bulk_import_chunks WHERE chunk_name = %s;", (chunk_name,))
+        if cursor.fetchone():
+            return path, False
+
+        # COPY into a staging table so rows that already exist (e.g. seeded reference data) are skipped
+        column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+        cursor.execute(sql.SQL("CREATE TEMP TABLE staging (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;").format(
+            table=sql.Identifier(table)))
+        copy = sql.SQL("COPY staging ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)").format(columns=column_list)
+        with gzip.open(path, 'rb') as file:
+            cursor.copy_expert(copy.as_string(connection), file)
+        cursor.execute(sql.SQL("""
+            INSERT INTO {table} ({columns}) SELECT {columns} FROM staging ON CONFLICT DO NOTHING;
+        """).format(table=sql.Identifier(table), columns=column_list))
+
+        # Marked in the same transaction, so a chunk is either fully imported and recorded or not at all
+        cursor.execute("INSERT INTO bulk_import_chunks (chunk_name) VALUES (%s);", (chunk_name,))
+        connection.commit()
+        return path, True
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def import_database(database, directory, jobs):
+    db_params = DATABASES[database]
+    manifest_path = os.path.join(directory, database, MANIFEST)
+    if not os.path.exists(manifest_path):
+        print(f"Skipping {database}, no export found in {manifest_path}")
+        return False
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    export_id = manifest['export_id']
+    tables = manifest['tables']
+    if manifest.get('consistent') is False:
+        print(f"Warning: the export of {database} was resumed, its chunks come from different snapshots")
+
+    connection = connect_to_db(db_params)
+    if connection is None:
+        return False
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bulk_import_chunks (
+                chunk_name TEXT PRIMARY KEY,
+                imported_at TIMESTAMP NOT NULL DEFAULT now()
+            );
+        """)
+        if 'scans' in tables:
+            for month in tables['scans'].get('months', []):
+                ensure_month_partitions(cursor, datetime.strptime(month, '%Y-%m-%d'))
+        connection.commit()
+
+        for group in TRANSFER_PLAN[database]:
+            tasks = []
+            for table, _, _ in group:
+                if table not in tables:
+                    continue
+                tasks += [(table, tables[table]['columns'], os.path.join(directory, database, table, chunk_file_name(chunk)))
+                          for chunk in tables[table]['chunks']]
+
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(import_chunk, db_params, export_id, table, columns, path)
+                           for table, columns, path in tasks]
+                for future in futures:
+                    path, imported = future.result()
+                    print(f"{'Imported' if imported else 'Already imported'}: {path}")
+
+        # Continue the serial columns after the imported ids
+        for table, entry in tables.items():
+            if entry.get('serial'):
+                cursor.execute(sql.SQL("""
+                    SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({column}), 0) + 1, false) FROM {table};
+                """).format(column=sql.Identifier(entry['serial']), table=sql.Identifier(table)),
+                    (table, entry['serial']))
+        if 'scans' in tables:
+            cursor.execute("""
+                SELECT setval('ingest_seq', GREATEST(
+                    (SELECT COALESCE(MAX(scan_ingest_seq), 0) FROM scans),
+                    (SELECT COALESCE(MAX(vuln_ingest_seq), 0) FROM vulnerabilities),
+                    (SELECT COALESCE(MAX(delete_seq), 0) FROM deleted_scans)) + 1, false);
+            """)
+        connection.commit()
+        print(f"Import of {database} finished")
+        return True
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exports and imports the dashboard databases with COPY.")
+    parser.add_argument('mode', choices=['export', 'import'])
+    parser.add_argument('directory', help="Directory the gzip compressed CSV chunks are written to or read from.")
+    parser.add_argument('--database', choices=list(DATABASES), action='append',
+                        help="Only transfer this database (can be given twice), default both.")
+    parser.add_argument('--jobs', type=int, default=4, help="Number of tables/chunks transferred in parallel.")
+    parser.add_argument('--chunk-rows', type=int, default=500000,
+                        help="Key range per chunk, an interrupted run continues with the missing chunks.")
+    parser.add_argument('--compresslevel', type=int, default=6, choices=range(1, 10), metavar='1-9')
+    args = parser.parse_args()
+
+    for database in args.database or list(DATABASES):
+        if args.mode == 'export':
+            export_database(database, args.directory, args.jobs, args.chunk_rows, args.compresslevel)
+        else:
+            import_database(database, args.directory, args.jobs)
@@ -0,0 +1,37 @@
+TREND_BUCKETS = ('scan', 'day', 'week', 'month')
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets: picks max_points of the points (x[i], y[i]) that keep the shape
+    of the line. The first and last point are always kept. Returns the indexes in ascending order.
+    """
+    count = len(x)
+    if max_points >= count or max_points < 3:
+        return list(range(count))
+
+    indices = [0]
+    bucket_size = (count - 2) / (max_points - 2)
+    previous = 0
+    for bucket in range(max_points - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Third corner of the triangle: the average of the next bucket
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            average_x, average_y = x[count - 1], y[count - 1]
+        else:
+            average_x = sum(x[next_start:next_end]) / (next_end - next_start)
+            average_y = sum(y[next_start:next_end]) / (next_end - next_start)
+
+        best, best_area = start, -1
+        for index in range(start, end):
+            area = abs((x[previous] - average_x) * (y[index] - y[previous])
+                       - (x[previous] - x[index]) * (average_y - y[previous]))
+            if area > best_area:
+                best, best_area = index, area
+        indices.append(best)
+        previous = best
+    indices.append(count - 1)
+    return indices
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import re
+import select
+import threading
+import time
+
+import psycopg2
+from flask.cli import load_dotenv
+
+load_dotenv()
+
+# Connection parameters
+db_params_1 = {
+    'database': os.getenv('DB1_NAME', 'api_dashboard'),
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+db_params_2 = {
+    'database': os.getenv('DB2_NAME', 'user_database'),
+    'user': os.getenv('DB2_USER', 'postgres'),
+    'password': os.getenv('DB2_PASSWORD', 'postgres'),
+    'host': os.getenv('DB2_HOST', 'localhost'),
+    'port': os.getenv('DB2_PORT', '5432'),
+}
+
+# Notified in user_database with {user_id: version} whenever weight profiles change, or with
+# 'all' if more than NOTIFY_USERS profiles changed at once (a notification holds < 8000 bytes)
+WEIGHT_CHANNEL = 'weight_profiles'
+NOTIFY_USERS = 400
+
+# Announces the rows of the CTE bumped(user_id, version), %s is WEIGHT_CHANNEL
+notify_bumped_query = f"""
+    (SELECT pg_notify(%s, CASE WHEN count(*) <= {NOTIFY_USERS} THEN json_object_agg(user_id, version)::text
+                               ELSE 'all' END)
+     FROM bumped HAVING count(*) > 0)
+"""
+
+RECONNECT_SECONDS = 5
+
+
+def owasp_order(owasp_cat):
+    """Sorts "API2 - ..." before "API10 - ...", categories without a number last."""
+    match = re.search(r'\d+', owasp_cat)
+    return int(match.group()) if match else float('inf')
+
+
+def provision_weight_profiles(cursor, user_ids=None):
+    """
+    Gives the users (all if user_ids is None) the weight from default_weights for every category
+    they have no weight for yet, thousands of users in one statement. Profiles that got weights
+    are bumped to a new version. Returns {user_id: version} of those users.
+    """
+    cursor.execute(f"""
+        WITH provisioned AS (
+            INSERT INTO riskometer_weights (user_id, owasp_cat, weight)
+            SELECT u.user_id, d.owasp_cat, d.weight
+            FROM users u CROSS JOIN default_weights d
+            WHERE %s::integer[] IS NULL OR u.user_id = ANY(%s::integer[])
+            ON CONFLICT (user_id, owasp_cat) DO NOTHING
+            RETURNING user_id
+        ), bumped AS (
+            INSERT INTO weight_profile_versions AS v (user_id)
+            SELECT DISTINCT user_id FROM provisioned
+            ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, updated_at = now()
+            RETURNING user_id, version
+        )
+        SELECT user_id, version, {notify_bumped_query} FROM bumped;
+    """, (user_ids, user_ids, WEIGHT_CHANNEL))
+    return {user_id: version for user_id, version, _ in cursor.fetchall()}
+
+
+def save_weight_profiles(cursor, weights, expected_versions):
+    """
+    Upserts weights [(user_id, owasp_cat, weight), ...] in one statement. The version row of
+    every user is locked and bumped first, a user whose version is not the one the client read
+    (expected_versions, users without an entry are saved regardless) keeps its weights. The
+    new versions are announced on WEIGHT_CHANNEL with the commit. Returns one
+    (user_id, known, saved_version, current_version) row per user, the caller rolls back
+    unless all of them were saved. current_version of a conflict is the version that won.
+    """
+    user_ids, owasp_cats, values = (list(column) for column in zip(*weights))
+    expected_users = list(expected_versions)
+    cursor.execute(f"""
+        WITH input AS (
+            SELECT * FROM unnest(%s::integer[], %s::varchar[], %s::integer[]) AS i (user_id, owasp_cat, weight)
+        ), expected AS (
+            SELECT * FROM unnest(%s::integer[], %s::bigint[]) AS e (user_id, version)
+        ), bumped AS (
+            -- Waits for a concurrent save of the same profile and compares with the version it wrote
+            INSERT INTO weight_profile_versions AS v (user_id)
+            SELECT user_id FROM users WHERE user_id IN (SELECT user_id FROM input)
+            ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, updated_at = now()
+            WHERE NOT EXISTS (SELECT 1 FROM expected e WHERE e.user_id = v.user_id AND e.version <> v.version)
+            RETURNING user_id, version
+        ), upserted AS (
+            INSERT INTO riskometer_weights (user_id, owasp_cat, weight)
+            SELECT i.user_id, i.owasp_cat, i.weight FROM input i JOIN bumped s ON s.user_id = i.user_id
+            ON CONFLICT (user_id, owasp_cat) DO UPDATE SET weight = EXCLUDED.weight
+        )
+        SELECT p.user_id, u.user_id IS NOT NULL, s.version, COALESCE(v.version, 0), {notify_bumped_query}
+        FROM (SELECT DISTINCT user_id FROM input) p
+        LEFT JOIN users u ON u.user_id = p.user_id
+        LEFT JOIN bumped s ON s.user_id = p.user_id
+        LEFT JOIN weight_profile_versions v ON v.user_id = p.user_id
+        ORDER BY p.user_id;
+    """, (user_ids, owasp_cats, values, expected_users, [expected_versions[user_id] for user_id in expected_users],
+          WEIGHT_CHANNEL))
+    rows = [row[:4] for row in cursor.fetchall()]
+
+    # The statement read the versions with its starting snapshot, before the concurrent save it
+    # waited for committed. A new statement sees that save, so the client retries with its version.
+    conflicts = [user_id for user_id, known, saved, _ in rows if known and saved is None]
+    if conflicts:
+        cursor.execute("SELECT user_id, version FROM weight_profile_versions WHERE user_id = ANY(%s);", (conflicts,))
+        current = dict(cursor.fetchall())
+        rows = [(user_id, known, saved, current.get(user_id, version)) for user_id, known, saved, version in rows]
+    return rows
+
+
+class WeightProfileCache:
+    """
+    The weight profiles of user_database kept per API process, keyed by user_id with the
+    profile version they were read at. A listener on WEIGHT_CHANNEL drops the profiles other
+    processes changed, so every worker sees a saved profile as soon as the notification
+    arrives. While the listener is not connected nothing is cached and every call reads
+    user_database, after a reconnect the cache starts empty.
+    """
+
+    def __init__(self, db_params):
+        self.db_params = db_params
+        self.profiles = {}
+        # Highest version announced per user, a slower read of an older version is not cached
+        self.announced = {}
+        # Counts the clears, a read that started before one is not cached
+        self.generation = 0
+        self.complete = False
+        self.listening = threading.Event()
+        self.started = False
+        self.lock = threading.Lock()
+
+    def load(self, user_ids=None):
+        """{user_id: (version, [(owasp_cat, weight), ...])} read from user_database, sorted by category."""
+        connection = psycopg2.connect(**self.db_params)
+        try:
+            cursor = connection.cursor()
+            query = """
+                SELECT u.user_id, COALESCE(v.version, 0), w.owasp_cat, w.weight
+                FROM users u
+                LEFT JOIN weight_profile_versions v ON v.user_id = u.user_id
+                LEFT JOIN riskometer_weights w ON w.user_id = u.user_id
+            """
+            if user_ids is not None:
+                query += " WHERE u.user_id = ANY(%s)"
+                cursor.execute(query, (list(user_ids),))
+            else:
+                cursor.execute(query)
+            profiles = {}
+            for user_id, version, owasp_cat, weight in cursor.fetchall():
+                _, weights = profiles.setdefault(user_id, (version, []))
+                if owasp_cat is not None:
+                    weights.append((owasp_cat, weight))
+            cursor.close()
+        finally:
+            connection.close()
+        for _, weights in profiles.values():
+            weights.sort(key=lambda entry: owasp_order(entry[0]))
+        return profiles
+
+    def get(self, user_ids=None):
+        """The profiles of user_ids (all users if None), unknown users are left out."""
+        self.start()
+        if not self.listening.is_set():
+            return self.load(user_ids)
+
+        with self.lock:
+            generation = self.generation
+            if user_ids is None:
+                cached = dict(self.profiles) if self.complete else None
+            else:
+                cached = {user_id: self.profiles[user_id] for user_id in user_ids if user_id in self.profiles}
+        if cached is None:
+            loaded = self.load()
+            self.store(loaded, generation, complete=True)
+            return loaded
+
+        missing = [user_id for user_id in user_ids or [] if user_id not in cached]
+        if missing:
+            loaded = self.load(missing)
+            self.store(loaded, generation)
+            cached.update(loaded)
+        return cached
+
+    def store(self, profiles, generation, complete=False):
+        with self.lock:
+            if not self.listening.is_set() or generation != self.generation:
+                return
+            stale = False
+            for user_id, profile in profiles.items():
+                if profile[0] < self.announced.get(user_id, 0):
+                    stale = True
+                    continue
+                cached = self.profiles.get(user_id)
+                if cached is None or cached[0] <= profile[0]:
+                    self.profiles[user_id] = profile
+            if complete and not stale:
+                self.complete = True
+
+    def invalidate(self, versions):
+        """Drops the profiles older than the announced {user_id: version}."""
+        with self.lock:
+            for user_id, version in versions.items():
+                self.announced[user_id] = max(self.announced.get(user_id, 0), version)
+                cached = self.profiles.get(user_id)
+                if cached is None:
+                    # A user that was not cached yet, e.g. a new one, is missing from the full list
+                    self.complete = False
+                elif cached[0] < version:
+                    del self.profiles[user_id]
+                    self.complete = False
+
+    def clear(self):
+        with self.lock:
+            self.profiles = {}
+            self.announced = {}
+            self.generation += 1
+            self.complete = False
+
+    def listen(self, connection):
+        cursor = connection.cursor()
+        cursor.execute(f"LISTEN {WEIGHT_CHANNEL};")
+        cursor.close()
+        # Profiles changed while no listener was connected are unknown, start over
+        self.clear()
+        self.listening.set()
+        print(f"Listening for weight profile changes on {WEIGHT_CHANNEL}")
+        while True:
+            if select.select([connection], [], [], 60) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                if notify.payload == 'all':
+                    self.clear()
+                    continue
+                try:
+                    versions = {int(user_id): version for user_id, version in json.loads(notify.payload).items()}
+                except (ValueError, AttributeError):
+                    print(f"Ignoring invalid notification: {notify.payload}")
+                    continue
+                self.invalidate(versions)
+
+    def run(self):
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(**self.db_params)
+                connection.autocommit = True
+                self.listen(connection)
+            except Exception as e:
+                print(f"Error in the weight profile listener: {e}")
+            finally:
+                self.listening.clear()
+                self.clear()
+                if connection is not None:
+                    connection.close()
+            time.sleep(RECONNECT_SECONDS)
+
+    def start(self):
+        """Starts the listener thread on the first call."""
+        with self.lock:
+            if not self.started:
+                self.started = True
+                threading.Thread(target=self.run, name='weight-profile-listener', daemon=True).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gives users the default weights for the categories they have none for.")
+    parser.add_argument('--user-id', type=int, action='append', help="Only provision this user (can be repeated).")
+    args = parser.parse_args()
+
+    # Imported here, the bootstrap provisions the weights with this module and does not need numpy and pandas
+    from Risk_Engine import refresh_scan_scores
+
+    connection_1 = psycopg2.connect(**db_params_1)
+    connection_2 = psycopg2.connect(**db_params_2)
+    cursor = connection_2.cursor()
+    provisioned = provision_weight_profiles(cursor, args.user_id)
+    connection_2.commit()
+    print(f"Provisioned the weight profiles of {len(provisioned)} users")
+
+    # The new profiles are scored in one pass over the scan history
+    if provisioned:
+        stored = refresh_scan_scores(connection_1, connection_2, user_ids=list(provisioned))
+        print(f"Stored {stored} risk scores")
+    cursor.close()
+    connection_1.close()
+    connection_2.close()
@@ -0,0 +1,269 @@
+import json
+import os
+import queue
+import secrets
+import subprocess
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from Scan_Executor import CANCELLED, FAILED, SUCCEEDED, container_limits, kill_container, run_docker_scan
+
+# Started once per pool slot, the daemon keeps running between scans. {name}, {port}, {api_key},
+# {output} and {limits} (CPU / memory caps) are filled in per daemon. ZAP_DAEMON_COMMAND replaces it,
+# e.g. with the stub daemon. The template is split at whitespace before the values are filled in.
+DEFAULT_DAEMON_COMMAND = (
+    'docker run --rm --name {name} {limits} -p {port}:8080 -v {output}:/zap/wrk owasp/zap2docker-stable '
+    'zap.sh -daemon -host 0.0.0.0 -port 8080 -config api.key={api_key} '
+    '-config api.addrs.addr.name=.* -config api.addrs.addr.regex=true'
+)
+
+POLL_SECONDS = 1
+
+
+class ZapApiError(Exception):
+    pass
+
+
+class ScanCancelled(Exception):
+    pass
+
+
+def daemon_args(command, **values):
+    """
+    The arguments of a daemon from the command template. Every value is filled into its own
+    argument, so an output path with backslashes or spaces (C:\\ZAP\\zap-wrk) stays as it is.
+    {limits} becomes the CPU and memory arguments.
+    """
+    args = []
+    for part in command.split():
+        if part == '{limits}':
+            args += container_limits()
+        else:
+            args.append(part.format(**values))
+    return args
+
+
+class ZapDaemon:
+    """One long-running ZAP process that is driven through its JSON API."""
+
+    def __init__(self, name, slot, port, command, output_directory):
+        self.name = name
+        self.slot = slot
+        self.port = port
+        self.api_key = secrets.token_hex(16)
+        self.args = daemon_args(command, name=name, port=port, api_key=self.api_key, output=output_directory)
+        self.base_url = f"http://localhost:{port}"
+        self.process = None
+        self.scans = 0
+
+    def start(self):
+        print(f"Starting ZAP daemon {self.name} on port {self.port}")
+        self.process = subprocess.Popen(self.args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def request(self, path, params=None, timeout=30):
+        query = urllib.parse.urlencode({**(params or {}), 'apikey': self.api_key})
+        with urllib.request.urlopen(f"{self.base_url}{path}?{query}", timeout=timeout) as response:
+            return response.read()
+
+    def api(self, component, kind, name, **params):
+        try:
+            result = json.loads(self.request(f"/JSON/{component}/{kind}/{name}/", params))
+        except Exception as e:
+            raise ZapApiError(f"{component}/{kind}/{name} failed: {e}")
+        if 'code' in result and 'message' in result:
+            raise ZapApiError(f"{component}/{kind}/{name} failed: {result['message']}")
+        return result
+
+    def is_alive(self):
+        if self.process is None or self.process.poll() is not None:
+            return False
+        try:
+            self.api('core', 'view', 'version')
+            return True
+        except ZapApiError:
+            return False
+
+    def wait_until_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                return False
+            if self.is_alive():
+                return True
+            time.sleep(POLL_SECONDS)
+        return False
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.api('core', 'action', 'shutdown')
+        except ZapApiError:
+            pass
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            # Killing the docker client does not stop the container, which would keep the port of the slot
+            if os.path.splitext(os.path.basename(self.args[0]))[0] == 'docker':
+                kill_container(self.name)
+            self.process.kill()
+            self.process.wait()
+        print(f"Stopped ZAP daemon {self.name} after {self.scans} scans")
+
+    def wait_for(self, job, component, scan_id, deadline):
+        """Polls <component>/view/status until the scan reports 100 percent and publishes the progress."""
+        last = None
+        while True:
+            percent = int(self.api(component, 'view', 'status', scanId=scan_id)['status'])
+            if percent != last:
+                progress = {"alerts": int(self.api('core', 'view', 'numberOfAlerts')['numberOfAlerts'])}
+                if component == 'spider':
+                    progress["urls"] = len(self.api('spider', 'view', 'results', scanId=scan_id)['results'])
+                job.publish('progress', phase=component, percent=percent, **progress)
+                last = percent
+            if percent >= 100:
+                return
+            self.check_running(job, deadline)
+            time.sleep(POLL_SECONDS)
+
+    def check_running(self, job, deadline):
+        if job.cancelled.is_set():
+            raise ScanCancelled
+        if time.monotonic() > deadline:
+            raise TimeoutError
+
+    def wait_for_passive_scan(self, job, deadline):
+        while int(self.api('pscan', 'view', 'recordsToScan')['recordsToScan']) > 0:
+            self.check_running(job, deadline)
+            time.sleep(POLL_SECONDS)
+
+    def scan(self, job, report_path):
+        """Runs the job in a fresh session and writes the JSON report like the zap-*.py scripts (-J) do."""
+        deadline = time.monotonic() + (job.timeout or 24 * 3600)
+        self.api('core', 'action', 'newSession', overwrite='true')
+
+        if job.kind == 'passive':
+            self.api('core', 'action', 'accessUrl', url=job.scan_input)
+            scan_id = self.api('spider', 'action', 'scan', url=job.scan_input)['scan']
+            self.wait_for(job, 'spider', scan_id, deadline)
+        else:
+            self.api('openapi', 'action', 'importFile', file=job.scan_input)
+            for site in self.api('core', 'view', 'sites')['sites']:
+                scan_id = self.api('ascan', 'action', 'scan', url=site, recurse='true')['scan']
+                self.wait_for(job, 'ascan', scan_id, deadline)
+        self.wait_for_passive_scan(job, deadline)
+
+        try:
+            report = self.request('/OTHER/core/other/jsonreport/')
+        except Exception as e:
+            raise ZapApiError(f"core/other/jsonreport failed: {e}")
+        with open(report_path, 'wb') as file:
+            file.write(report)
+
+
+class ZapDaemonPool:
+    """
+    Keeps size ZAP daemons started so a scan does not wait for a container, the JVM and the
+    add-ons to start. A daemon is replaced after recycle_after scans or when it stops answering.
+    Scans that find no idle daemon within acquire_timeout run as one-shot container instead.
+    """
+
+    def __init__(self, size, output_directory, recycle_after=20, base_port=8090,
+                 command=DEFAULT_DAEMON_COMMAND, startup_timeout=120, acquire_timeout=10):
+        self.size = size
+        self.output_directory = output_directory
+        self.recycle_after = recycle_after
+        self.base_port = base_port
+        self.command = command
+        self.startup_timeout = startup_timeout
+        self.acquire_timeout = acquire_timeout
+        self.idle = queue.Queue()
+        self.generation = 0
+        self.started = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Starts the daemons on the first call, returns whether this call started them."""
+        with self.lock:
+            if self.started:
+                return False
+            self.started = True
+        for slot in range(self.size):
+            self.replace(slot)
+        return True
+
+    def replace(self, slot, old=None):
+        """Starts the daemon for slot in the background, after stopping the one it replaces."""
+        def start_daemon():
+            if old is not None:
+                old.stop()
+            with self.lock:
+                self.generation += 1
+                name = f"zap-pool-{slot}-{self.generation}"
+            daemon = ZapDaemon(name, slot, self.base_port + slot, self.command, self.output_directory)
+            daemon.start()
+            if daemon.wait_until_ready(self.startup_timeout):
+                print(f"ZAP daemon {daemon.name} is ready")
+                self.idle.put(daemon)
+            else:
+                print(f"ZAP daemon {daemon.name} did not start, retrying")
+                daemon.stop()
+                time.sleep(POLL_SECONDS * 10)
+                self.replace(slot)
+
+        threading.Thread(target=start_daemon, name=f"zap-pool-{slot}", daemon=True).start()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            try:
+                daemon = self.idle.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                return None
+            if daemon.is_alive():
+                return daemon
+            print(f"ZAP daemon {daemon.name} stopped answering")
+            self.replace(daemon.slot, daemon)
+
+    def release(self, daemon, healthy=True):
+        daemon.scans += 1
+        if healthy and daemon.scans < self.recycle_after:
+            self.idle.put(daemon)
+        else:
+            self.replace(daemon.slot, daemon)
+
+    def run(self, job):
+        """Runner for ScanExecutor: scans with a warm daemon and falls back to a one-shot container."""
+        daemon = self.acquire()
+        if daemon is None:
+            print("No idle ZAP daemon, running a one-shot container")
+            return run_docker_scan(job)
+
+        print(f"Scanning {job.target} with ZAP daemon {daemon.name}")
+        try:
+            daemon.scan(job, os.path.join(self.output_directory, job.report_file))
+        except TimeoutError:
+            # The daemon is still busy with the scan, it is replaced instead of reused
+            self.release(daemon, healthy=False)
+            print("Scan timed out")
+            return FAILED, {"error": "Scan timed out", "timeout_seconds": job.timeout}
+        except ScanCancelled:
+            self.release(daemon, healthy=False)
+            print("Scan cancelled")
+            return CANCELLED, {"error": "Scan cancelled"}
+        except ZapApiError as e:
+            self.release(daemon, healthy=False)
+            print(f"ZAP daemon {daemon.name} failed, running a one-shot container: {e}")
+            return run_docker_scan(job)
+        self.release(daemon)
+        print("Scan completed successfully")
+        return SUCCEEDED, {"message": "URL successfully scanned"}
+
+    def shutdown(self):
+        while True:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                break
@@ -0,0 +1,71 @@
+import os
+import sys
+import uuid
+
+import psycopg2
+import pytest
+
+# The modules import each other by name, like when they are run from dashboard_backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Initialize_Database import bootstrap_database, seed_dashboard_database, seed_user_database
+
+# The server the test databases are created on, the same variables as the dashboard database
+server_params = {
+    'user': os.getenv('DB1_USER', 'postgres'),
+    'password': os.getenv('DB1_PASSWORD', 'postgres'),
+    'host': os.getenv('DB1_HOST', 'localhost'),
+    'port': os.getenv('DB1_PORT', '5432'),
+}
+
+
+def server_connection():
+    try:
+        connection = psycopg2.connect(database='postgres', **server_params)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No PostgreSQL server: {e}")
+    connection.autocommit = True
+    return connection
+
+
+@pytest.fixture
+def make_database():
+    """Creates new, empty databases and returns their connection parameters, all dropped after the test."""
+    connection = server_connection()
+    cursor = connection.cursor()
+    names = []
+
+    def create():
+        name = f"test_{uuid.uuid4().hex[:12]}"
+        cursor.execute(f"CREATE DATABASE {name};")
+        names.append(name)
+        return {'database': name, **server_params}
+
+    try:
+        yield create
+    finally:
+        for name in names:
+            cursor.execute(f"DROP DATABASE {name} WITH (FORCE);")
+        cursor.close()
+        connection.close()
+
+
+@pytest.fixture
+def empty_database(make_database):
+    return make_database()
+
+
+@pytest.fixture
+def dashboard_database(make_database):
+    """A bootstrapped api_dashboard database."""
+    db_params = make_database()
+    assert bootstrap_database(db_params, seed_dashboard_database)
+    return db_params
+
+
+@pytest.fixture
+def user_database(make_database):
+    """A bootstrapped user_database."""
+    db_params = make_database()
+    assert bootstrap_database(db_params, seed_user_database)
+    return db_params
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import psycopg2
+import pytest
+
+import API
+from Compact_Scan_Data import compact
+from Manage_Partitions import apply_retention
+from test_manage_partitions import insert_scan
+
+
+@pytest.fixture
+def client(dashboard_database, monkeypatch):
+    monkeypatch.setenv('SCAN_SCHEDULER', 'false')
+    monkeypatch.setattr(API, 'db_params_1', dashboard_database)
+    return API.app.test_client()
+
+
+def changes(client, since=None):
+    response = client.get('/changes' if since is None else f'/changes?since={since}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_changes_report_compacted_and_expired_scans(dashboard_database, client):
+    connection = psycopg2.connect(**dashboard_database)
+    cursor = connection.cursor()
+    expired = insert_scan(cursor, datetime(2020, 1, 5))
+    compacted = insert_scan(cursor, datetime.now() - timedelta(days=60))
+    kept = insert_scan(cursor, datetime.now())
+    cursor.execute("INSERT INTO tools (tool_name) VALUES ('ZAP') RETURNING tool_id;")
+    cursor.execute("UPDATE scans SET scan_tool = %s;", (cursor.fetchone()[0],))
+    connection.commit()
+
+    first = changes(client)
+    assert [scan['scan_id'] for scan in first['scans']] == [expired, compacted, kept]
+    assert first['deleted_scans'] == []
+
+    apply_retention(connection, 24, drop=True)
+    assert compact(connection, keep_days=30, batch_size=100, pause=0) == 1
+
+    second = changes(client, first['cursor'])
+    assert second['scans'] == [] and second['vulnerabilities'] == []
+    assert [(scan['scan_id'], scan['reason']) for scan in second['deleted_scans']] == [
+        (expired, 'dropped'), (compacted, 'compacted')]
+    assert second['cursor'] > first['cursor']
+    assert changes(client, second['cursor'])['deleted_scans'] == []
+    cursor.close()
+    connection.close()
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+from Initialize_Database import bootstrap_database, seed_dashboard_database, seed_user_database
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def table_counts(db_params, tables):
+    connection = psycopg2.connect(**db_params)
+    cursor = connection.cursor()
+    counts = {}
+    for table in tables:
+        cursor.execute(f"SELECT COUNT(*) FROM {table};")
+        counts[table] = cursor.fetchone()[0]
+    connection.close()
+    return counts
+
+
+def test_bootstrap_is_idempotent(make_database):
+    dashboard, users = make_database(), make_database()
+    # Concurrent runs wait for each other, a later run adds nothing
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = [executor.submit(bootstrap_database, db_params, seed)
+                   for _ in range(2) for db_params, seed in ((dashboard, seed_dashboard_database),
+                                                             (users, seed_user_database))]
+        assert all(result.result() for result in results)
+    assert bootstrap_database(dashboard, seed_dashboard_database)
+    assert bootstrap_database(users, seed_user_database)
+
+    assert table_counts(dashboard, ['owasp_categories', 'priorities']) == {'owasp_categories': 11, 'priorities': 4}
+    assert table_counts(users, ['users', 'default_weights', 'riskometer_weights', 'weight_profile_versions']) == {
+        'users': 1, 'default_weights': 10, 'riskometer_weights': 10, 'weight_profile_versions': 1}
+
+
+def test_bootstrap_asks_for_the_migration_of_unpartitioned_scans(empty_database, capsys):
+    connection = psycopg2.connect(**empty_database)
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE scans (scan_id SERIAL PRIMARY KEY, scan_date TIMESTAMP, scan_url TEXT);")
+    connection.commit()
+    connection.close()
+
+    assert not bootstrap_database(empty_database, seed_dashboard_database)
+    assert 'Manage_Partitions.py --migrate' in capsys.readouterr().out
+
+
+def test_bootstrap_does_not_load_the_risk_engine():
+    subprocess.run([sys.executable, '-c', "import sys, Initialize_Database; sys.exit('Risk_Engine' in sys.modules)"],
+                   cwd=BACKEND, check=True)
@@ -0,0 +1,43 @@
+import datetime
+import decimal
+import uuid
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+pytest.importorskip('orjson')
+
+from Json_Provider import OrjsonProvider
+
+VALUES = {
+    "scan_date": datetime.datetime(2024, 8, 22, 8, 39, 42),
+    "scan_day": datetime.date(2024, 8, 22),
+    "risk_score": decimal.Decimal('12.50'),
+    "job_id": uuid.UUID('5f0c6a0e-8b0e-4c46-a1c0-d3f1f6f7e2a1'),
+    "scans": [{"scan_id": 2, "vuln_count": 0, "owasp": None, "active_scan": False}, {"scan_id": 1, "weight": 0.25}],
+    # user_ids as keys are sorted as numbers like the default provider does
+    "profiles": {10: "b", 2: "a"},
+}
+
+
+def response_bodies(debug, obj):
+    bodies = []
+    for provider in (DefaultJSONProvider, OrjsonProvider):
+        app = Flask(__name__)
+        app.debug = debug
+        app.json = provider(app)
+        with app.app_context():
+            bodies.append(app.json.response(obj).get_data())
+    return bodies
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_response_matches_the_default_provider(debug):
+    default, fast = response_bodies(debug, VALUES)
+    assert fast == default
+
+
+def test_list_responses_match():
+    default, fast = response_bodies(False, [[1, "API1"], [2, "API2"]])
+    assert fast == default
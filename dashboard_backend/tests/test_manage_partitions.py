@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import psycopg2
+
+from Manage_Partitions import ARCHIVE_SCHEMA, apply_retention, ensure_month_partitions, list_partitions
+
+
+def insert_scan(cursor, scan_date):
+    ensure_month_partitions(cursor, scan_date)
+    cursor.execute("INSERT INTO scans (scan_date, scan_url) VALUES (%s, 'http://example.com') RETURNING scan_id;",
+                   (scan_date,))
+    scan_id = cursor.fetchone()[0]
+    cursor.execute("""
+        INSERT INTO vulnerabilities (vuln_name, vuln_scan, vuln_scan_date) VALUES ('Finding', %s, %s)
+        RETURNING vuln_id;
+    """, (scan_id, scan_date))
+    cursor.execute("INSERT INTO vuln_owasp (vuln_id, owasp_id, vuln_scan_date) VALUES (%s, 1, %s);",
+                   (cursor.fetchone()[0], scan_date))
+    return scan_id
+
+
+def test_archive_retention_detaches_expired_months(dashboard_database):
+    connection = psycopg2.connect(**dashboard_database)
+    cursor = connection.cursor()
+    insert_scan(cursor, datetime(2020, 1, 5))
+    kept = insert_scan(cursor, datetime.now())
+    connection.commit()
+
+    archived = apply_retention(connection, 24)
+
+    assert archived == ['vuln_owasp_y2020m01', 'vulnerabilities_y2020m01', 'scans_y2020m01']
+    cursor.execute("SELECT scan_id FROM scans;")
+    assert cursor.fetchall() == [(kept,)]
+    cursor.execute(f"SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.vuln_owasp_y2020m01;")
+    assert cursor.fetchone()[0] == 1
+    # The archived months only reference each other, nothing points back into the attached tables
+    cursor.execute("""
+        SELECT conrelid::regclass::text FROM pg_constraint
+        WHERE contype = 'f' AND connamespace = %s::regnamespace AND confrelid::regclass::text IN
+              ('scans', 'vulnerabilities', 'vuln_owasp');
+    """, (ARCHIVE_SCHEMA,))
+    assert cursor.fetchall() == []
+
+    # An archived month can be attached again, the foreign keys come back with it
+    for table in ['scans', 'vulnerabilities', 'vuln_owasp']:
+        cursor.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table}_y2020m01 SET SCHEMA public;")
+        cursor.execute(f"""
+            ALTER TABLE {table} ATTACH PARTITION {table}_y2020m01
+            FOR VALUES FROM ('2020-01-01') TO ('2020-02-01');
+        """)
+    connection.commit()
+    assert 'scans_y2020m01' in [relname for relname, _ in list_partitions(cursor, 'scans')]
+    cursor.execute("SELECT COUNT(*) FROM vuln_owasp;")
+    assert cursor.fetchone()[0] == 2
+    cursor.close()
+    connection.close()
+
+
+def test_drop_retention(dashboard_database):
+    connection = psycopg2.connect(**dashboard_database)
+    cursor = connection.cursor()
+    insert_scan(cursor, datetime(2020, 1, 5))
+    connection.commit()
+
+    assert apply_retention(connection, 24, drop=True) == ['vuln_owasp_y2020m01', 'vulnerabilities_y2020m01',
+                                                          'scans_y2020m01']
+    cursor.execute("SELECT to_regclass('scans_y2020m01'), to_regclass(%s);", (f"{ARCHIVE_SCHEMA}.scans_y2020m01",))
+    assert cursor.fetchone() == (None, None)
+    cursor.close()
+    connection.close()
@@ -0,0 +1,33 @@
+from Response_Encoding import to_columnar
+
+
+def test_dicts_become_columns():
+    rows = [{"scan_id": 1, "scan_url": "http://a.com", "prio_name": "High"},
+            {"scan_id": 2, "scan_url": "http://b.com", "prio_name": "High"},
+            {"scan_id": 3, "scan_url": "http://c.com", "prio_name": "Low"},
+            {"scan_id": 4, "scan_url": "http://d.com", "prio_name": "High"}]
+
+    assert to_columnar(rows) == {
+        "rows": 4,
+        "columns": ["scan_id", "scan_url", "prio_name"],
+        # Only the string columns with repeated values are dictionary encoded
+        "data": {"scan_id": [1, 2, 3, 4], "scan_url": ["http://a.com", "http://b.com", "http://c.com", "http://d.com"],
+                 "prio_name": [0, 0, 1, 0]},
+        "dictionaries": {"prio_name": ["High", "Low"]},
+    }
+
+
+def test_tuples_with_columns():
+    rows = [(1, "x", None), (2, "x", True)]
+
+    assert to_columnar(rows, ["id", "name", "flag"]) == {
+        "rows": 2,
+        "columns": ["id", "name", "flag"],
+        "data": {"id": [1, 2], "name": [0, 0], "flag": [None, True]},
+        "dictionaries": {"name": ["x"]},
+    }
+
+
+def test_empty_rows():
+    assert to_columnar([], ["id"]) == {"rows": 0, "columns": ["id"], "data": {"id": []}, "dictionaries": {}}
+    assert to_columnar([]) == {"rows": 0, "columns": [], "data": {}, "dictionaries": {}}
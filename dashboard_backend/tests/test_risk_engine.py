@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from Risk_Engine import MAX_WEIGHT, RiskEngine
+
+COLUMNS = ['scan_id', 'scan_url', 'scan_date', 'vuln_id', 'vuln_priority', 'owasp_id']
+
+
+def matrix_frame(rows):
+    # Like load_vulnerability_matrix, a scan without findings has a single row with NULLs
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_clean_latest_scan_ranks_with_zero():
+    engine = RiskEngine()
+    engine.load(matrix_frame([
+        (1, 'http://a.example', datetime(2024, 8, 1), 10, 3, 1),
+        (2, 'http://a.example', datetime(2024, 8, 2), None, None, None),
+        (3, 'http://b.example', datetime(2024, 8, 1), 11, 1, 1),
+    ]))
+    weights = np.full((1, 11), MAX_WEIGHT, dtype=np.float64)
+
+    ranking = engine.ranking([1], weights)
+
+    assert ranking['scan_id'].tolist() == [3, 2]
+    assert ranking['vuln_count'].tolist() == [1, 0]
+    assert ranking['risk_score'].tolist()[1] == 0
+
+
+def test_scores_match_with_and_without_clean_scans():
+    findings = [
+        (1, 'http://a.example', datetime(2024, 8, 1), 10, 3, 1),
+        (1, 'http://a.example', datetime(2024, 8, 1), 10, 3, 2),
+        (1, 'http://a.example', datetime(2024, 8, 1), 12, 0, 8),
+        (4, 'http://b.example', datetime(2024, 8, 1), 13, 2, 8),
+    ]
+    weights = np.random.default_rng(1).integers(0, MAX_WEIGHT + 1, (3, 11)).astype(np.float64)
+    engine = RiskEngine()
+    engine.load(matrix_frame(findings))
+    expected = engine.score(weights)
+
+    engine.load(matrix_frame(findings + [(2, 'http://a.example', datetime(2024, 8, 2), None, None, None),
+                                         (5, 'http://c.example', datetime(2024, 8, 2), None, None, None)]))
+    scores = engine.score(weights)
+
+    assert engine.matrix[0]['scan_id'].tolist() == [1, 2, 4, 5]
+    assert np.allclose(scores[:, [0, 2]], expected)
+    assert (scores[:, [1, 3]] == 0).all()
+
+
+def test_only_clean_scans():
+    engine = RiskEngine()
+    engine.load(matrix_frame([(1, 'http://a.example', datetime(2024, 8, 1), None, None, None)]))
+    assert engine.score(np.ones((2, 11))).tolist() == [[0.0], [0.0]]
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import psycopg2
+
+from Manage_Partitions import ensure_month_partitions
+from Risk_Engine import refresh_scan_scores
+
+
+def test_scans_without_findings_are_stored_with_zero(dashboard_database, user_database):
+    connection_1 = psycopg2.connect(**dashboard_database)
+    connection_2 = psycopg2.connect(**user_database)
+    cursor = connection_1.cursor()
+    risky_date = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    clean_date = risky_date + timedelta(minutes=30)
+    ensure_month_partitions(cursor, risky_date)
+    ensure_month_partitions(cursor, clean_date)
+    scan_ids = []
+    for scan_date in (risky_date, clean_date):
+        cursor.execute("INSERT INTO scans (scan_date, scan_url) VALUES (%s, 'http://example.com') RETURNING scan_id;",
+                       (scan_date,))
+        scan_ids.append(cursor.fetchone()[0])
+    cursor.execute("""
+        INSERT INTO vulnerabilities (vuln_name, vuln_scan, vuln_scan_date, vuln_priority) VALUES ('Finding', %s, %s, 3)
+        RETURNING vuln_id;
+    """, (scan_ids[0], risky_date))
+    cursor.execute("INSERT INTO vuln_owasp (vuln_id, owasp_id, vuln_scan_date) VALUES (%s, 1, %s);",
+                   (cursor.fetchone()[0], risky_date))
+    connection_1.commit()
+
+    # Only the new scans, like the ingest scores them
+    assert refresh_scan_scores(connection_1, connection_2, scan_ids=scan_ids) == 2
+
+    cursor.execute("SELECT scan_id, vuln_count, risk_score FROM scan_risk_scores WHERE user_id = 1 ORDER BY scan_date;")
+    rows = cursor.fetchall()
+    assert [row[:2] for row in rows] == [(scan_ids[0], 1), (scan_ids[1], 0)]
+    assert rows[0][2] > 0 and rows[1][2] == 0
+    connection_1.close()
+    connection_2.close()
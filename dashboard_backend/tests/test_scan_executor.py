@@ -0,0 +1,37 @@
+import sys
+
+from Scan_Executor import FAILED, SUCCEEDED, ScanJob, docker_scan_command, run_docker_scan
+
+
+def test_docker_scan_command_keeps_every_value_one_argument():
+    target = 'http://example.com/?a=1&calc.exe|whoami'
+    command = docker_scan_command('passive', r'C:\ZAP\zap-wrk', target, 'api-passive-scan-report_x.json')
+
+    assert command[:2] == ['docker', 'run']
+    assert command[command.index('-v') + 1] == r'C:\ZAP\zap-wrk:/zap/wrk'
+    assert command[command.index('--name') + 1] == 'api-passive-scan-report_x'
+    assert command[command.index('zap-baseline.py'):] == [
+        'zap-baseline.py', '-g', 'api-passive-scan.conf', '-t', target, '-J', 'api-passive-scan-report_x.json']
+
+
+def test_active_scan_command():
+    command = docker_scan_command('active', '/srv/zap', 'spec file.yaml', 'report.json')
+    assert command[command.index('zap-api-scan.py'):] == [
+        'zap-api-scan.py', '-t', '/zap/wrk/openapi/spec file.yaml', '-f', 'openapi', '-J', 'report.json']
+
+
+def test_run_docker_scan_passes_arguments_without_a_shell(capsys):
+    # The "container" echoes its arguments, a shell would have run the part after & or ;
+    script = 'import sys; print("Total of 3 URLs"); print(sys.argv[1:])'
+    job = ScanJob('passive', 'http://example.com', [sys.executable, '-c', script, 'a&b', 'c;d', "'e'"], 'report.json')
+    events = []
+    job.publish = lambda event_type, **data: events.append(event_type)
+
+    assert run_docker_scan(job) == (SUCCEEDED, {"message": "URL successfully scanned"})
+    assert 'urls' in events
+    assert "STDOUT: ['a&b', 'c;d', \"'e'\"]" in capsys.readouterr().out
+
+
+def test_run_docker_scan_failure():
+    job = ScanJob('passive', 'http://example.com', [sys.executable, '-c', 'import sys; sys.exit(3)'], 'report.json')
+    assert run_docker_scan(job)[0] == FAILED
@@ -0,0 +1,97 @@
+import threading
+from datetime import datetime
+
+import psycopg2
+import pytest
+
+from Scan_Scheduler import ScanScheduler, next_cron_time, parse_cron
+
+
+class Job:
+    def __init__(self, url):
+        self.job_id = f'job-{url}'
+        self.done = threading.Event()
+
+
+def test_parse_cron():
+    minutes, hours, days, months, weekdays, day_or = parse_cron('*/15 2-4 1,15 * 7')
+    assert minutes == {0, 15, 30, 45}
+    assert hours == {2, 3, 4}
+    assert days == {1, 15} and months == set(range(1, 13))
+    # Sunday in cron is 6 in Python
+    assert weekdays == {6}
+    assert day_or
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '5-1 * * * *', '*/0 * * * *', 'a * * * *'])
+def test_parse_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        parse_cron(expression)
+
+
+@pytest.mark.parametrize('expression, after, expected', [
+    ('30 2 * * *', datetime(2024, 3, 10, 2, 30, 15), datetime(2024, 3, 11, 2, 30)),
+    ('*/20 * * * *', datetime(2024, 3, 10, 23, 55), datetime(2024, 3, 11, 0, 0)),
+    ('0 0 29 2 *', datetime(2024, 3, 1), datetime(2028, 2, 29, 0, 0)),
+    # 2024-03-15 is a Friday, day of month or day of week matches
+    ('0 12 15 * 1', datetime(2024, 3, 12), datetime(2024, 3, 15, 12, 0)),
+    ('0 12 15 * 1', datetime(2024, 3, 15, 13), datetime(2024, 3, 18, 12, 0)),
+    ('0 0 1 */6 *', datetime(2024, 1, 1), datetime(2024, 7, 1, 0, 0)),
+])
+def test_next_cron_time(expression, after, expected):
+    assert next_cron_time(expression, after) == expected
+
+
+def add_schedules(connection, *urls):
+    cursor = connection.cursor()
+    for url in urls:
+        cursor.execute("INSERT INTO scan_schedules (scan_url, cron, next_run_at) VALUES (%s, '0 3 * * *', now() - interval '1 minute');",
+                       (url,))
+    connection.commit()
+    cursor.close()
+
+
+def due_urls(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT scan_url FROM scan_schedules WHERE next_run_at <= now() ORDER BY scan_url;")
+    urls = [url for url, in cursor.fetchall()]
+    connection.rollback()
+    cursor.close()
+    return urls
+
+
+def test_only_one_process_schedules(dashboard_database):
+    connections = [psycopg2.connect(**dashboard_database) for _ in range(2)]
+    add_schedules(connections[0], 'http://a.example.com', 'http://b.example.com', 'http://c.example.com')
+    submitted = []
+    schedulers = [ScanScheduler(dashboard_database, lambda url: submitted.append(url) or Job(url), max_concurrent=2)
+                  for _ in range(2)]
+
+    assert schedulers[0].tick(connections[0]) == 2
+    # The second process does not add its own max_concurrent scans
+    assert schedulers[1].tick(connections[1]) == 0
+    assert len(submitted) == 2
+
+    # It takes over when the connection of the first one is gone
+    connections[0].close()
+    assert schedulers[1].tick(connections[1]) == 1
+    assert sorted(submitted) == ['http://a.example.com', 'http://b.example.com', 'http://c.example.com']
+    connections[1].close()
+
+
+def test_failing_schedule_does_not_undo_the_others(dashboard_database):
+    connection = psycopg2.connect(**dashboard_database)
+    add_schedules(connection, 'http://a.example.com', 'http://b.example.com', 'http://c.example.com')
+
+    def submit(url):
+        if url == 'http://b.example.com':
+            raise RuntimeError("Executor is shutting down")
+        return Job(url)
+
+    scheduler = ScanScheduler(dashboard_database, submit, max_concurrent=4)
+    assert scheduler.tick(connection) == 2
+    assert due_urls(connection) == ['http://b.example.com']
+    cursor = connection.cursor()
+    cursor.execute("SELECT min(next_run_at) FROM scan_schedules WHERE last_job_id IS NOT NULL;")
+    assert cursor.fetchone()[0] > datetime.now()
+    connection.close()
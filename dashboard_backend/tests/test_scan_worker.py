@@ -0,0 +1,139 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import psycopg2
+
+import Scan_Worker
+from Scan_Executor import FAILED, SUCCEEDED, ScanJob
+from Scan_Worker import claim_scan, enqueue_scan, extend_leases
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A worker process with a stub runner instead of docker. The runner logs every run with the
+# number of scans the worker was running at that moment. Targets starting with fail fail.
+WORKER_SCRIPT = """
+import json, sys, threading, time
+import Scan_Worker
+from Scan_Executor import FAILED, SUCCEEDED
+
+db_params, worker_id, output, log_path = json.loads(sys.argv[1])
+Scan_Worker.db_params = db_params
+Scan_Worker.RETRY_DELAY_SECONDS = 0
+lock = threading.Lock()
+running = 0
+
+class StubRunner:
+    def run(self, job):
+        global running
+        with lock:
+            running += 1
+            with open(log_path, 'a') as log:
+                log.write(json.dumps([job.job_id, worker_id, running]) + '\\n')
+        time.sleep(0.2)
+        with lock:
+            running -= 1
+        if job.target.startswith('fail'):
+            return FAILED, {"error": "Scan failed"}
+        return SUCCEEDED, {"message": "URL successfully scanned"}
+
+Scan_Worker.ScanWorker(worker_id, output, concurrency=2, poll_seconds=0.05, zap_pool=StubRunner()).run()
+"""
+
+
+def queue_job(connection, job_id, target, max_attempts=3):
+    job = ScanJob('passive', target, None, f'{job_id}.json', 60, target)
+    job.job_id = job_id
+    enqueue_scan(connection, job, max_attempts=max_attempts)
+
+
+def queue_rows(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT job_id, status, attempts, worker_id, result FROM scan_queue;")
+    rows = {row[0]: row[1:] for row in cursor.fetchall()}
+    connection.rollback()
+    cursor.close()
+    return rows
+
+
+def test_workers_share_the_queue(dashboard_database, tmp_path):
+    connection = psycopg2.connect(**dashboard_database)
+    cursor = connection.cursor()
+    for i in range(12):
+        queue_job(connection, f'job-{i}', f'http://example.com/{i}')
+    queue_job(connection, 'job-fail', 'fail.example.com', max_attempts=3)
+    # Leases of a worker that is gone: one is claimed again, the other used its last attempt
+    cursor.execute("""
+        INSERT INTO scan_queue (job_id, kind, target, scan_input, report_file, status, attempts, max_attempts, worker_id, lease_until)
+        VALUES ('job-expired', 'passive', 'http://example.com/e', 'http://example.com/e', 'e.json', 'running', 1, 3, 'gone', now() - interval '1 second'),
+               ('job-exhausted', 'passive', 'http://example.com/x', 'http://example.com/x', 'x.json', 'running', 3, 3, 'gone', now() - interval '1 second');
+    """)
+    connection.commit()
+
+    log_path = tmp_path / 'runs.log'
+    workers = [subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT,
+                                 json.dumps([dashboard_database, f'worker-{n}', str(tmp_path), str(log_path)])],
+                                cwd=BACKEND, stdout=subprocess.DEVNULL)
+               for n in range(2)]
+    try:
+        deadline = time.monotonic() + 60
+        while any(status in ('queued', 'running') for status, *_ in queue_rows(connection).values()):
+            assert time.monotonic() < deadline, "The workers did not finish the queue"
+            assert all(worker.poll() is None for worker in workers), "A worker stopped"
+            time.sleep(0.2)
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+
+    rows = queue_rows(connection)
+    runs = [json.loads(line) for line in log_path.read_text().splitlines()]
+    runs_per_job = {}
+    for job_id, worker_id, running in runs:
+        runs_per_job.setdefault(job_id, []).append(worker_id)
+
+    # Every job was claimed exactly once, by both workers together
+    for i in range(12):
+        assert rows[f'job-{i}'][:2] == (SUCCEEDED, 1)
+        assert len(runs_per_job[f'job-{i}']) == 1
+    assert {worker_id for _, worker_id, _ in runs} == {'worker-0', 'worker-1'}
+    # The expired lease was claimed again
+    assert rows['job-expired'][:2] == (SUCCEEDED, 2)
+    assert rows['job-exhausted'][0] == FAILED and 'job-exhausted' not in runs_per_job
+    assert rows['job-exhausted'][3]['details'] == 'Scan worker lost gone'
+    # The failing scan was retried until max_attempts
+    assert rows['job-fail'][:2] == (FAILED, 3)
+    assert len(runs_per_job['job-fail']) == 3
+    # No worker ran more scans than its concurrency
+    assert max(running for _, _, running in runs) <= 2
+    connection.close()
+
+
+def test_extend_leases_only_of_running_scans(dashboard_database):
+    connection = psycopg2.connect(**dashboard_database)
+    cursor = connection.cursor()
+    for job_id in ('job-a', 'job-b'):
+        queue_job(connection, job_id, 'http://example.com')
+        assert claim_scan(connection, 'worker', lease_seconds=1)['job_id'] == job_id
+    cursor.execute("UPDATE scan_queue SET cancel_requested = TRUE;")
+    connection.commit()
+
+    assert extend_leases(connection, 'worker', ['job-a'], lease_seconds=600) == ['job-a']
+    assert extend_leases(connection, 'worker', []) == []
+    cursor.execute("SELECT job_id FROM scan_queue WHERE lease_until > now() + interval '1 minute';")
+    assert cursor.fetchall() == [('job-a',)]
+    connection.close()
+
+
+def test_claim_that_cannot_be_prepared_fails(tmp_path):
+    worker = Scan_Worker.ScanWorker('worker', str(tmp_path / 'missing'))
+    claim = {'job_id': 'job', 'kind': 'active', 'target': 'api.yaml', 'scan_input': 'api.yaml',
+             'scan_file': b'openapi', 'report_file': 'job.json', 'timeout_seconds': 60, 'attempts': 1}
+    (tmp_path / 'missing').write_text('not a directory')
+
+    status, result = worker.run_claim(claim)
+
+    assert status == FAILED and result['error'] == "An unexpected error occurred"
+    assert worker.running == {}
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import psycopg2
+
+import Transfer_Data
+from Initialize_Database import bootstrap_database, seed_dashboard_database, seed_user_database
+from Manage_Partitions import ensure_month_partitions
+
+COUNTED_TABLES = {
+    'api_dashboard': ['scans', 'vulnerabilities', 'scan_risk_scores', 'scan_schedules'],
+    'user_database': ['users', 'riskometer_weights', 'default_weights', 'weight_profile_versions'],
+}
+
+
+def table_counts(db_params, tables):
+    connection = psycopg2.connect(**db_params)
+    cursor = connection.cursor()
+    counts = {}
+    for table in tables:
+        cursor.execute(f"SELECT COUNT(*) FROM {table};")
+        counts[table] = cursor.fetchone()[0]
+    connection.close()
+    return counts
+
+
+def test_export_and_import_keep_scores_schedules_and_default_weights(make_database, monkeypatch, tmp_path):
+    source = {'api_dashboard': make_database(), 'user_database': make_database()}
+    target = {'api_dashboard': make_database(), 'user_database': make_database()}
+    for databases in (source, target):
+        assert bootstrap_database(databases['api_dashboard'], seed_dashboard_database)
+        assert bootstrap_database(databases['user_database'], seed_user_database)
+
+    connection = psycopg2.connect(**source['api_dashboard'])
+    cursor = connection.cursor()
+    scan_date = datetime.now().replace(microsecond=0)
+    ensure_month_partitions(cursor, scan_date)
+    cursor.execute("INSERT INTO scans (scan_date, scan_url) VALUES (%s, 'http://example.com') RETURNING scan_id;",
+                   (scan_date,))
+    scan_id = cursor.fetchone()[0]
+    cursor.execute("INSERT INTO vulnerabilities (vuln_name, vuln_scan, vuln_scan_date) VALUES ('Finding', %s, %s);",
+                   (scan_id, scan_date))
+    cursor.execute("""
+        INSERT INTO scan_risk_scores (user_id, scan_id, scan_url, scan_date, vuln_count, risk_score)
+        VALUES (1, %s, 'http://example.com', %s, 1, 100);
+    """, (scan_id, scan_date))
+    cursor.execute("INSERT INTO scan_schedules (scan_url, cron, next_run_at) VALUES ('http://example.com', '0 2 * * *', now());")
+    connection.commit()
+    connection.close()
+
+    connection = psycopg2.connect(**target['user_database'])
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM default_weights;")
+    connection.commit()
+    connection.close()
+
+    directory = str(tmp_path)
+    for database in Transfer_Data.DATABASES:
+        monkeypatch.setitem(Transfer_Data.DATABASES, database, source[database])
+        assert Transfer_Data.export_database(database, directory, 2, 1000, 1)['consistent']
+        monkeypatch.setitem(Transfer_Data.DATABASES, database, target[database])
+        assert Transfer_Data.import_database(database, directory, 2)
+
+    for database, tables in COUNTED_TABLES.items():
+        assert table_counts(target[database], tables) == table_counts(source[database], tables)
+    assert table_counts(target['api_dashboard'], ['scan_risk_scores']) == {'scan_risk_scores': 1}
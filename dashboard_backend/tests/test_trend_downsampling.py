@@ -0,0 +1,29 @@
+import pytest
+
+from Trend_Downsampling import lttb_indices
+
+
+@pytest.mark.parametrize('count, max_points', [(5, 10), (5, 5), (5, 2), (0, 10)])
+def test_short_series_are_kept(count, max_points):
+    assert lttb_indices(list(range(count)), [0] * count, max_points) == list(range(count))
+
+
+def test_keeps_first_last_and_max_points():
+    x = list(range(1000))
+    y = [(i * 37) % 101 for i in x]
+
+    indices = lttb_indices(x, y, 50)
+
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert indices == sorted(set(indices))
+
+
+def test_keeps_the_peaks():
+    x = list(range(100))
+    y = [0] * 100
+    y[23], y[71] = 50, -50
+
+    indices = lttb_indices(x, y, 10)
+
+    assert 23 in indices and 71 in indices
@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+from Scan_Executor import SUCCEEDED, ScanJob
+from Zap_Pool import ZapDaemonPool, daemon_args
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Stub_Zap_Daemon.py')
+STUB_COMMAND = f"{sys.executable} {STUB} --port {{port}} --api-key {{api_key}} --scan-seconds 0.2"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def passive_job(url, report_file, docker_command=None):
+    job = ScanJob('passive', url, docker_command, report_file, timeout=30, scan_input=url)
+    job.publish = lambda event_type, **data: None
+    return job
+
+
+def wait_until(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.1)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ZapDaemonPool(size=1, output_directory=str(tmp_path), recycle_after=2, base_port=free_port(),
+                         command=STUB_COMMAND, startup_timeout=20, acquire_timeout=20)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_daemon_args_keep_windows_paths():
+    args = daemon_args('docker run --name {name} {limits} -v {output}:/zap/wrk image', name='zap-pool-0-1',
+                       output=r'C:\ZAP\zap work')
+    assert args[:4] == ['docker', 'run', '--name', 'zap-pool-0-1']
+    assert args[args.index('-v') + 1] == r'C:\ZAP\zap work:/zap/wrk'
+    assert '--cpus' in args and '--memory' in args
+
+
+def test_scan_with_the_stub_daemon(pool, tmp_path):
+    status, result = pool.run(passive_job('http://example.com', 'report.json'))
+
+    assert status == SUCCEEDED
+    with open(tmp_path / 'report.json') as file:
+        report = json.load(file)
+    assert [site['@name'] for site in report['site']] == ['http://example.com']
+
+
+def test_daemon_is_recycled_after_recycle_after_scans(pool):
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    pool.release(first)
+
+    # The second scan reached recycle_after, the daemon is stopped and a new one started on its port
+    wait_until(lambda: first.process.poll() is not None)
+    second = pool.acquire()
+    assert second is not first
+    assert second.port == first.port and second.scans == 0
+    pool.release(second)
+    assert pool.run(passive_job('http://example.com', 'report.json'))[0] == SUCCEEDED
+
+
+def test_falls_back_to_a_one_shot_container_without_an_idle_daemon(tmp_path):
+    pool = ZapDaemonPool(size=0, output_directory=str(tmp_path), command=STUB_COMMAND, acquire_timeout=0.1)
+    pool.start()
+    one_shot = [sys.executable, '-c', 'print("Total of 1 URLs")']
+
+    assert pool.run(passive_job('http://example.com', 'report.json', one_shot)) == (
+        SUCCEEDED, {"message": "URL successfully scanned"})
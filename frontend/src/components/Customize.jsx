@@ -71,11 +71,20 @@ const Customize = () => {
         try {
             const response = await axios.post('http://127.0.0.1:5000/customisation', customisations);
             if (response.data.status === 'success') {
+                // The next save is checked against the versions written by this one
+                setCustomisations(customisations.map(customisation => ({
+                    ...customisation,
+                    version: response.data.versions[customisation.user_id]
+                })));
                 alert('Customisations saved successfully!');
             }
         } catch (error) {
             console.error('Error saving customisations:', error);
-            setErrorMessage('Error saving customisations');
+            if (error.response && error.response.status === 409) {
+                setErrorMessage('The weights were changed in the meantime, reload the page and try again');
+            } else {
+                setErrorMessage('Error saving customisations');
+            }
         }
     };
 
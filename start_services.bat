@@ -37,12 +37,17 @@ docker run --name master-postgres -e POSTGRES_PASSWORD=postgres -p 5432:5432 -d
 
 timeout /t 5 >nul
 
-REM Initialize Database (No output)
+REM Initialize Database, the services are not started if it fails
 echo Initializing Database...
 set PROJECT_DIR=%~dp0
 cd /d "%PROJECT_DIR%dashboard_backend"
 call .venv\Scripts\activate
-python Initialize_Database.py >nul 2>&1
+python Initialize_Database.py
+if %errorlevel% neq 0 (
+    echo Database initialization failed, see the error above.
+    echo A database created before the partitioning has to be migrated once: python Manage_Partitions.py --migrate
+    exit /b 1
+)
 
 REM Start API
 echo Starting API...